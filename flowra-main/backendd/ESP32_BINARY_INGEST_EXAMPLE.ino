@@ -0,0 +1,195 @@
+/*
+ * ESP32 Water Level Sensor - Binary Ingest Example
+ *
+ * Posts readings straight to the Flowra backend (POST /api/ingest/binary)
+ * instead of going through Blynk. Samples are buffered and sent as one
+ * compact frame: 2 bytes per level instead of a JSON object per reading.
+ * The frame layout is documented in backendd/binary_ingest.py.
+ *
+ * Example: 60 samples from "drain-42" = 31 + 60 * 2 = 151 bytes per post
+ */
+
+#include <WiFi.h>
+#include <HTTPClient.h>
+#include <Preferences.h>
+#include <time.h>
+
+// WiFi credentials
+char ssid[] = "YOUR_WIFI_SSID";
+char pass[] = "YOUR_WIFI_PASSWORD";
+
+// Backend
+#define INGEST_URL "http://YOUR_SERVER:5030/api/ingest/binary"
+#define DEVICE_ID "drain-42"    // Readings are stored as sensor DEVICE_ID_V0
+
+// Ultrasonic sensor pins
+#define TRIG_PIN 5
+#define ECHO_PIN 18
+
+// Sensor configuration
+#define TANK_HEIGHT 24.0        // Tank height in cm
+#define SCALE_FACTOR 100        // Levels are sent as int16 hundredths of a cm
+#define SAMPLE_SECONDS 5        // Seconds between samples
+#define SAMPLES_PER_FRAME 60    // Samples buffered per post (5 minutes)
+
+#define MISSING_VALUE -32768    // Sent when a sample could not be taken
+
+int16_t samples[SAMPLES_PER_FRAME];
+int sampleCount = 0;
+uint32_t firstSampleTime = 0;
+uint32_t sequence = 0;
+Preferences preferences;
+
+// ============================================
+// REFERENCE ENCODER
+// ============================================
+
+// CRC-32 (same polynomial as zlib.crc32 on the server)
+uint32_t crc32(const uint8_t *data, size_t length) {
+  uint32_t crc = 0xFFFFFFFF;
+  for (size_t i = 0; i < length; i++) {
+    crc ^= data[i];
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc >> 1) ^ (0xEDB88320 & (0 - (crc & 1)));
+    }
+  }
+  return ~crc;
+}
+
+// Little-endian writers (the ESP32 is little-endian, but be explicit)
+size_t put16(uint8_t *out, uint16_t value) {
+  out[0] = value & 0xFF;
+  out[1] = value >> 8;
+  return 2;
+}
+
+size_t put32(uint8_t *out, uint32_t value) {
+  for (int i = 0; i < 4; i++) {
+    out[i] = (value >> (8 * i)) & 0xFF;
+  }
+  return 4;
+}
+
+// Encode one single-channel frame into out; returns its length
+size_t encodeFrame(uint8_t *out, const char *deviceId, uint32_t seq, uint32_t timestamp,
+                   uint16_t interval, uint16_t scale, const int16_t *levels, uint16_t count) {
+  size_t idLength = strlen(deviceId);
+  size_t n = 0;
+
+  out[n++] = 'F';
+  out[n++] = 'L';
+  out[n++] = 1;                   // Format version
+  out[n++] = 1;                   // Channels per sample
+  out[n++] = idLength;
+  memcpy(out + n, deviceId, idLength);
+  n += idLength;
+  n += put32(out + n, seq);
+  n += put32(out + n, timestamp); // 0 if the clock is not set
+  n += put16(out + n, interval);
+  n += put16(out + n, scale);
+  n += put16(out + n, count);
+  for (uint16_t i = 0; i < count; i++) {
+    n += put16(out + n, (uint16_t)levels[i]);
+  }
+  n += put32(out + n, crc32(out, n));
+  return n;
+}
+
+// ============================================
+
+void setup() {
+  Serial.begin(115200);
+
+  pinMode(TRIG_PIN, OUTPUT);
+  pinMode(ECHO_PIN, INPUT);
+
+  WiFi.begin(ssid, pass);
+  while (WiFi.status() != WL_CONNECTED) {
+    delay(500);
+  }
+
+  // Unix time for sample timestamps
+  configTime(0, 0, "pool.ntp.org");
+
+  // Keep the sequence across reboots so retransmissions are recognised
+  preferences.begin("flowra", false);
+  sequence = preferences.getUInt("sequence", 0);
+
+  Serial.println("Setup complete!");
+}
+
+void loop() {
+  // While a full buffer is waiting to be resent, sampling pauses
+  if (sampleCount < SAMPLES_PER_FRAME) {
+    takeSample();
+  }
+  if (sampleCount == SAMPLES_PER_FRAME) {
+    sendFrame();
+  }
+  delay(SAMPLE_SECONDS * 1000L);
+}
+
+float readDistance() {
+  digitalWrite(TRIG_PIN, LOW);
+  delayMicroseconds(2);
+  digitalWrite(TRIG_PIN, HIGH);
+  delayMicroseconds(10);
+  digitalWrite(TRIG_PIN, LOW);
+
+  long duration = pulseIn(ECHO_PIN, HIGH, 30000);
+  if (duration == 0) return -1;   // No echo
+  return (duration * 0.0343) / 2.0;
+}
+
+void takeSample() {
+  time_t now = time(nullptr);
+  if (sampleCount == 0) {
+    // Before NTP sync the year is 1970; send 0 and let the server stamp it
+    firstSampleTime = now > 1600000000 ? (uint32_t)now : 0;
+  }
+
+  float distance = readDistance();
+  if (distance < 0) {
+    samples[sampleCount++] = MISSING_VALUE;
+    return;
+  }
+
+  float waterLevel = constrain(TANK_HEIGHT - distance, 0, TANK_HEIGHT);
+  samples[sampleCount++] = (int16_t)lroundf(waterLevel * SCALE_FACTOR);
+}
+
+void sendFrame() {
+  uint8_t frame[64 + 2 * SAMPLES_PER_FRAME];
+  size_t length = encodeFrame(frame, DEVICE_ID, sequence + 1, firstSampleTime,
+                              SAMPLE_SECONDS, SCALE_FACTOR, samples, sampleCount);
+
+  HTTPClient http;
+  http.begin(INGEST_URL);
+  http.addHeader("Content-Type", "application/octet-stream");
+  int status = http.POST(frame, length);
+  http.end();
+
+  Serial.print("Sent ");
+  Serial.print(length);
+  Serial.print(" bytes, status ");
+  Serial.println(status);
+
+  if (status == 200) {
+    sequence++;
+    preferences.putUInt("sequence", sequence);
+    sampleCount = 0;
+  } else if (status == 400) {
+    // Rejected frame: drop it rather than resend it forever
+    sampleCount = 0;
+  }
+  // Otherwise keep the buffer and retry with the same sequence next time;
+  // the server skips the frame if the first attempt was in fact stored
+}
+
+/*
+ * EXAMPLE OUTPUT:
+ *
+ * Setup complete!
+ * Sent 151 bytes, status 200
+ * Sent 151 bytes, status 200
+ */
@@ -0,0 +1,283 @@
+"""
+Stateful alert engine: one alert row per flooding episode.
+
+Each sensor is a small state machine kept in memory. An episode opens once
+`debounce` consecutive readings are above the sensor's threshold and closes
+once `debounce` consecutive readings are at or below its clear threshold
+(threshold minus the hysteresis unless set per sensor), so a level hovering
+around the threshold does not flap. The episode's alerts row is written
+when it opens and updated with peak, reading count and end time once per
+batch, so a flooded drain costs one row per episode and O(1) per reading.
+
+Per-sensor limits live in the sensors table. Every batch writes the state
+machines it moved to sensor_alert_state in the same transaction, so the
+state survives restarts and is shared by several server processes: sync()
+reads back only the sensors another process has moved on since this
+engine's last write, keeping the streaks of all the others.
+"""
+import threading
+
+
+class _SensorState:
+    __slots__ = ("active_id", "streak", "streak_timestamp", "streak_level",
+                 "peak", "peak_at", "count", "last_timestamp", "dirty")
+
+    def __init__(self):
+        self.active_id = None
+        # Consecutive readings past the threshold we are waiting to cross
+        self.streak = 0
+        self.streak_timestamp = None
+        self.streak_level = None
+        self.peak = None
+        self.peak_at = None
+        self.count = 0
+        self.last_timestamp = None
+        self.dirty = False
+
+
+_STATE_COLUMNS = ("active_id", "streak", "streak_timestamp", "streak_level",
+                  "peak", "peak_at", "count", "last_timestamp")
+
+
+def _state_from_row(row):
+    state = _SensorState()
+    for column in _STATE_COLUMNS:
+        setattr(state, column, row[column])
+    state.streak = state.streak or 0
+    state.count = state.count or 0
+    return state
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class AlertEngine:
+    def __init__(self, threshold=70, hysteresis=5, debounce=1):
+        self.default_threshold = threshold
+        self.default_hysteresis = hysteresis
+        self.default_debounce = max(1, debounce)
+        self._limits = {}
+        self._states = {}
+        self._lock = threading.RLock()
+        # shared_versions values as of this engine's last write, see sync()
+        self._shared_version = None
+        self._limits_version = None
+
+    def limits_for(self, sensor_id):
+        """(threshold, clear_threshold, debounce) for a sensor"""
+        return self._limits.get(sensor_id) or (
+            self.default_threshold,
+            self.default_threshold - self.default_hysteresis,
+            self.default_debounce
+        )
+
+    def set_limits(self, sensor_id, threshold=None, clear_threshold=None, debounce=None):
+        """Per-sensor limits; None falls back to the defaults"""
+        threshold = self.default_threshold if threshold is None else threshold
+        if clear_threshold is None:
+            clear_threshold = threshold - self.default_hysteresis
+        debounce = self.default_debounce if debounce is None else max(1, int(debounce))
+        with self._lock:
+            self._limits[sensor_id] = (threshold, min(clear_threshold, threshold), debounce)
+
+    def load(self, conn):
+        """Rebuild limits and every sensor's state machine from the database"""
+        with self._lock:
+            # Versions first: whatever commits after them is read again by sync()
+            self._shared_version, self._limits_version = self._versions(conn)
+            self._load_limits(conn)
+            self._states = {
+                row["sensor_id"]: _state_from_row(row)
+                for row in conn.execute(f"SELECT sensor_id, {', '.join(_STATE_COLUMNS)} FROM sensor_alert_state")
+            }
+
+    def _load_limits(self, conn):
+        self._limits = {}
+        for row in conn.execute("""
+            SELECT sensor_id, alert_threshold, alert_clear_threshold, alert_debounce FROM sensors
+            WHERE alert_threshold IS NOT NULL OR alert_clear_threshold IS NOT NULL OR alert_debounce IS NOT NULL
+        """):
+            self.set_limits(row["sensor_id"], row["alert_threshold"], row["alert_clear_threshold"], row["alert_debounce"])
+
+    def _versions(self, conn):
+        versions = dict(conn.execute(
+            "SELECT name, version FROM shared_versions WHERE name IN ('alert_state', 'alert_limits')"
+        ).fetchall())
+        return versions.get("alert_state", 0), versions.get("alert_limits", 0)
+
+    def preview(self, sensor_id, water_level):
+        """Whether a reading would be above its sensor's threshold (no state change)"""
+        return _is_number(water_level) and water_level > self.limits_for(sensor_id)[0]
+
+    def process(self, conn, readings):
+        """
+        Run (sensor_id, water_level, timestamp) readings through the state
+        machines inside the caller's transaction. Returns (alert_flags,
+        alert_ids, updated): one flag per reading telling whether it opened
+        an episode, the ids of the alerts rows opened, and how many open
+        rows were updated.
+        """
+        alert_flags = [False] * len(readings)
+        opened = {}
+        touched = set()
+        updates = {}
+        seen = set()
+
+        with self._lock:
+            # Oldest first within the batch, so episodes follow time
+            for index in sorted(range(len(readings)), key=lambda i: readings[i][2]):
+                sensor_id, water_level, timestamp = readings[index]
+                if not _is_number(water_level):
+                    continue
+
+                state = self._states.get(sensor_id)
+                if state is None:
+                    state = self._states[sensor_id] = _SensorState()
+                elif state.last_timestamp is not None and timestamp < state.last_timestamp:
+                    # Late reading: already past this point in the episode
+                    continue
+                state.last_timestamp = timestamp
+                seen.add(sensor_id)
+                threshold, clear_threshold, debounce = self.limits_for(sensor_id)
+
+                if state.active_id is None:
+                    if water_level <= threshold:
+                        state.streak = 0
+                        continue
+                    if state.streak == 0:
+                        state.streak_timestamp = timestamp
+                        state.streak_level = water_level
+                        state.peak = water_level
+                        state.peak_at = timestamp
+                    elif water_level > state.peak:
+                        state.peak = water_level
+                        state.peak_at = timestamp
+                    state.streak += 1
+                    if state.streak < debounce:
+                        continue
+
+                    cursor = conn.execute(
+                        """
+                        INSERT INTO alerts(sensor_id, water_level, timestamp, started_at, peak_level, peak_at,
+                                           reading_count, threshold, status)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'active')
+                        """,
+                        (sensor_id, state.streak_level, state.streak_timestamp, state.streak_timestamp,
+                         state.peak, state.peak_at, state.streak, threshold)
+                    )
+                    state.active_id = cursor.lastrowid
+                    state.count = state.streak
+                    state.streak = 0
+                    alert_flags[index] = True
+                    opened[index] = state.active_id
+                    continue
+
+                state.count += 1
+                state.dirty = True
+                touched.add(sensor_id)
+                if water_level > state.peak:
+                    state.peak = water_level
+                    state.peak_at = timestamp
+
+                if water_level > clear_threshold:
+                    state.streak = 0
+                    continue
+                if state.streak == 0:
+                    state.streak_timestamp = timestamp
+                state.streak += 1
+                if state.streak >= debounce:
+                    # Ended when the level first dropped back below the clear threshold
+                    updates[state.active_id] = (
+                        state.peak, state.peak_at, state.count, state.streak_timestamp, "resolved", state.active_id
+                    )
+                    state.active_id = None
+                    state.streak = 0
+                    state.dirty = False
+
+            for sensor_id in touched:
+                state = self._states[sensor_id]
+                if state.dirty and state.active_id is not None:
+                    updates[state.active_id] = (
+                        state.peak, state.peak_at, state.count, None, "active", state.active_id
+                    )
+                    state.dirty = False
+            if updates:
+                conn.executemany(
+                    """
+                    UPDATE alerts SET peak_level = ?, peak_at = ?, reading_count = ?, ended_at = ?, status = ?
+                    WHERE id = ?
+                    """,
+                    list(updates.values())
+                )
+            if seen:
+                self._save_states(conn, seen)
+
+        # In the order of the readings that opened them
+        alert_ids = [opened[index] for index in sorted(opened)]
+        return alert_flags, alert_ids, len(updates)
+
+    def _save_states(self, conn, sensor_ids):
+        # Tagged with this write's version so other processes can find them
+        version = self._shared_version or 0
+        conn.executemany(
+            f"""
+            INSERT INTO sensor_alert_state(sensor_id, {', '.join(_STATE_COLUMNS)}, version)
+            VALUES (?, {', '.join('?' * len(_STATE_COLUMNS))}, ?)
+            ON CONFLICT(sensor_id) DO UPDATE SET
+                {', '.join(f'{column} = excluded.{column}' for column in _STATE_COLUMNS)},
+                version = excluded.version
+            """,
+            [
+                (sensor_id, *[getattr(self._states[sensor_id], column) for column in _STATE_COLUMNS], version)
+                for sensor_id in sensor_ids
+            ]
+        )
+
+    def sync(self, conn):
+        """
+        Catch up with the sensors other processes moved on since our last
+        write, then claim the next version. Call inside the write transaction,
+        with the write lock already held (BEGIN IMMEDIATE), so nobody writes
+        between the check and our own changes. Costs one indexed read of the
+        changed sensors' rows, not a reload.
+        """
+        with self._lock:
+            if self._shared_version is None:
+                self.load(conn)
+            version, limits_version = self._versions(conn)
+            if version != self._shared_version:
+                for row in conn.execute(
+                    f"SELECT sensor_id, {', '.join(_STATE_COLUMNS)} FROM sensor_alert_state WHERE version > ?",
+                    (self._shared_version,)
+                ):
+                    self._states[row["sensor_id"]] = _state_from_row(row)
+            if limits_version != self._limits_version:
+                self._load_limits(conn)
+                self._limits_version = limits_version
+            self._bump(conn, "alert_state", version + 1)
+            self._shared_version = version + 1
+
+    def limits_changed(self, conn):
+        """Make other processes reload limits before their next write (caller commits)"""
+        with self._lock:
+            version, limits_version = self._versions(conn)
+            self._bump(conn, "alert_limits", limits_version + 1)
+
+    def _bump(self, conn, name, version):
+        conn.execute(
+            """
+            INSERT INTO shared_versions(name, version) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET version = excluded.version
+            """,
+            (name, version)
+        )
+
+    def active(self):
+        """Open episodes as {sensor_id: alert_id}"""
+        with self._lock:
+            return {
+                sensor_id: state.active_id
+                for sensor_id, state in self._states.items()
+                if state.active_id is not None
+            }
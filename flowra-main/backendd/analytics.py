@@ -0,0 +1,371 @@
+"""
+Columnar copy of the readings for analytical queries.
+
+Per-area percentiles, daily maxima across every sensor and correlations
+between sensors read whole columns over long ranges, which a row store
+answers slowly and only by competing with ingest for the database. This
+store keeps the readings as Parquet files in ANALYTICS_DIR and runs those
+queries vectorized in an embedded DuckDB, never touching SQLite.
+
+sync() tails the readings table by id, the order ingest commits in, and
+writes every new stretch as an immutable part file named after its id
+range (readings-<first id>-<last id>.parquet), plus a snapshot of the
+sensors' areas. The highest id on disk is the sync position, so there is
+no other state to lose. Runs of small parts are merged into one file;
+until the old parts are removed, readers skip any part another part's
+range covers. Files are written under a temporary name and renamed, so
+several processes can query while one syncs.
+
+Rows archived out of SQLite by retention stay here: analytics cover the
+whole history since the store was first synced.
+
+Requires the optional duckdb package (pip install duckdb).
+"""
+import contextlib
+import csv
+import datetime
+import os
+import re
+import tempfile
+import threading
+import time
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from ingest import TIMESTAMP_FORMAT
+from metrics import ANALYTICS_QUERY_SECONDS, ANALYTICS_READINGS_COPIED, timed
+
+ANALYTICS_DIR = os.path.abspath(os.getenv(
+    'ANALYTICS_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analytics')
+))
+ANALYTICS_PART_ROWS = int(os.getenv('ANALYTICS_PART_ROWS', '1000000'))  # Readings per part file
+ANALYTICS_MERGE_PARTS = int(os.getenv('ANALYTICS_MERGE_PARTS', '16'))  # Merge smaller parts once there are this many
+ANALYTICS_THREADS = int(os.getenv('ANALYTICS_THREADS', '2'))  # DuckDB threads per process, so analytics leave cores to ingest
+ANALYTICS_MEMORY_LIMIT = os.getenv('ANALYTICS_MEMORY_LIMIT', '1GB')  # DuckDB memory per process before spilling to disk
+
+PART_NAME = re.compile(r"^readings-(\d{12})-(\d{12})\.parquet$")
+SENSORS_FILE = "sensors.parquet"
+_CSV_OPTIONS = "header = true, delim = ',', quote = '\"', escape = '\"'"
+
+
+class AnalyticsUnavailable(Exception):
+    """Raised when the columnar store cannot be used in this environment"""
+
+
+def visible_parts(directory):
+    """
+    [(first_id, last_id, path)] in id order, leaving out parts whose range
+    a merged part already covers
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    parts = []
+    for name in names:
+        match = PART_NAME.match(name)
+        if match:
+            parts.append((int(match.group(1)), int(match.group(2)), os.path.join(directory, name)))
+    # For each start the widest part comes first and hides the ones inside it
+    parts.sort(key=lambda part: (part[0], -part[1]))
+    visible = []
+    covered = 0
+    for first, last, path in parts:
+        if last <= covered:
+            continue
+        visible.append((first, last, path))
+        covered = last
+    return visible
+
+
+def _quote(path):
+    return "'" + path.replace("'", "''") + "'"
+
+
+def _to_datetime(epoch):
+    return datetime.datetime.utcfromtimestamp(epoch)
+
+
+def _round(value, digits=2):
+    return round(value, digits) if value is not None else None
+
+
+@contextlib.contextmanager
+def _exclusive(directory):
+    """Serializes writers across processes (the leader's job and manage.py)"""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, ".sync.lock"), "a+") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class ColumnarStore:
+    def __init__(self, directory=None, threads=None, memory_limit=None):
+        if duckdb is None:
+            raise AnalyticsUnavailable("duckdb is not installed (pip install duckdb)")
+        self.directory = directory or ANALYTICS_DIR
+        self._db = duckdb.connect(config={
+            "threads": threads or ANALYTICS_THREADS,
+            "memory_limit": memory_limit or ANALYTICS_MEMORY_LIMIT
+        })
+        self._lock = threading.Lock()
+        self.last_sync_at = None
+        self.last_sync_seconds = None
+
+    def synced_id(self):
+        """Highest reading id in the store"""
+        parts = visible_parts(self.directory)
+        return parts[-1][1] if parts else 0
+
+    # Writing
+
+    def sync(self, storage, max_rows=None):
+        """
+        Copy readings committed since the last sync (up to max_rows) and
+        refresh the sensor areas. Returns the number of readings copied.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.time()
+        copied = 0
+        with self._lock, _exclusive(self.directory):
+            after = self.synced_id()
+            conn = storage.connect()
+            try:
+                self._write_sensors(storage.sensor_areas(conn))
+                while max_rows is None or copied < max_rows:
+                    limit = ANALYTICS_PART_ROWS if max_rows is None else min(ANALYTICS_PART_ROWS, max_rows - copied)
+                    rows = storage.readings_after(conn, after, limit)
+                    if not rows:
+                        break
+                    self._write_part(rows)
+                    after = rows[-1][0]
+                    copied += len(rows)
+                    ANALYTICS_READINGS_COPIED.inc(len(rows))
+            finally:
+                conn.close()
+            self._merge_small_parts()
+        self.last_sync_at = started
+        self.last_sync_seconds = round(time.time() - started, 3)
+        return copied
+
+    def _copy_csv(self, header, rows, columns, select, target):
+        """
+        Write rows to target as Parquet through a temporary CSV file: DuckDB
+        loads CSV vectorized, while inserting Python rows one at a time is
+        about a hundred times slower.
+        """
+        fd, csv_path = tempfile.mkstemp(suffix=".csv", dir=self.directory)
+        temporary = f"{target}.tmp"
+        try:
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as output:
+                writer = csv.writer(output)
+                writer.writerow(header)
+                writer.writerows(rows)
+            self._db.cursor().execute(
+                f"COPY ({select} FROM read_csv($path, {_CSV_OPTIONS}, columns = {columns})) "
+                f"TO {_quote(temporary)} (FORMAT PARQUET, COMPRESSION ZSTD)",
+                {"path": csv_path}
+            )
+            os.replace(temporary, target)
+        finally:
+            os.remove(csv_path)
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def _write_part(self, rows):
+        first, last = rows[0][0], rows[-1][0]
+        self._copy_csv(
+            ("id", "sensor_id", "water_level", "timestamp"),
+            rows,
+            "{'id': 'BIGINT', 'sensor_id': 'VARCHAR', 'water_level': 'VARCHAR', 'timestamp': 'VARCHAR'}",
+            # Unparseable legacy values become NULL rather than failing the sync
+            f"SELECT id, sensor_id, TRY_CAST(water_level AS DOUBLE) AS water_level, "
+            f"try_strptime(timestamp, '{TIMESTAMP_FORMAT}') AS timestamp",
+            os.path.join(self.directory, f"readings-{first:012d}-{last:012d}.parquet")
+        )
+
+    def _write_sensors(self, sensors):
+        self._copy_csv(
+            ("sensor_id", "area", "latitude", "longitude"),
+            sensors,
+            "{'sensor_id': 'VARCHAR', 'area': 'VARCHAR', 'latitude': 'VARCHAR', 'longitude': 'VARCHAR'}",
+            "SELECT sensor_id, area, TRY_CAST(latitude AS DOUBLE) AS latitude, TRY_CAST(longitude AS DOUBLE) AS longitude",
+            os.path.join(self.directory, SENSORS_FILE)
+        )
+
+    def _merge_small_parts(self):
+        """Merge each run of consecutive parts below ANALYTICS_PART_ROWS once enough have built up"""
+        runs = [[]]
+        for part in visible_parts(self.directory):
+            if part[1] - part[0] + 1 < ANALYTICS_PART_ROWS:
+                runs[-1].append(part)
+            elif runs[-1]:
+                runs.append([])
+        if sum(len(run) for run in runs) < ANALYTICS_MERGE_PARTS:
+            return
+        for run in runs:
+            if len(run) < 2:
+                continue
+            target = os.path.join(self.directory, f"readings-{run[0][0]:012d}-{run[-1][1]:012d}.parquet")
+            temporary = f"{target}.tmp"
+            self._db.cursor().execute(
+                f"COPY (SELECT * FROM read_parquet($paths) ORDER BY id) TO {_quote(temporary)} "
+                f"(FORMAT PARQUET, COMPRESSION ZSTD)",
+                {"paths": [path for _, _, path in run]}
+            )
+            os.replace(temporary, target)
+            for _, _, path in run:
+                os.remove(path)
+
+    def clear(self):
+        """Remove every part file and the sensor snapshot, for a full resync"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, _exclusive(self.directory):
+            # Including parts hidden behind a merged one, left by an interrupted merge
+            for name in os.listdir(self.directory):
+                if PART_NAME.match(name) or name == SENSORS_FILE:
+                    os.remove(os.path.join(self.directory, name))
+
+    # Reading
+
+    def _query(self, sql, params):
+        """
+        Rows as dicts; sql reads the readings as {readings} and the sensor
+        areas as {sensors}. Retried once if a merge removed a part between
+        listing the files and reading them.
+        """
+        for attempt in range(2):
+            parts = visible_parts(self.directory)
+            if not parts:
+                return []
+            query = sql.format(readings="read_parquet($parts)", sensors="read_parquet($sensors)")
+            values = dict(params, parts=[path for _, _, path in parts])
+            if "$sensors" in query:
+                # Written by every sync before its first part
+                values["sensors"] = os.path.join(self.directory, SENSORS_FILE)
+            try:
+                cursor = self._db.cursor()
+                result = cursor.execute(query, values)
+                columns = [column[0] for column in result.description]
+                return [dict(zip(columns, row)) for row in result.fetchall()]
+            except duckdb.IOException:
+                if attempt:
+                    raise
+
+    def stats(self):
+        parts = visible_parts(self.directory)
+        rows = self._query("SELECT COUNT(*) AS readings FROM {readings}", {}) or [{"readings": 0}]
+        return {
+            "directory": self.directory,
+            "parts": len(parts),
+            "readings": rows[0]["readings"],
+            "bytes": sum(os.path.getsize(path) for _, _, path in parts),
+            "synced_id": parts[-1][1] if parts else 0,
+            "last_sync_at": self.last_sync_at,
+            "last_sync_seconds": self.last_sync_seconds
+        }
+
+    @timed(ANALYTICS_QUERY_SECONDS, "area_percentiles")
+    def area_percentiles(self, start, end, percentiles):
+        """
+        Per area: readings, sensors, the given percentiles (0-100) of the
+        water level and its maximum, for start <= timestamp < end (epoch seconds)
+        """
+        rows = self._query(
+            """
+            SELECT COALESCE(s.area, 'Unassigned') AS area,
+                   COUNT(*) AS readings,
+                   COUNT(DISTINCT r.sensor_id) AS sensors,
+                   quantile_cont(r.water_level, $fractions) AS levels,
+                   MAX(r.water_level) AS max_level
+            FROM {readings} r
+            LEFT JOIN {sensors} s ON s.sensor_id = r.sensor_id
+            WHERE r.timestamp >= $start AND r.timestamp < $end AND r.water_level IS NOT NULL
+            GROUP BY 1
+            ORDER BY 1
+            """,
+            {"fractions": [p / 100 for p in percentiles], "start": _to_datetime(start), "end": _to_datetime(end)}
+        )
+        for row in rows:
+            levels = row.pop("levels")
+            row["percentiles"] = {f"p{p:g}": _round(level) for p, level in zip(percentiles, levels)}
+            row["max_level"] = _round(row["max_level"])
+        return rows
+
+    @timed(ANALYTICS_QUERY_SECONDS, "daily_max")
+    def daily_maxima(self, start, end, area=None):
+        """Per UTC day: the highest level across all sensors (optionally one area), where, and the mean"""
+        area_filter = "AND s.area = $area" if area else ""
+        params = {"start": _to_datetime(start), "end": _to_datetime(end)}
+        if area:
+            params["area"] = area
+        rows = self._query(
+            f"""
+            SELECT CAST(date_trunc('day', r.timestamp) AS DATE) AS day,
+                   MAX(r.water_level) AS max_level,
+                   arg_max(r.sensor_id, r.water_level) AS sensor_id,
+                   arg_max(r.timestamp, r.water_level) AS max_at,
+                   AVG(r.water_level) AS avg_level,
+                   COUNT(*) AS readings
+            FROM {{readings}} r
+            LEFT JOIN {{sensors}} s ON s.sensor_id = r.sensor_id
+            WHERE r.timestamp >= $start AND r.timestamp < $end AND r.water_level IS NOT NULL {area_filter}
+            GROUP BY 1
+            ORDER BY 1
+            """,
+            params
+        )
+        for row in rows:
+            row["day"] = row["day"].isoformat()
+            row["max_at"] = row["max_at"].strftime(TIMESTAMP_FORMAT)
+            row["max_level"] = _round(row["max_level"])
+            row["avg_level"] = _round(row["avg_level"])
+        return rows
+
+    @timed(ANALYTICS_QUERY_SECONDS, "correlation")
+    def correlation(self, sensor_ids, start, end, bucket_seconds):
+        """
+        Pearson correlation of every pair of sensors over their mean level
+        per bucket_seconds window, using windows where both have readings
+        """
+        rows = self._query(
+            """
+            WITH buckets AS (
+                SELECT sensor_id,
+                       CAST(epoch(timestamp) AS BIGINT) // $bucket AS bucket,
+                       AVG(water_level) AS level
+                FROM {readings}
+                WHERE timestamp >= $start AND timestamp < $end AND water_level IS NOT NULL
+                  AND sensor_id IN (SELECT unnest($sensor_ids))
+                GROUP BY 1, 2
+            )
+            SELECT a.sensor_id AS sensor_a, b.sensor_id AS sensor_b,
+                   corr(a.level, b.level) AS correlation,
+                   COUNT(*) AS buckets
+            FROM buckets a
+            JOIN buckets b ON b.bucket = a.bucket AND b.sensor_id > a.sensor_id
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+            """,
+            {"bucket": bucket_seconds, "start": _to_datetime(start), "end": _to_datetime(end),
+             "sensor_ids": list(sensor_ids)}
+        )
+        for row in rows:
+            # NaN when one side never changes within the range
+            value = row["correlation"]
+            row["correlation"] = round(value, 4) if value is not None and value == value else None
+        return rows
@@ -1,10 +1,34 @@
-from flask import Flask,request,jsonify,render_template,send_from_directory
+from flask import Flask,request,jsonify,render_template,send_from_directory,g
 import sqlite3
 import requests
 import datetime
 import os
+import time
 from dotenv import load_dotenv
-from database import get_db
+from database import get_db, get_read_db, close_all, data_version, shared_version, DB_PATH
+from migrations import migrate
+from ingest import parse_batch, validate_reading, utc_now
+from alert_engine import AlertEngine
+from ingest_queue import WriteBehindQueue, IngestQueueFull
+from stats import read_stats, reconcile, STATS_BUCKET_SECONDS
+from rollups import parse_time, parse_bucket, auto_bucket
+from archive import run_retention, query_history
+from pagination import fetch_page, InvalidCursor
+from events import EventHub, CommitRelay, format_event
+from blynk_client import BlynkClient, BlynkError
+from fleet import FleetPoller, load_devices
+from liveness import LivenessCache, device_for_sensor
+from response_cache import DataVersions, ResponseCache, conditional_get
+from binary_ingest import decode_frames, frame_readings, new_frames, record_sequences
+from export import stream_export, EXPORT_FORMATS, MIMETYPES as EXPORT_MIMETYPES
+from metrics import (REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, CallbackMetric, timed,
+                     HTTP_REQUEST_SECONDS, HTTP_REQUESTS, READINGS_INGESTED, ALERTS_OPENED,
+                     JOB_SECONDS, JOB_FAILURES)
+from spatial import parse_bbox, query_locations, query_clusters, MAP_CLUSTER_MAX_ZOOM
+from sensor_import import validate_sensor, detect_format, parse_sensors, import_sensors, FORMATS
+from leader import LeaderLock
+from storage import open_storage
+from analytics import ColumnarStore, AnalyticsUnavailable
 from flask_cors import CORS
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
@@ -19,17 +43,43 @@ app = Flask(__name__,
             template_folder='templates/build')
 CORS(app)
 
-# Initialize scheduler
+# Jobs are added at import but only run once this process is elected leader
 scheduler = BackgroundScheduler()
-scheduler.start()
 
-# Shut down the scheduler when exiting the app
-atexit.register(lambda: scheduler.shutdown())
+# Shut down the scheduler and release pooled DB connections when exiting the app
+def shutdown_background_services():
+    leader_lock.stop()
+    if scheduler.running:
+        scheduler.shutdown()
+    if ingest_queue is not None:
+        # Flush readings still waiting in the write-behind queue
+        ingest_queue.stop()
+    fleet_poller.stop()
+    blynk_client.close()
+    close_all()
+
+atexit.register(shutdown_background_services)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Per-route latency and status counts for /metrics"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.labels(route, request.method).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(route, request.method, f"{response.status_code // 100}xx").inc()
+    return response
 
 # Configure Flask from environment
 app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
 app.config['ENV'] = os.getenv('FLASK_ENV', 'production')
 
+SERVER_WORKERS = int(os.getenv('WEB_CONCURRENCY', '1'))  # Server processes sharing the database (gunicorn workers)
+
 @app.route("/")
 def home():
     return render_template('index.html')
@@ -52,10 +102,38 @@ def register_sensor():
     conn.commit()
     conn.close()
 
+    data_versions.bump("sensors")
+    event_hub.publish("sensor", {
+        "sensor_id": data["sensor_id"],
+        "latitude": data["latitude"],
+        "longitude": data["longitude"],
+        "area": data["area"]
+    })
+
     return jsonify({"message":"Sensor registered successfully"})
 
 
 THRESHOLD = int(os.getenv('WATER_LEVEL_THRESHOLD', '70'))
+ALERT_HYSTERESIS = float(os.getenv('ALERT_HYSTERESIS', '5'))  # An episode ends this far below the threshold
+ALERT_DEBOUNCE_READINGS = int(os.getenv('ALERT_DEBOUNCE_READINGS', '1'))  # Consecutive readings needed to open or close an episode
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')  # Store behind ingest, latest, range and aggregate queries
+storage = open_storage(STORAGE_BACKEND)
+
+# One alerts row per episode; open episodes are rebuilt from the database
+alert_engine = AlertEngine(THRESHOLD, hysteresis=ALERT_HYSTERESIS, debounce=ALERT_DEBOUNCE_READINGS)
+
+def load_alert_engine():
+    conn = get_read_db()
+    try:
+        alert_engine.load(conn)
+    finally:
+        conn.close()
+
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '10000'))  # Max readings per batch request
+AGGREGATE_MAX_POINTS = int(os.getenv('AGGREGATE_MAX_POINTS', '500'))  # Target points when bucket is automatic
+AGGREGATE_MAX_BUCKETS = int(os.getenv('AGGREGATE_MAX_BUCKETS', '10000'))  # Hard limit per aggregate request
+HISTORY_MAX_ROWS = int(os.getenv('HISTORY_MAX_ROWS', '10000'))  # Max rows per history request
 
 # Blynk API Configuration
 BLYNK_AUTH_TOKEN = os.getenv('BLYNK_AUTH_TOKEN')
@@ -65,41 +143,228 @@ BLYNK_HEARTBEAT_PIN = os.getenv('BLYNK_HEARTBEAT_PIN', 'V9')  # Heartbeat/timest
 BLYNK_HEARTBEAT_TIMEOUT = int(os.getenv('BLYNK_HEARTBEAT_TIMEOUT', '15'))  # Seconds before device considered offline
 FETCH_INTERVAL_MINUTES = int(os.getenv('FETCH_INTERVAL_MINUTES', '5'))  # Fetch every 5 minutes
 
-def is_device_online():
+# Write-behind ingest: handlers queue readings and a writer thread group-commits them
+INGEST_WRITE_BEHIND = os.getenv('INGEST_WRITE_BEHIND', 'False').lower() == 'true'
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '50000'))  # Max readings waiting to be written
+INGEST_GROUP_SIZE = int(os.getenv('INGEST_GROUP_SIZE', '1000'))  # Max readings per commit
+INGEST_FLUSH_MS = int(os.getenv('INGEST_FLUSH_MS', '50'))  # Max time a reading waits for its group
+INGEST_ENQUEUE_TIMEOUT_MS = int(os.getenv('INGEST_ENQUEUE_TIMEOUT_MS', '0'))  # Block this long when full (0 = reject)
+
+SSE_CLIENT_QUEUE = int(os.getenv('SSE_CLIENT_QUEUE', '1000'))  # Events buffered per stream client before it is dropped
+SSE_BACKLOG = int(os.getenv('SSE_BACKLOG', '1000'))  # Events kept for Last-Event-ID replay
+SSE_MAX_READINGS_PER_EVENT = int(os.getenv('SSE_MAX_READINGS_PER_EVENT', '200'))  # Newest readings sent per batch event
+SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))  # Keep-alive comment interval
+
+SSE_RELAY_INTERVAL_MS = int(os.getenv('SSE_RELAY_INTERVAL_MS', '500'))  # How often a worker checks for other workers' commits
+
+event_hub = EventHub(max_queue=SSE_CLIENT_QUEUE, backlog=SSE_BACKLOG)
+
+def relay_feed(last_id, rows_after, **extra):
+    """(last_id(), fetch(after_id, limit)) over a storage feed for the stream relay"""
+    def last():
+        conn = storage.connect()
+        try:
+            return last_id(conn)
+        finally:
+            conn.close()
+
+    def fetch(after_id, limit):
+        conn = storage.connect()
+        try:
+            return [dict(row, **extra) for row in rows_after(conn, after_id, limit)]
+        finally:
+            conn.close()
+    return last, fetch
+
+# With several workers, readings and alerts stored by the others reach this
+# worker's stream clients through the relay. The alert flag of a relayed
+# reading is unknown (null); its episode arrives as an "alerts" event.
+stream_relay = CommitRelay(
+    event_hub,
+    data_version,
+    {
+        "readings": relay_feed(storage.last_reading_id, storage.readings_after, alert=None),
+        "alerts": relay_feed(storage.last_alert_id, storage.alerts_after)
+    },
+    interval=SSE_RELAY_INTERVAL_MS / 1000,
+    max_rows_per_event=SSE_MAX_READINGS_PER_EVENT
+)
+
+RESPONSE_CACHE_ENTRIES = int(os.getenv('RESPONSE_CACHE_ENTRIES', '256'))  # Serialized GET bodies kept for conditional requests
+
+# Bumped after every committed write; ETags of cached read endpoints derive from them
+data_versions = DataVersions()
+response_cache = ResponseCache(max_entries=RESPONSE_CACHE_ENTRIES)
+
+def cached_get(*tables, extra=None):
+    """ETag/304 and body caching for a GET view that reads `tables`"""
+    return conditional_get(data_versions, response_cache, tables, extra)
+
+def stats_window():
+    """Rolling 24h stats change when the window crosses a bucket boundary"""
+    return int(time.time()) // STATS_BUCKET_SECONDS
+
+def publish_readings(readings, result):
+    """Push committed readings and their alerts to stream subscribers"""
+    rows = [
+        {"id": reading_id, "sensor_id": sensor_id, "water_level": water_level, "timestamp": timestamp, "alert": alert}
+        for reading_id, (sensor_id, water_level, timestamp), alert
+        in zip(result.reading_ids, readings, result.alert_flags)
+    ]
+    event_hub.publish("readings", {"count": len(rows), "readings": rows[-SSE_MAX_READINGS_PER_EVENT:]})
+
+    if result.alert_ids:
+        alerts = [
+            {"id": alert_id, "sensor_id": row["sensor_id"], "water_level": row["water_level"], "timestamp": row["timestamp"]}
+            for alert_id, row in zip(result.alert_ids, [row for row in rows if row["alert"]])
+        ]
+        event_hub.publish("alerts", {"count": len(alerts), "alerts": alerts[-SSE_MAX_READINGS_PER_EVENT:]})
+
+def write_readings(readings, prepare=None):
     """
-    Check if the device is online by fetching the heartbeat pin.
-    Returns (is_online: bool, heartbeat_value: float, age_seconds: float)
+    Store (sensor_id, water_level, timestamp) readings in one transaction.
+    prepare(conn), if given, runs first under the write lock and returns
+    the readings to store instead, so checks and bookkeeping rows commit
+    or roll back together with them. Returns one alert flag per reading.
     """
-    if not BLYNK_AUTH_TOKEN:
-        return False, None, None
-
+    conn = storage.connect(write=True)
     try:
-        url = f"{BLYNK_BASE_URL}?token={BLYNK_AUTH_TOKEN}&{BLYNK_HEARTBEAT_PIN}"
-        response = requests.get(url, timeout=10)
+        if SERVER_WORKERS > 1 or prepare is not None:
+            # Take the write lock first, then catch up with episodes other workers moved on
+            conn.execute("BEGIN IMMEDIATE")
+            if SERVER_WORKERS > 1:
+                alert_engine.sync(conn)
+        if prepare is not None:
+            readings = prepare(conn)
+        if not readings:
+            conn.commit()
+            return []
+        result = storage.insert(conn, readings, alert_engine)
+        # Published below; the relay must not send them again
+        stream_relay.commit(conn.commit, readings=result.reading_ids, alerts=result.alert_ids)
+    except Exception:
+        conn.rollback()
+        # Episode state already moved on; resync it with what was committed
+        load_alert_engine()
+        raise
+    finally:
+        conn.close()
 
-        if response.status_code == 200:
-            # Heartbeat should be a Unix timestamp (seconds since epoch)
-            heartbeat_value = float(response.text.strip())
-            current_time = datetime.datetime.now().timestamp()
-            age_seconds = current_time - heartbeat_value
+    READINGS_INGESTED.inc(len(readings))
+    if result.alert_ids:
+        ALERTS_OPENED.inc(len(result.alert_ids))
+    data_versions.bump("readings")
+    if result.alert_ids or result.alerts_updated:
+        data_versions.bump("alerts")
+    publish_readings(readings, result)
+    return result.alert_flags
+
+ingest_queue = WriteBehindQueue(
+    write_readings,
+    max_size=INGEST_QUEUE_SIZE,
+    group_size=INGEST_GROUP_SIZE,
+    flush_interval_ms=INGEST_FLUSH_MS,
+    enqueue_timeout_ms=INGEST_ENQUEUE_TIMEOUT_MS
+) if INGEST_WRITE_BEHIND else None
+
+def submit_readings(readings):
+    """
+    Store readings synchronously, or hand them to the write-behind queue
+    when INGEST_WRITE_BEHIND is enabled. Returns one alert flag per reading.
+    Raises IngestQueueFull when the queue applies backpressure.
+    """
+    if ingest_queue is not None:
+        ingest_queue.submit(readings)
+        return [alert_engine.preview(reading[0], reading[1]) for reading in readings]
+    return write_readings(readings)
+
+def submit_reading(sensor_id, water_level, timestamp=None):
+    """Single-reading form of submit_readings. Returns True if an alert was raised."""
+    return submit_readings([(sensor_id, water_level, timestamp or utc_now())])[0]
+
+@app.errorhandler(IngestQueueFull)
+def ingest_queue_full(e):
+    return jsonify({
+        "success": False,
+        "error": f"Ingest queue full, retry later: {str(e)}"
+    }), 503, {"Retry-After": "1"}
+
+BLYNK_TIMEOUT = float(os.getenv('BLYNK_TIMEOUT', '10'))  # Seconds per Blynk HTTP request
+BLYNK_RETRIES = int(os.getenv('BLYNK_RETRIES', '3'))  # Retries on connection errors, timeouts, 429 and 5xx
+BLYNK_RETRY_BACKOFF = float(os.getenv('BLYNK_RETRY_BACKOFF', '0.5'))  # Exponential backoff factor between retries
+BLYNK_POOL_SIZE = int(os.getenv('BLYNK_POOL_SIZE', '10'))  # Keep-alive connections kept per host
+
+# Shared by the background poller, /api/fetch-blynk and /api/store-reading
+blynk_client = BlynkClient(
+    BLYNK_BASE_URL,
+    timeout=BLYNK_TIMEOUT,
+    retries=BLYNK_RETRIES,
+    backoff=BLYNK_RETRY_BACKOFF,
+    pool_size=BLYNK_POOL_SIZE
+)
+
+def heartbeat_status(heartbeat_value):
+    """
+    Online check for a heartbeat pin value (a Unix timestamp).
+    Returns (is_online: bool, heartbeat_value: float, age_seconds: float)
+    """
+    if not isinstance(heartbeat_value, float):
+        return False, None, None
+    age_seconds = time.time() - heartbeat_value
+    return age_seconds <= BLYNK_HEARTBEAT_TIMEOUT, heartbeat_value, age_seconds
+
+BLYNK_DEVICE_ID = 'blynk'  # Liveness key of the BLYNK_AUTH_TOKEN device (sensors blynk_<pin>)
+LIVENESS_MAX_AGE = int(os.getenv('LIVENESS_MAX_AGE', '10'))  # Seconds before a status check asks Blynk again
+
+def refresh_device_heartbeat(device_id):
+    """Read a device's heartbeat pin from Blynk (liveness cache refresh)"""
+    if device_id == BLYNK_DEVICE_ID:
+        if not BLYNK_AUTH_TOKEN:
+            return None
+        token, heartbeat_pin = BLYNK_AUTH_TOKEN, BLYNK_HEARTBEAT_PIN
+    else:
+        conn = get_read_db()
+        device = conn.execute(
+            "SELECT token, heartbeat_pin FROM devices WHERE device_id = ?",
+            (device_id,)
+        ).fetchone()
+        conn.close()
+        if device is None or not device["heartbeat_pin"]:
+            return None
+        token, heartbeat_pin = device["token"], device["heartbeat_pin"]
 
-            is_online = age_seconds <= BLYNK_HEARTBEAT_TIMEOUT
+    value = blynk_client.get_pin(token, heartbeat_pin)
+    return value if isinstance(value, float) else None
 
-            return is_online, heartbeat_value, age_seconds
-        else:
-            print(f"[WARNING] Failed to fetch heartbeat pin {BLYNK_HEARTBEAT_PIN}: HTTP {response.status_code}")
-            return False, None, None
+# Fed by webhooks, ingest and the pollers; Blynk is only asked when an entry is stale
+device_liveness = LivenessCache(
+    heartbeat_timeout=BLYNK_HEARTBEAT_TIMEOUT,
+    max_age=LIVENESS_MAX_AGE,
+    refresh_heartbeat=refresh_device_heartbeat
+)
 
-    except Exception as e:
-        print(f"[ERROR] Error checking device status: {str(e)}")
+def is_device_online():
+    """
+    Check if the device is online from the liveness cache (the heartbeat
+    pin is only fetched when the cached entry is stale).
+    Returns (is_online: bool, heartbeat_value: float, age_seconds: float)
+    """
+    if not BLYNK_AUTH_TOKEN:
         return False, None, None
 
+    status = device_liveness.status(BLYNK_DEVICE_ID)
+    if status["error"]:
+        print(f"[WARNING] Failed to refresh heartbeat pin {BLYNK_HEARTBEAT_PIN}: {status['error']}")
+    return status["online"], status["heartbeat"], status["heartbeat_age_seconds"]
+
+@timed(JOB_SECONDS, "blynk_data_fetch")
 def fetch_blynk_data_background():
     """
     Background task that fetches data from Blynk API and stores it in database
     Runs periodically based on FETCH_INTERVAL_MINUTES
 
-    Checks device heartbeat first - only stores data if device is online
+    The heartbeat and every pin are read in one multi-pin request - data is
+    only stored if the heartbeat shows the device online
     Values are decoded (divided by 100) to restore full precision
     """
     if not BLYNK_AUTH_TOKEN:
@@ -108,8 +373,22 @@ def fetch_blynk_data_background():
 
     print(f"[INFO] Fetching Blynk data at {datetime.datetime.now()}")
 
+    pins = [pin.strip() for pin in BLYNK_PINS if pin.strip()]
+    try:
+        values = blynk_client.get_pins(BLYNK_AUTH_TOKEN, [BLYNK_HEARTBEAT_PIN] + pins)
+    except BlynkError as e:
+        JOB_FAILURES.labels("blynk_data_fetch").inc()
+        print(f"[ERROR] Failed to fetch pins {', '.join(pins)}: HTTP {e.status_code}")
+        return
+    except Exception as e:
+        JOB_FAILURES.labels("blynk_data_fetch").inc()
+        print(f"[ERROR] Error fetching Blynk data: {str(e)}")
+        return
+
     # Check if device is online via heartbeat
-    is_online, heartbeat_value, age_seconds = is_device_online()
+    is_online, heartbeat_value, age_seconds = heartbeat_status(values.get(BLYNK_HEARTBEAT_PIN))
+    if heartbeat_value is not None:
+        device_liveness.record_heartbeat(BLYNK_DEVICE_ID, heartbeat_value, "poll")
 
     if not is_online:
         if age_seconds is not None:
@@ -118,51 +397,31 @@ def fetch_blynk_data_background():
             print(f"[OFFLINE] Device OFFLINE — Could not read heartbeat pin {BLYNK_HEARTBEAT_PIN}. Ignoring cached Blynk values.")
         return
 
-    # Device is online - proceed with fetching sensor data
-    print(f"[ONLINE] Device ONLINE — Heartbeat is {age_seconds:.1f}s fresh. Fetching sensor data...")
-
-    for pin in BLYNK_PINS:
-        pin = pin.strip()
-        try:
-            # Fetch from Blynk API
-            url = f"{BLYNK_BASE_URL}?token={BLYNK_AUTH_TOKEN}&{pin}"
-            response = requests.get(url, timeout=10)
-
-            if response.status_code == 200:
-                # Blynk returns encoded value (multiplied by 100)
-                encoded_value = float(response.text.strip())
+    print(f"[ONLINE] Device ONLINE — Heartbeat is {age_seconds:.1f}s fresh. Storing sensor data...")
 
-                # Decode: divide by 100 to get real sensor value with precision
-                decoded_value = encoded_value / 100.0
+    timestamp = utc_now()
+    readings = []
+    for pin in pins:
+        encoded_value = values.get(pin)
+        if not isinstance(encoded_value, float):
+            print(f"[ERROR] No numeric value for {pin}: {encoded_value!r}")
+            continue
 
-                sensor_id = f"blynk_{pin}"
-                timestamp = datetime.datetime.now()
+        # Blynk returns encoded value (multiplied by 100); decode to get real sensor value with precision
+        decoded_value = encoded_value / 100.0
+        print(f"[DECODE] {pin}: encoded value {encoded_value} → Decoded: {decoded_value} cm")
+        readings.append((f"blynk_{pin}", decoded_value, timestamp))
 
-                print(f"[DECODE] Received encoded value: {encoded_value} → Decoded: {decoded_value} cm")
-
-                # Store decoded value in database
-                conn = get_db()
-                conn.execute(
-                    "INSERT INTO readings(sensor_id, water_level, timestamp) VALUES (?, ?, ?)",
-                    (sensor_id, decoded_value, timestamp)
-                )
-
-                # Check for alerts using decoded value
-                if decoded_value > THRESHOLD:
-                    conn.execute(
-                        "INSERT INTO alerts(sensor_id, water_level, timestamp) VALUES (?, ?, ?)",
-                        (sensor_id, decoded_value, timestamp)
-                    )
-
-                conn.commit()
-                conn.close()
-
-                print(f"[LIVE] Stored reading: {sensor_id} = {decoded_value} cm at {timestamp}")
-            else:
-                print(f"[ERROR] Failed to fetch {pin}: HTTP {response.status_code}")
+    if not readings:
+        return
 
-        except Exception as e:
-            print(f"[ERROR] Error fetching data for {pin}: {str(e)}")
+    # All pins in one transaction (alerts use the decoded value)
+    try:
+        submit_readings(readings)
+        print(f"[LIVE] Stored {len(readings)} readings at {timestamp}")
+    except Exception as e:
+        JOB_FAILURES.labels("blynk_data_fetch").inc()
+        print(f"[ERROR] Error storing Blynk readings: {str(e)}")
 
 # Schedule the background task - DISABLED per user request
 # scheduler.add_job(
@@ -176,6 +435,290 @@ def fetch_blynk_data_background():
 # Run once immediately on startup - DISABLED per user request
 # fetch_blynk_data_background()
 
+FLEET_POLLING = os.getenv('FLEET_POLLING', 'False').lower() == 'true'  # Poll every device in the devices table
+FLEET_MAX_WORKERS = int(os.getenv('FLEET_MAX_WORKERS', '32'))  # Devices polled concurrently
+FLEET_JITTER = float(os.getenv('FLEET_JITTER', '0.1'))  # +/- fraction applied to every poll delay
+FLEET_MAX_BACKOFF_SECONDS = int(os.getenv('FLEET_MAX_BACKOFF_SECONDS', '3600'))  # Longest delay for an offline or failing device
+FLEET_REFRESH_SECONDS = int(os.getenv('FLEET_REFRESH_SECONDS', '60'))  # How often the device registry is reloaded
+
+def load_device_registry():
+    conn = get_read_db()
+    try:
+        return load_devices(conn)
+    finally:
+        conn.close()
+
+# Own connection pool, sized so every worker can hold a keep-alive connection
+fleet_poller = FleetPoller(
+    BlynkClient(
+        BLYNK_BASE_URL,
+        timeout=BLYNK_TIMEOUT,
+        retries=BLYNK_RETRIES,
+        backoff=BLYNK_RETRY_BACKOFF,
+        pool_size=FLEET_MAX_WORKERS
+    ),
+    load_device_registry,
+    submit_readings,
+    max_workers=FLEET_MAX_WORKERS,
+    jitter=FLEET_JITTER,
+    max_backoff=FLEET_MAX_BACKOFF_SECONDS,
+    heartbeat_timeout=BLYNK_HEARTBEAT_TIMEOUT,
+    refresh_seconds=FLEET_REFRESH_SECONDS,
+    liveness=device_liveness
+)
+
+STATS_RECONCILE_MINUTES = int(os.getenv('STATS_RECONCILE_MINUTES', '60'))  # Dashboard counter drift check
+
+@timed(JOB_SECONDS, "stats_reconcile")
+def reconcile_stats_background():
+    """Recompute dashboard counters from the tables and correct any drift"""
+    try:
+        read_conn = get_read_db()
+        write_conn = get_db()
+        try:
+            corrections = reconcile(read_conn, write_conn)
+        finally:
+            read_conn.close()
+            write_conn.close()
+
+        if corrections["counters"] or corrections["buckets"]:
+            data_versions.bump("stats")
+            print(f"[STATS] Corrected drift: counters={corrections['counters']}, buckets={corrections['buckets']}")
+    except Exception as e:
+        JOB_FAILURES.labels("stats_reconcile").inc()
+        print(f"[ERROR] Stats reconciliation failed: {str(e)}")
+
+scheduler.add_job(
+    func=reconcile_stats_background,
+    trigger=IntervalTrigger(minutes=STATS_RECONCILE_MINUTES),
+    id='stats_reconcile',
+    name='Reconcile dashboard statistics',
+    replace_existing=True
+)
+
+RETENTION_INTERVAL_MINUTES = int(os.getenv('RETENTION_INTERVAL_MINUTES', '60'))  # How often expired rows are archived
+
+@timed(JOB_SECONDS, "retention")
+def retention_background():
+    """Move readings and alerts past their retention period into the monthly archive files"""
+    try:
+        read_conn = get_read_db()
+        write_conn = get_db()
+        try:
+            moved = run_retention(read_conn, write_conn)
+        finally:
+            read_conn.close()
+            write_conn.close()
+
+        if any(moved.values()):
+            data_versions.bump(*[table for table, count in moved.items() if count])
+            print(f"[RETENTION] Archived rows: {moved}")
+    except Exception as e:
+        JOB_FAILURES.labels("retention").inc()
+        print(f"[ERROR] Retention run failed: {str(e)}")
+
+scheduler.add_job(
+    func=retention_background,
+    trigger=IntervalTrigger(minutes=RETENTION_INTERVAL_MINUTES),
+    id='retention',
+    name='Archive expired readings and alerts',
+    max_instances=1,
+    coalesce=True,
+    replace_existing=True
+)
+
+ANALYTICS_BACKEND = os.getenv('ANALYTICS_BACKEND', 'none').lower()  # 'duckdb' keeps a columnar copy of readings for /api/analytics
+ANALYTICS_SYNC_SECONDS = int(os.getenv('ANALYTICS_SYNC_SECONDS', '30'))  # How often new readings are copied to the columnar store
+ANALYTICS_MAX_SENSORS = int(os.getenv('ANALYTICS_MAX_SENSORS', '50'))  # Max sensors per correlation request
+
+def open_analytics():
+    if ANALYTICS_BACKEND in ('', 'none'):
+        return None
+    if ANALYTICS_BACKEND != 'duckdb':
+        raise ValueError(f"Unknown analytics backend '{ANALYTICS_BACKEND}' (known: none, duckdb)")
+    try:
+        return ColumnarStore()
+    except AnalyticsUnavailable as e:
+        print(f"[ANALYTICS] {str(e)}; /api/analytics is disabled")
+        return None
+
+analytics = open_analytics()
+
+@timed(JOB_SECONDS, "analytics_sync")
+def analytics_sync_background():
+    """Copy newly committed readings into the columnar analytics store"""
+    try:
+        analytics.sync(storage)
+    except Exception as e:
+        JOB_FAILURES.labels("analytics_sync").inc()
+        print(f"[ERROR] Analytics sync failed: {str(e)}")
+
+if analytics is not None:
+    scheduler.add_job(
+        func=analytics_sync_background,
+        trigger=IntervalTrigger(seconds=ANALYTICS_SYNC_SECONDS),
+        id='analytics_sync',
+        name='Copy new readings to the analytics store',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+
+LEADER_LOCK_PATH = os.getenv('LEADER_LOCK_PATH', f"{DB_PATH}.leader")  # Held by the process running the jobs
+LEADER_RETRY_SECONDS = int(os.getenv('LEADER_RETRY_SECONDS', '10'))  # How often followers try to take over
+
+def start_background_jobs():
+    """Scheduled jobs and the fleet poller; runs in the elected leader only"""
+    scheduler.start()
+    if FLEET_POLLING:
+        fleet_poller.start()
+
+leader_lock = LeaderLock(LEADER_LOCK_PATH, start_background_jobs, retry_seconds=LEADER_RETRY_SECONDS)
+_app_ready = False
+
+def create_app():
+    """
+    Prepare this process to serve: bring the schema up to date, load alert
+    state and join the leader election. Every worker serves HTTP; only the
+    leader runs the scheduler and the fleet poller. Called once per process
+    by wsgi.py (gunicorn) or `python app.py`.
+    """
+    global _app_ready
+    if _app_ready:
+        return app
+    _app_ready = True
+    migrate()
+    load_alert_engine()
+    if SERVER_WORKERS > 1:
+        # Cached responses and stream clients must not miss another worker's writes
+        data_versions.watch(data_version)
+        stream_relay.start()
+    else:
+        # Only manage.py writes behind this process's back, and it bumps this row
+        data_versions.watch(lambda: shared_version("cli_writes"))
+    leader_lock.start()
+    return app
+
+@app.route("/api/devices", methods=["GET"])
+def get_devices():
+    """Registered Blynk devices (tokens masked)"""
+    try:
+        conn = get_read_db()
+        devices = conn.execute("SELECT * FROM devices ORDER BY device_id").fetchall()
+        conn.close()
+
+        return jsonify({
+            "success": True,
+            "devices": [
+                {
+                    "device_id": device["device_id"],
+                    "token": f"...{device['token'][-4:]}",
+                    "pins": device["pins"].split(","),
+                    "heartbeat_pin": device["heartbeat_pin"],
+                    "interval_seconds": device["interval_seconds"],
+                    "value_divisor": device["value_divisor"],
+                    "enabled": bool(device["enabled"])
+                }
+                for device in devices
+            ],
+            "count": len(devices)
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Failed to fetch devices: {str(e)}"}), 500
+
+@app.route("/api/devices", methods=["POST"])
+def register_device():
+    """
+    Register or update a Blynk device for the fleet poller
+    Body: device_id, token, pins (list or "V0,V1"), heartbeat_pin,
+    interval_seconds, value_divisor, enabled
+    Readings are stored as sensor <device_id>_<pin>
+    """
+    data = request.get_json(silent=True) or {}
+    device_id = str(data.get("device_id", "")).strip()
+    token = str(data.get("token", "")).strip()
+    pins = data.get("pins", "V0")
+    if isinstance(pins, list):
+        pins = ",".join(str(pin).strip() for pin in pins)
+
+    if not device_id or not token:
+        return jsonify({"success": False, "error": "device_id and token are required"}), 400
+
+    try:
+        interval_seconds = int(data.get("interval_seconds", FETCH_INTERVAL_MINUTES * 60))
+        value_divisor = float(data.get("value_divisor", 100))
+        if interval_seconds < 1 or value_divisor == 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "interval_seconds must be a positive integer and value_divisor a non-zero number"}), 400
+
+    try:
+        conn = get_db()
+        conn.execute(
+            """
+            INSERT INTO devices(device_id, token, pins, heartbeat_pin, interval_seconds, value_divisor, enabled)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(device_id) DO UPDATE SET
+                token = excluded.token,
+                pins = excluded.pins,
+                heartbeat_pin = excluded.heartbeat_pin,
+                interval_seconds = excluded.interval_seconds,
+                value_divisor = excluded.value_divisor,
+                enabled = excluded.enabled
+            """,
+            (
+                device_id, token, pins, data.get("heartbeat_pin", BLYNK_HEARTBEAT_PIN),
+                interval_seconds, value_divisor, 1 if data.get("enabled", True) else 0
+            )
+        )
+        conn.commit()
+        conn.close()
+
+        fleet_poller.refresh()
+        return jsonify({"success": True, "message": f"Device {device_id} saved"})
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Failed to save device: {str(e)}"}), 500
+
+@app.route("/api/devices/<device_id>", methods=["DELETE"])
+def delete_device(device_id):
+    """Remove a device from the fleet poller"""
+    try:
+        conn = get_db()
+        deleted = conn.execute("DELETE FROM devices WHERE device_id = ?", (device_id,)).rowcount
+        conn.commit()
+        conn.close()
+
+        if not deleted:
+            return jsonify({"success": False, "error": f"Device {device_id} not found"}), 404
+
+        fleet_poller.refresh()
+        return jsonify({"success": True, "message": f"Device {device_id} removed"})
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Failed to remove device: {str(e)}"}), 500
+
+@app.route("/api/devices/status", methods=["GET"])
+def get_devices_status():
+    """
+    Device liveness from the in-memory cache
+    Params: device_id (one device; asks Blynk only if the entry is stale),
+    refresh (default true)
+    """
+    device_id = request.args.get('device_id')
+    if device_id:
+        refresh = request.args.get('refresh', 'true').lower() != 'false'
+        return jsonify({"success": True, "device": device_liveness.status(device_id, refresh=refresh)})
+
+    return jsonify({
+        "success": True,
+        "devices": device_liveness.all_status(),
+        "cache": device_liveness.stats()
+    })
+
+@app.route("/api/fleet/status", methods=["GET"])
+def get_fleet_status():
+    """Fleet poller summary with per-device latency, failures and last success"""
+    return jsonify({"success": True, "enabled": FLEET_POLLING, "fleet": fleet_poller.stats()})
+
 @app.route("/api/scheduler/status", methods=["GET"])
 def get_scheduler_status():
     """Get the status of the background scheduler"""
@@ -183,10 +726,12 @@ def get_scheduler_status():
         job = scheduler.get_job('blynk_data_fetch')
 
         if job:
-            next_run = job.next_run_time.isoformat() if job.next_run_time else None
+            # Pending jobs (followers, whose scheduler never starts) have no next run time
+            next_run_time = getattr(job, 'next_run_time', None)
+            next_run = next_run_time.isoformat() if next_run_time else None
 
             # Get last reading timestamp
-            conn = get_db()
+            conn = get_read_db()
             last_reading = conn.execute(
                 "SELECT MAX(timestamp) as last_time FROM readings"
             ).fetchone()
@@ -195,18 +740,20 @@ def get_scheduler_status():
             return jsonify({
                 "success": True,
                 "scheduler": {
-                    "running": True,
+                    "running": scheduler.running,
                     "job_name": job.name,
                     "next_run": next_run,
                     "interval_minutes": FETCH_INTERVAL_MINUTES,
                     "pins_monitored": BLYNK_PINS,
                     "last_reading_time": last_reading["last_time"] if last_reading else None
-                }
+                },
+                "leader": leader_lock.stats()
             })
         else:
             return jsonify({
                 "success": False,
-                "error": "Scheduler job not found"
+                "error": "Scheduler job not found",
+                "leader": leader_lock.stats()
             })
     except Exception as e:
         return jsonify({
@@ -214,29 +761,224 @@ def get_scheduler_status():
             "error": f"Failed to get scheduler status: {str(e)}"
         }), 500
 
+@app.route("/api/ingest/status", methods=["GET"])
+def get_ingest_status():
+    """Write-behind queue depth and group commit counters"""
+    if ingest_queue is None:
+        return jsonify({"success": True, "write_behind": False})
+
+    return jsonify({
+        "success": True,
+        "write_behind": True,
+        "queue": ingest_queue.stats()
+    })
+
+@app.route("/api/stream", methods=["GET"])
+def stream_events():
+    """
+    Server-Sent Events stream of new readings, alerts and sensor changes.
+    Reconnecting clients send Last-Event-ID and get missed events replayed;
+    a "resync" event means they fell too far behind and should reload.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    subscriber, resync = event_hub.subscribe(last_event_id)
+
+    def generate():
+        try:
+            # Tell EventSource how long to wait before reconnecting
+            yield "retry: 3000\n\n"
+            if resync:
+                yield "event: resync\ndata: {}\n\n"
+            while True:
+                if subscriber.dropped and subscriber.queue.empty():
+                    # Fell behind; the client reconnects with Last-Event-ID
+                    return
+                event = subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                yield format_event(event) if event is not None else ": keep-alive\n\n"
+        finally:
+            event_hub.unsubscribe(subscriber)
+
+    return app.response_class(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route("/api/stream/status", methods=["GET"])
+def get_stream_status():
+    """Open stream connections and event counters"""
+    return jsonify({"success": True, "stream": event_hub.stats(), "relay": stream_relay.stats()})
+
+# Read from the owning components at scrape time
+CallbackMetric("flowra_ingest_queue_depth", "Readings waiting in the write-behind queue",
+               lambda: ingest_queue.stats()["queue_depth"] if ingest_queue is not None else None)
+CallbackMetric("flowra_ingest_queue_in_flight", "Readings being committed by the write-behind writer",
+               lambda: ingest_queue.stats()["in_flight"] if ingest_queue is not None else None)
+CallbackMetric("flowra_sse_subscribers", "Open /api/stream connections",
+               lambda: event_hub.stats()["subscribers"])
+CallbackMetric("flowra_sse_dropped_total", "Stream clients disconnected for falling behind",
+               lambda: event_hub.stats()["dropped_total"], kind="counter")
+CallbackMetric("flowra_fleet_devices", "Devices known to the fleet poller by status",
+               lambda: {(status,): count for status, count in fleet_poller.stats()["by_status"].items()},
+               labelnames=("status",))
+CallbackMetric("flowra_fleet_polls_in_flight", "Fleet device polls in progress",
+               lambda: fleet_poller.stats()["in_flight"])
+CallbackMetric("flowra_response_cache_entries", "Serialized GET responses cached",
+               lambda: response_cache.stats()["entries"])
+CallbackMetric("flowra_scheduler_jobs", "Scheduled background jobs",
+               lambda: len(scheduler.get_jobs()))
+CallbackMetric("flowra_scheduler_leader", "1 if this process runs the scheduled jobs and pollers",
+               lambda: int(leader_lock.is_leader))
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Counters, histograms and queue depths in the Prometheus text format"""
+    return app.response_class(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route("/api/cache/status", methods=["GET"])
+def get_cache_status():
+    """Response cache counters and current data versions"""
+    return jsonify({
+        "success": True,
+        "cache": response_cache.stats(),
+        "versions": data_versions.snapshot()
+    })
+
 @app.route("/api/sensor_data",methods=["POST"])
 def sensor_data():
     data=request.json
     sensor_id=data["sensor_id"]
     water_level=data["water_level"]
 
-    conn=get_db()
+    submit_reading(sensor_id,water_level)
+    device_liveness.record_seen(device_for_sensor(sensor_id), "ingest")
 
-    conn.execute(
-        "INSERT INTO readings(sensor_id,water_level) VALUES (?,?)",
-        (sensor_id,water_level)
-    )
+    return jsonify({"status":"data received"})
 
-    if water_level>THRESHOLD:
-        conn.execute(
-            "INSERT INTO alerts (sensor_id,water_level) VALUES (?,?)",
-            (sensor_id,water_level)
-        )
+@app.route("/api/sensor_data/batch", methods=["POST"])
+def sensor_data_batch():
+    """
+    Batch ingest endpoint for gateways that buffer readings
+    Accepts a JSON array (or {"readings": [...]}) or NDJSON body:
+    [{"sensor_id": "S1", "water_level": 42.5, "timestamp": 1640995200}, ...]
+    All valid readings are written in one transaction; invalid items are
+    reported per index without failing the rest of the batch.
+    """
+    try:
+        items = parse_batch(request.get_data(cache=False), request.content_type)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({
+            "success": False,
+            "error": f"Invalid batch body: {str(e)}"
+        }), 400
 
-    conn.commit()
-    conn.close()
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({
+            "success": False,
+            "error": f"Batch too large: {len(items)} items (max {BATCH_MAX_ITEMS})"
+        }), 413
+
+    results = []
+    valid_readings = []
+    valid_indexes = []
+    for index, item in enumerate(items):
+        reading, error = validate_reading(item)
+        if error:
+            results.append({"index": index, "status": "rejected", "error": error})
+        else:
+            results.append({"index": index, "status": "stored", "alert_created": False})
+            valid_readings.append(reading)
+            valid_indexes.append(index)
 
-    return jsonify({"status":"data received"})
+    alerts_created = 0
+    if valid_readings:
+        try:
+            alert_flags = submit_readings(valid_readings)
+        except IngestQueueFull:
+            raise
+        except Exception as e:
+            return jsonify({
+                "success": False,
+                "error": f"Failed to store batch: {str(e)}"
+            }), 500
+
+        for index, alert_created in zip(valid_indexes, alert_flags):
+            results[index]["alert_created"] = alert_created
+        alerts_created = sum(alert_flags)
+
+        for device_id in {device_for_sensor(reading[0]) for reading in valid_readings}:
+            device_liveness.record_seen(device_id, "ingest")
+
+    stored = len(valid_readings)
+    return jsonify({
+        "success": stored > 0 or not items,
+        "received": len(items),
+        "stored": stored,
+        "rejected": len(items) - stored,
+        "alerts_created": alerts_created,
+        "results": results
+    }), 200 if stored > 0 or not items else 400
+
+@app.route("/api/ingest/binary", methods=["POST"])
+def ingest_binary():
+    """
+    Compact binary ingest for devices posting directly (see binary_ingest.py
+    for the frame layout). The body is one or more frames; retransmitted
+    frames are skipped by sequence number.
+    """
+    body = request.get_data(cache=False)
+    if not body:
+        return jsonify({"success": False, "error": "Empty request body"}), 400
+
+    frames, errors = decode_frames(body, max_levels=BATCH_MAX_ITEMS)
+    if not frames:
+        return jsonify({
+            "success": False,
+            "frames": 0,
+            "stored": 0,
+            "errors": errors
+        }), 400
+
+    received_at = time.time()
+    stored = {}
+
+    def prepare(conn):
+        # The duplicate check, the readings and the sequence numbers share one
+        # write transaction, so a retransmission racing the original is seen
+        # and a sequence is never recorded without its readings
+        stored["frames"], stored["duplicates"] = new_frames(conn, frames)
+        record_sequences(conn, stored["frames"])
+        stored["readings"] = [
+            reading for frame in stored["frames"] for reading in frame_readings(frame, received_at)
+        ]
+        return stored["readings"]
+
+    try:
+        # Written synchronously even with INGEST_WRITE_BEHIND: the device may
+        # only drop a frame once its readings are durable
+        alerts_created = sum(write_readings(None, prepare=prepare))
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Failed to store frames: {str(e)}"
+        }), 500
+
+    frames, duplicates, readings = stored["frames"], stored["duplicates"], stored["readings"]
+    for device_id in {frame.device_id for frame in frames}:
+        device_liveness.record_seen(device_id, "binary")
+
+    return jsonify({
+        "success": True,
+        "frames": len(frames) + duplicates,
+        "duplicates": duplicates,
+        "stored": len(readings),
+        "alerts_created": alerts_created,
+        "errors": errors
+    })
 
 @app.route("/api/fetch-blynk", methods=["GET"])
 def fetch_blynk():
@@ -245,62 +987,40 @@ def fetch_blynk():
         token = request.args.get('token') or os.getenv('BLYNK_AUTH_TOKEN')
         pin = request.args.get('pin', 'V0')  # Default to V0 if not specified
         sensor_id = request.args.get('sensor_id', f'blynk_{pin}')  # Default sensor ID based on pin
-        base_url = os.getenv('BLYNK_BASE_URL', 'https://blynk.cloud/external/api/get')
 
         if not token:
             return jsonify({"error": "Blynk auth token is required. Please set BLYNK_AUTH_TOKEN in .env file or provide as query parameter"}), 400
 
-        # Blynk API URL
-        blynk_url = f"{base_url}?token={token}&{pin}"
-
-        # Make request to Blynk API
-        response = requests.get(blynk_url, timeout=10)
-
-        if response.status_code == 200:
-            # Blynk returns the value directly as text
-            sensor_value = response.text.strip()
-
-            # Try to convert to float if it's a number
-            try:
-                sensor_value = float(sensor_value)
-            except ValueError:
-                pass  # Keep as string if not a number
-
-            # Store the reading in database
-            try:
-                conn = get_db()
-                conn.execute(
-                    "INSERT INTO readings(sensor_id, water_level) VALUES (?, ?)",
-                    (sensor_id, sensor_value)
-                )
-
-                # Check if water level exceeds threshold and create alert
-                if isinstance(sensor_value, (int, float)) and sensor_value > THRESHOLD:
-                    conn.execute(
-                        "INSERT INTO alerts(sensor_id, water_level) VALUES (?, ?)",
-                        (sensor_id, sensor_value)
-                    )
-
-                conn.commit()
-                conn.close()
-            except Exception as db_error:
-                print(f"Database error: {db_error}")
-                # Continue with API response even if database fails
-
-            return jsonify({
-                "success": True,
-                "sensor_value": sensor_value,
-                "pin": pin,
-                "sensor_id": sensor_id,
-                "timestamp": datetime.datetime.now().isoformat(),
-                "stored_in_db": True
-            })
-        else:
+        # Blynk returns the value directly as text; numbers come back as float
+        try:
+            sensor_value = blynk_client.get_pin(token, pin)
+        except BlynkError as e:
             return jsonify({
-                "error": f"Blynk API returned status code {response.status_code}",
-                "details": response.text
-            }), response.status_code
+                "error": str(e),
+                "details": e.details
+            }), e.status_code
+
+        # Store the reading in database
+        try:
+            # Creates an alert if water level exceeds threshold
+            submit_reading(sensor_id, sensor_value)
+        except IngestQueueFull:
+            raise
+        except Exception as db_error:
+            print(f"Database error: {db_error}")
+            # Continue with API response even if database fails
 
+        return jsonify({
+            "success": True,
+            "sensor_value": sensor_value,
+            "pin": pin,
+            "sensor_id": sensor_id,
+            "timestamp": datetime.datetime.now().isoformat(),
+            "stored_in_db": True
+        })
+
+    except IngestQueueFull:
+        raise
     except requests.exceptions.Timeout:
         return jsonify({"error": "Request to Blynk API timed out"}), 408
     except requests.exceptions.RequestException as e:
@@ -317,7 +1037,6 @@ def store_reading():
         token = token or os.getenv('BLYNK_AUTH_TOKEN')
         pin = request.json.get('pin', 'V0') if request.json else 'V0'
         sensor_id = request.json.get('sensor_id', f'blynk_{pin}') if request.json else f'blynk_{pin}'
-        base_url = os.getenv('BLYNK_BASE_URL', 'https://blynk.cloud/external/api/get')
 
         if not token:
             return jsonify({
@@ -326,43 +1045,18 @@ def store_reading():
             }), 400
 
         # STEP 1: Fetch data from Blynk API
-        blynk_url = f"{base_url}?token={token}&{pin}"
-        response = requests.get(blynk_url, timeout=10)
-
-        if response.status_code != 200:
+        try:
+            sensor_value = blynk_client.get_pin(token, pin)
+        except BlynkError as e:
             return jsonify({
                 "success": False,
-                "error": f"Blynk API returned status code {response.status_code}",
-                "details": response.text
-            }), response.status_code
-
-        # Parse sensor value
-        sensor_value = response.text.strip()
-        try:
-            sensor_value = float(sensor_value)
-        except ValueError:
-            pass  # Keep as string if not a number
+                "error": str(e),
+                "details": e.details
+            }), e.status_code
 
         # STEP 2: Store in database
-        conn = get_db()
-
-        # Store reading
-        conn.execute(
-            "INSERT INTO readings(sensor_id, water_level) VALUES (?, ?)",
-            (sensor_id, sensor_value)
-        )
-
-        # STEP 3: Check for alerts and store if needed
-        alert_created = False
-        if isinstance(sensor_value, (int, float)) and sensor_value > THRESHOLD:
-            conn.execute(
-                "INSERT INTO alerts(sensor_id, water_level) VALUES (?, ?)",
-                (sensor_id, sensor_value)
-            )
-            alert_created = True
-
-        conn.commit()
-        conn.close()
+        # STEP 3: Check for alerts and store if needed (same transaction)
+        alert_created = submit_reading(sensor_id, sensor_value)
 
         return jsonify({
             "success": True,
@@ -376,6 +1070,8 @@ def store_reading():
             }
         })
 
+    except IngestQueueFull:
+        raise
     except requests.exceptions.Timeout:
         return jsonify({
             "success": False,
@@ -416,24 +1112,12 @@ def blynk_webhook():
         device_id = data.get('device_id', 'blynk_webhook')
         sensor_id = f"{device_id}_{pin}"
 
-        # Store in database
-        conn = get_db()
-        conn.execute(
-            "INSERT INTO readings(sensor_id, water_level) VALUES (?, ?)",
-            (sensor_id, sensor_value)
-        )
+        device_liveness.record_seen(device_id, "webhook")
+        if pin == BLYNK_HEARTBEAT_PIN and isinstance(sensor_value, (int, float)):
+            device_liveness.record_heartbeat(device_id, float(sensor_value), "webhook")
 
-        # Check for alerts
-        alert_created = False
-        if isinstance(sensor_value, (int, float)) and sensor_value > THRESHOLD:
-            conn.execute(
-                "INSERT INTO alerts(sensor_id, water_level) VALUES (?, ?)",
-                (sensor_id, sensor_value)
-            )
-            alert_created = True
-
-        conn.commit()
-        conn.close()
+        # Store in database and check for alerts
+        alert_created = submit_reading(sensor_id, sensor_value)
 
         return jsonify({
             "success": True,
@@ -447,6 +1131,8 @@ def blynk_webhook():
             }
         })
 
+    except IngestQueueFull:
+        raise
     except Exception as e:
         return jsonify({
             "success": False,
@@ -454,16 +1140,15 @@ def blynk_webhook():
         }), 500
 
 @app.route("/api/latest", methods=["GET"])
+@cached_get("readings")
 def get_latest_reading():
     """
     Get the most recent water level reading from database
     Returns the latest sensor reading with timestamp
     """
     try:
-        conn = get_db()
-        latest = conn.execute(
-            "SELECT * FROM readings ORDER BY timestamp DESC LIMIT 1"
-        ).fetchone()
+        conn = storage.connect()
+        latest = storage.latest(conn)
         conn.close()
 
         if not latest:
@@ -490,45 +1175,36 @@ def get_latest_reading():
         }), 500
 
 @app.route("/api/drainage-locations", methods=["GET"])
+@cached_get("sensors", "readings")
 def get_drainage_locations():
     """
-    Get all drainage locations with their latest water level readings
-    Returns sensor coordinates and latest water level for map display
+    Drainage locations with their latest water level for map display
+    Params: bbox (min_lon,min_lat,max_lon,max_lat), zoom
+    Without params every sensor is returned; at zoom <= MAP_CLUSTER_MAX_ZOOM
+    nearby sensors are returned as clusters instead of individual points
     """
     try:
-        conn = get_db()
-
-        # Get all sensors with their coordinates
-        sensors = conn.execute(
-            "SELECT sensor_id, latitude, longitude, area FROM sensors ORDER BY sensor_id"
-        ).fetchall()
-
-        drainage_locations = []
-        for sensor in sensors:
-            # Get latest reading for this sensor
-            latest_reading = conn.execute(
-                "SELECT water_level, timestamp FROM readings WHERE sensor_id = ? ORDER BY timestamp DESC LIMIT 1",
-                (sensor["sensor_id"],)
-            ).fetchone()
-
-            # Build location object
-            location = {
-                "sensor_id": sensor["sensor_id"],
-                "latitude": sensor["latitude"],
-                "longitude": sensor["longitude"],
-                "area": sensor["area"],
-                "water_level": latest_reading["water_level"] if latest_reading else 0,
-                "timestamp": latest_reading["timestamp"] if latest_reading else None,
-                "name": f"{sensor['area']} Drain" if sensor["area"] else f"Sensor {sensor['sensor_id']}"
-            }
-            drainage_locations.append(location)
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        zoom = float(request.args['zoom']) if request.args.get('zoom') else None
+        if zoom is not None and not 0 <= zoom <= 24:
+            raise ValueError("zoom must be between 0 and 24")
+    except ValueError as e:
+        return jsonify({"success": False, "error": f"Invalid parameter: {str(e)}"}), 400
 
+    try:
+        conn = get_read_db()
+        if zoom is not None and zoom <= MAP_CLUSTER_MAX_ZOOM:
+            drainage_locations, clusters = query_clusters(conn, zoom, bbox)
+        else:
+            drainage_locations, clusters = query_locations(conn, bbox), []
         conn.close()
 
         return jsonify({
             "success": True,
             "locations": drainage_locations,
-            "count": len(drainage_locations)
+            "clusters": clusters,
+            "clustered": bool(clusters),
+            "count": len(drainage_locations) + sum(cluster["count"] for cluster in clusters)
         })
 
     except Exception as e:
@@ -538,26 +1214,80 @@ def get_drainage_locations():
         }), 500
 
 @app.route("/api/sensors", methods=["GET"])
+@cached_get("sensors")
 def get_sensors():
     """Get all sensors from database"""
     try:
-        conn = get_db()
+        conn = get_read_db()
         sensors = conn.execute("SELECT * FROM sensors ORDER BY sensor_id").fetchall()
         conn.close()
 
         sensor_list = []
         for sensor in sensors:
+            threshold, clear_threshold, debounce = alert_engine.limits_for(sensor["sensor_id"])
             sensor_list.append({
                 "sensor_id": sensor["sensor_id"],
                 "latitude": sensor["latitude"],
                 "longitude": sensor["longitude"],
-                "area": sensor["area"]
+                "area": sensor["area"],
+                "alert_threshold": threshold,
+                "alert_clear_threshold": clear_threshold,
+                "alert_debounce": debounce
             })
 
         return jsonify({"sensors": sensor_list})
     except Exception as e:
         return jsonify({"error": f"Failed to fetch sensors: {str(e)}"}), 500
 
+@app.route("/api/sensors/<sensor_id>/thresholds", methods=["PUT"])
+def set_sensor_thresholds(sensor_id):
+    """
+    Per-sensor alert limits. Body: threshold, clear_threshold, debounce
+    (null or missing = server defaults)
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        threshold = float(data["threshold"]) if data.get("threshold") is not None else None
+        clear_threshold = float(data["clear_threshold"]) if data.get("clear_threshold") is not None else None
+        debounce = int(data["debounce"]) if data.get("debounce") is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "threshold and clear_threshold must be numbers, debounce an integer"}), 400
+
+    effective = threshold if threshold is not None else THRESHOLD
+    if clear_threshold is not None and clear_threshold > effective:
+        return jsonify({"success": False, "error": "clear_threshold must not be above threshold"}), 400
+    if debounce is not None and debounce < 1:
+        return jsonify({"success": False, "error": "debounce must be at least 1"}), 400
+
+    try:
+        conn = get_db()
+        updated = conn.execute(
+            "UPDATE sensors SET alert_threshold = ?, alert_clear_threshold = ?, alert_debounce = ? WHERE sensor_id = ?",
+            (threshold, clear_threshold, debounce, sensor_id)
+        ).rowcount
+        if updated and SERVER_WORKERS > 1:
+            # Other workers reload their limits before their next write
+            alert_engine.limits_changed(conn)
+        conn.commit()
+        conn.close()
+
+        if not updated:
+            return jsonify({"success": False, "error": f"Sensor {sensor_id} not found"}), 404
+
+        alert_engine.set_limits(sensor_id, threshold, clear_threshold, debounce)
+        data_versions.bump("sensors")
+
+        threshold, clear_threshold, debounce = alert_engine.limits_for(sensor_id)
+        return jsonify({
+            "success": True,
+            "sensor_id": sensor_id,
+            "alert_threshold": threshold,
+            "alert_clear_threshold": clear_threshold,
+            "alert_debounce": debounce
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Failed to update thresholds: {str(e)}"}), 500
+
 @app.route("/api/sensors/add-location", methods=["POST"])
 def add_sensor_location():
     """
@@ -573,46 +1303,18 @@ def add_sensor_location():
                 "error": "No data provided"
             }), 400
 
-        # Extract data
-        sensor_id = data.get('sensor_id', '').strip()
-        sensor_name = data.get('sensor_name', '').strip()
-        latitude = data.get('latitude')
-        longitude = data.get('longitude')
-        area = data.get('area', 'Unknown Area').strip()
-
-        # Validation
-        if not sensor_id:
-            return jsonify({
-                "success": False,
-                "error": "Sensor ID is required"
-            }), 400
-
-        if not sensor_name:
-            return jsonify({
-                "success": False,
-                "error": "Sensor Name is required"
-            }), 400
-
         try:
-            latitude = float(latitude)
-            longitude = float(longitude)
-        except (ValueError, TypeError):
-            return jsonify({
-                "success": False,
-                "error": "Invalid latitude or longitude format"
-            }), 400
-
-        if latitude < -90 or latitude > 90:
-            return jsonify({
-                "success": False,
-                "error": "Latitude must be between -90 and 90"
-            }), 400
-
-        if longitude < -180 or longitude > 180:
+            sensor = validate_sensor(data, require_name=True)
+        except ValueError as e:
             return jsonify({
                 "success": False,
-                "error": "Longitude must be between -180 and 180"
+                "error": str(e)
             }), 400
+        sensor_id = sensor["sensor_id"]
+        sensor_name = sensor["sensor_name"]
+        latitude = sensor["latitude"]
+        longitude = sensor["longitude"]
+        area = sensor["area"]
 
         # Database operation
         conn = get_db()
@@ -641,6 +1343,14 @@ def add_sensor_location():
         conn.commit()
         conn.close()
 
+        data_versions.bump("sensors")
+        event_hub.publish("sensor", {
+            "sensor_id": sensor_id,
+            "latitude": latitude,
+            "longitude": longitude,
+            "area": area
+        })
+
         return jsonify({
             "success": True,
             "message": f"Sensor {action} successfully",
@@ -659,24 +1369,98 @@ def add_sensor_location():
             "error": f"Failed to register sensor: {str(e)}"
         }), 500
 
+SENSOR_IMPORT_MAX_ROWS = int(os.getenv('SENSOR_IMPORT_MAX_ROWS', '100000'))  # Max rows per import file
+
+@app.route("/api/sensors/import", methods=["POST"])
+def import_sensor_locations():
+    """
+    Register or update many sensor locations from a CSV or GeoJSON file
+    (multipart field "file", or the raw request body). Params: format
+    (csv/geojson, detected from the file name or content type if omitted)
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        body = upload.read()
+        fmt = request.args.get('format') or request.form.get('format') or detect_format(upload.filename, upload.mimetype)
+    else:
+        body = request.get_data()
+        fmt = request.args.get('format') or detect_format(content_type=request.content_type)
+
+    if not body:
+        return jsonify({"success": False, "error": "No file provided"}), 400
+    if fmt not in FORMATS:
+        return jsonify({"success": False, "error": f"format must be one of {', '.join(FORMATS)}"}), 400
+
+    try:
+        rows = parse_sensors(body.decode("utf-8-sig"), fmt)
+    except (UnicodeDecodeError, ValueError) as e:
+        return jsonify({"success": False, "error": f"Invalid {fmt} file: {str(e)}"}), 400
+    if len(rows) > SENSOR_IMPORT_MAX_ROWS:
+        return jsonify({
+            "success": False,
+            "error": f"Import too large: {len(rows)} rows (max {SENSOR_IMPORT_MAX_ROWS})"
+        }), 413
+
+    conn = get_db()
+    try:
+        summary = import_sensors(conn, rows)
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Failed to import sensors: {str(e)}"}), 500
+    finally:
+        conn.close()
+        # Once for the whole file (earlier chunks are committed even on failure);
+        # map clients reload their locations on resync
+        data_versions.bump("sensors")
+        event_hub.publish("resync", {"reason": "sensor_import"})
+
+    print(f"[IMPORT] {summary['imported']} sensor(s) imported ({summary['inserted']} new, "
+          f"{summary['updated']} updated), {summary['rejected']} rejected")
+    return jsonify({"success": True, "format": fmt, **summary})
+
+PAGE_MAX_ROWS = int(os.getenv('PAGE_MAX_ROWS', '5000'))  # Maximum rows per readings/alerts page
+
+def page_params(default_limit):
+    """limit, order, cursor, since, until and after_id query args for fetch_page"""
+    to_text = lambda value: datetime.datetime.utcfromtimestamp(parse_time(value)).strftime("%Y-%m-%d %H:%M:%S")
+    order = request.args.get('order', 'desc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be asc or desc")
+    after_id = int(request.args['after_id']) if request.args.get('after_id') else None
+    if after_id is not None and request.args.get('cursor'):
+        raise ValueError("after_id cannot be combined with cursor")
+    return {
+        "limit": max(1, min(int(request.args.get('limit', str(default_limit))), PAGE_MAX_ROWS)),
+        "order": order,
+        "cursor": request.args.get('cursor'),
+        "since": to_text(request.args['since']) if request.args.get('since') else None,
+        "until": to_text(request.args['until']) if request.args.get('until') else None,
+        "after_id": after_id
+    }
+
+def page_response(key, rows, next_cursor, after_id):
+    """Page body; polling with after_id gets the id to poll from next"""
+    body = {key: rows, "next_cursor": next_cursor}
+    if after_id is not None:
+        body["next_after_id"] = rows[-1]["id"] if rows else after_id
+    return jsonify(body)
+
 @app.route("/api/readings", methods=["GET"])
+@cached_get("readings")
 def get_readings():
-    """Get sensor readings from database"""
+    """
+    Get sensor readings from database, newest first
+    Params: limit, sensor_id, since, until, order (asc/desc), cursor, after_id
+    Pass next_cursor back as cursor to get the following page, or poll with
+    after_id to get rows stored since, in commit order
+    """
     try:
-        limit = int(request.args.get('limit', '100'))
-        sensor_id = request.args.get('sensor_id')
+        page = page_params(100)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
 
-        conn = get_db()
-        if sensor_id:
-            readings = conn.execute(
-                "SELECT * FROM readings WHERE sensor_id = ? ORDER BY timestamp DESC LIMIT ?",
-                (sensor_id, limit)
-            ).fetchall()
-        else:
-            readings = conn.execute(
-                "SELECT * FROM readings ORDER BY timestamp DESC LIMIT ?",
-                (limit,)
-            ).fetchall()
+    try:
+        conn = storage.connect()
+        readings, next_cursor = storage.readings_page(conn, sensor_id=request.args.get('sensor_id'), **page)
         conn.close()
 
         reading_list = []
@@ -688,246 +1472,370 @@ def get_readings():
                 "timestamp": reading["timestamp"]
             })
 
-        return jsonify({"readings": reading_list})
+        return page_response("readings", reading_list, next_cursor, page["after_id"])
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Failed to fetch readings: {str(e)}"}), 500
 
+@app.route("/api/readings/aggregate", methods=["GET"])
+def get_readings_aggregate():
+    """
+    Aggregated readings for charts, served from the rollup tables
+    Params: sensor_id (required), from/to (Unix seconds or ISO-8601, default
+    last 24 hours), bucket ('15m', 'hour', '6h', '1d' ... default automatic)
+    """
+    try:
+        sensor_id = request.args.get('sensor_id')
+        if not sensor_id:
+            return jsonify({"success": False, "error": "sensor_id is required"}), 400
+
+        try:
+            end = parse_time(request.args['to']) if request.args.get('to') else int(datetime.datetime.utcnow().timestamp())
+            start = parse_time(request.args['from']) if request.args.get('from') else end - 24 * 3600
+            bucket_seconds = parse_bucket(request.args['bucket']) if request.args.get('bucket') else auto_bucket(start, end, AGGREGATE_MAX_POINTS)
+        except (ValueError, IndexError):
+            return jsonify({"success": False, "error": "Invalid from, to or bucket parameter"}), 400
+
+        if end <= start:
+            return jsonify({"success": False, "error": "'to' must be after 'from'"}), 400
+        if bucket_seconds < 60 or bucket_seconds % 60:
+            return jsonify({"success": False, "error": "bucket must be a whole number of minutes"}), 400
+        if (end - start) / bucket_seconds > AGGREGATE_MAX_BUCKETS:
+            return jsonify({
+                "success": False,
+                "error": f"Too many buckets requested (max {AGGREGATE_MAX_BUCKETS}), use a larger bucket"
+            }), 400
+
+        conn = storage.connect()
+        source, points = storage.aggregate(conn, sensor_id, start, end, bucket_seconds)
+        conn.close()
+
+        return jsonify({
+            "success": True,
+            "sensor_id": sensor_id,
+            "from": start,
+            "to": end,
+            "bucket_seconds": bucket_seconds,
+            "source": source,
+            "points": points,
+            "count": len(points)
+        })
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Failed to aggregate readings: {str(e)}"
+        }), 500
+
+@app.route("/api/readings/export", methods=["GET"])
+def export_readings():
+    """
+    Stream readings as NDJSON or CSV, oldest first
+    Params: format (ndjson/csv), sensor_id, area, since, until, compress (gzip)
+    """
+    to_text = lambda value: datetime.datetime.utcfromtimestamp(parse_time(value)).strftime("%Y-%m-%d %H:%M:%S")
+    fmt = request.args.get('format', 'ndjson').lower()
+    compress = request.args.get('compress', '').lower()
+    try:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+        if compress not in ('', 'gzip'):
+            raise ValueError("compress must be gzip")
+        filters = {
+            "sensor_id": request.args.get('sensor_id'),
+            "area": request.args.get('area'),
+            "since": to_text(request.args['since']) if request.args.get('since') else None,
+            "until": to_text(request.args['until']) if request.args.get('until') else None
+        }
+    except ValueError as e:
+        return jsonify({"success": False, "error": f"Invalid parameter: {str(e)}"}), 400
+
+    filename = f"readings.{fmt}.gz" if compress else f"readings.{fmt}"
+    conn = get_read_db()
+    return app.response_class(
+        stream_export(conn, fmt, compress=bool(compress), **filters),
+        mimetype="application/gzip" if compress else EXPORT_MIMETYPES[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.route("/api/readings/history", methods=["GET"], defaults={"table": "readings"})
+@app.route("/api/alerts/history", methods=["GET"], defaults={"table": "alerts"})
+def get_history(table):
+    """
+    Rows in a time range, including rows already moved to the archive
+    Params: from (required), to (default now), sensor_id, limit (default 1000)
+    Oldest first
+    """
+    try:
+        try:
+            start = parse_time(request.args['from'])
+            end = parse_time(request.args['to']) if request.args.get('to') else int(datetime.datetime.utcnow().timestamp())
+            limit = min(int(request.args.get('limit', '1000')), HISTORY_MAX_ROWS)
+        except KeyError:
+            return jsonify({"success": False, "error": "'from' is required"}), 400
+        except ValueError:
+            return jsonify({"success": False, "error": "Invalid from, to or limit parameter"}), 400
+
+        to_text = lambda epoch: datetime.datetime.utcfromtimestamp(epoch).strftime("%Y-%m-%d %H:%M:%S")
+
+        conn = get_read_db()
+        rows = query_history(conn, table, to_text(start), to_text(end), request.args.get('sensor_id'), limit)
+        conn.close()
+
+        return jsonify({"success": True, table: rows, "count": len(rows)})
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Failed to fetch {table} history: {str(e)}"
+        }), 500
+
+def alert_to_dict(alert):
+    """An alerts row as one episode: start reading, peak, end and status"""
+    return {
+        "id": alert["id"],
+        "sensor_id": alert["sensor_id"],
+        "water_level": alert["water_level"],
+        "timestamp": alert["timestamp"],
+        "started_at": alert["started_at"],
+        "ended_at": alert["ended_at"],
+        "peak_level": alert["peak_level"],
+        "peak_at": alert["peak_at"],
+        "reading_count": alert["reading_count"],
+        "threshold": alert["threshold"],
+        "status": alert["status"]
+    }
+
 @app.route("/api/alerts", methods=["GET"])
+@cached_get("alerts")
 def get_alerts():
-    """Get alerts from database"""
+    """
+    Get alerts from database, newest first
+    Params: limit, sensor_id, since, until, order (asc/desc), cursor, after_id
+    """
     try:
-        limit = int(request.args.get('limit', '50'))
+        page = page_params(50)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
 
-        conn = get_db()
-        alerts = conn.execute(
-            "SELECT * FROM alerts ORDER BY timestamp DESC LIMIT ?",
-            (limit,)
-        ).fetchall()
+    try:
+        conn = get_read_db()
+        alerts, next_cursor = fetch_page(conn, "alerts", sensor_id=request.args.get('sensor_id'), **page)
         conn.close()
 
         alert_list = []
         for alert in alerts:
-            alert_list.append({
-                "id": alert["id"],
-                "sensor_id": alert["sensor_id"],
-                "water_level": alert["water_level"],
-                "timestamp": alert["timestamp"]
-            })
+            alert_list.append(alert_to_dict(alert))
 
-        return jsonify({"alerts": alert_list})
+        return page_response("alerts", alert_list, next_cursor, page["after_id"])
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Failed to fetch alerts: {str(e)}"}), 500
 
 @app.route("/api/dashboard/stats", methods=["GET"])
+@cached_get("sensors", "readings", "alerts", "stats", extra=stats_window)
 def get_dashboard_stats():
     """Get dashboard statistics"""
     try:
-        conn = get_db()
+        conn = get_read_db()
 
-        # Get total sensors
-        total_sensors = conn.execute("SELECT COUNT(*) as count FROM sensors").fetchone()["count"]
-
-        # Get total readings
-        total_readings = conn.execute("SELECT COUNT(*) as count FROM readings").fetchone()["count"]
-
-        # Get total alerts
-        total_alerts = conn.execute("SELECT COUNT(*) as count FROM alerts").fetchone()["count"]
+        # Running totals and rolling 24 hour buckets maintained by ingest
+        stats = read_stats(conn)
 
         # Get latest reading
         latest_reading = conn.execute(
             "SELECT * FROM readings ORDER BY timestamp DESC LIMIT 1"
         ).fetchone()
 
-        # Get recent readings (last 24 hours)
-        recent_readings = conn.execute(
-            "SELECT * FROM readings WHERE timestamp >= datetime('now', '-1 day') ORDER BY timestamp DESC"
-        ).fetchall()
-
-        # Get average water level from recent readings
-        if recent_readings:
-            avg_water_level = sum(reading["water_level"] for reading in recent_readings) / len(recent_readings)
-        else:
-            avg_water_level = 0
-
         conn.close()
 
-        stats = {
-            "total_sensors": total_sensors,
-            "total_readings": total_readings,
-            "total_alerts": total_alerts,
-            "avg_water_level": round(avg_water_level, 2),
-            "latest_reading": {
-                "sensor_id": latest_reading["sensor_id"] if latest_reading else None,
-                "water_level": latest_reading["water_level"] if latest_reading else None,
-                "timestamp": latest_reading["timestamp"] if latest_reading else None
-            } if latest_reading else None,
-            "recent_readings_count": len(recent_readings)
-        }
+        stats["avg_water_level"] = round(stats["avg_water_level"], 2)
+        stats["latest_reading"] = {
+            "sensor_id": latest_reading["sensor_id"],
+            "water_level": latest_reading["water_level"],
+            "timestamp": latest_reading["timestamp"]
+        } if latest_reading else None
 
         return jsonify({"stats": stats})
     except Exception as e:
         return jsonify({"error": f"Failed to fetch dashboard stats: {str(e)}"}), 500
 
-if __name__ == "__main__":
-    host = os.getenv('FLASK_HOST', '0.0.0.0')
-    port = int(os.getenv('FLASK_PORT', '5030'))
-    debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
-    app.run(host=host, port=port, debug=debug)
-
-
-def create_tables():
-    conn=sqlite3.connect("water_alert.db")
-    cur=conn.cursor()
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS sensors(
-                sensor_id TEXT PRIMARY KEY,
-                latitude REAL,
-                longitude REAL,
-                area TEXT
-                )
-                """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS readings(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sensor_id TEXT,
-                water_level REAL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-
-                """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS alerts(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sensor_id TEXT,
-                water_level REAL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-                """)
-
-
-    conn.commit()
-    conn.close()
-
-@app.route("/api/webhook/blynk", methods=["POST"])
-def blynk_webhook():
+@app.route("/api/dashboard/snapshot", methods=["GET"])
+@cached_get("sensors", "readings", "alerts", "stats", extra=stats_window)
+def get_dashboard_snapshot():
     """
-    Webhook endpoint for Blynk datastream updates
-    Decodes incoming values (divides by 100) to restore full precision
+    Stats, sensors, recent readings and recent alerts in one response,
+    read from one connection inside one read transaction so every part
+    reflects the same moment
     """
     try:
-        # Blynk webhook data structure
-        webhook_data = request.json
-
-        if not webhook_data:
-            return jsonify({"error": "No webhook data received"}), 400
-
-        # Extract data from Blynk webhook
-        # Blynk typically sends data in this format:
-        # {
-        #   "deviceName": "Device Name",
-        #   "deviceId": "device_id",
-        #   "datastreamId": "V0",  # or "V1", etc.
-        #   "value": "sensor_value",
-        #   "timestamp": unix_timestamp
-        # }
-
-        device_name = webhook_data.get('deviceName', 'Unknown Device')
-        device_id = webhook_data.get('deviceId', f'blynk_webhook_{webhook_data.get("datastreamId", "unknown")}')
-        datastream_id = webhook_data.get('datastreamId', 'V0')
-        encoded_value = webhook_data.get('value')
-        timestamp = webhook_data.get('timestamp')
+        readings_limit = max(1, min(int(request.args.get('readings_limit', '20')), 1000))
+        alerts_limit = max(1, min(int(request.args.get('alerts_limit', '10')), 1000))
+    except ValueError:
+        return jsonify({"success": False, "error": "readings_limit and alerts_limit must be integers"}), 400
 
-        if encoded_value is None:
-            return jsonify({"error": "No sensor value in webhook data"}), 400
-
-        # Convert encoded value to float
+    try:
+        conn = get_read_db()
+        conn.execute("BEGIN")
         try:
-            encoded_value = float(encoded_value)
-            # Decode: divide by 100 to get real sensor value with precision
-            decoded_value = encoded_value / 100.0
-
-            print(f"[WEBHOOK] Received encoded value: {encoded_value} → Decoded: {decoded_value} cm")
-        except (ValueError, TypeError):
-            return jsonify({"error": f"Invalid sensor value: {encoded_value}"}), 400
-
-        # Store decoded value in database
-        conn = get_db()
-
-        # Store reading with decoded value
-        conn.execute(
-            "INSERT INTO readings(sensor_id, water_level) VALUES (?, ?)",
-            (device_id, decoded_value)
-        )
-
-        # Create alert if decoded water level exceeds threshold
-        if decoded_value > THRESHOLD:
-            conn.execute(
-                "INSERT INTO alerts(sensor_id, water_level) VALUES (?, ?)",
-                (device_id, decoded_value)
-            )
-            print(f"[ALERT] Water level {decoded_value} cm exceeds threshold {THRESHOLD} cm")
+            stats = read_stats(conn)
+            sensors = conn.execute("SELECT * FROM sensors ORDER BY sensor_id").fetchall()
+            readings = conn.execute(
+                "SELECT * FROM readings ORDER BY timestamp DESC LIMIT ?",
+                (readings_limit,)
+            ).fetchall()
+            alerts = conn.execute(
+                "SELECT * FROM alerts ORDER BY timestamp DESC LIMIT ?",
+                (alerts_limit,)
+            ).fetchall()
+        finally:
+            conn.rollback()
+            conn.close()
 
-        conn.commit()
-        conn.close()
+        reading_list = [
+            {
+                "id": reading["id"],
+                "sensor_id": reading["sensor_id"],
+                "water_level": reading["water_level"],
+                "timestamp": reading["timestamp"]
+            }
+            for reading in readings
+        ]
 
-        print(f"[WEBHOOK] Stored: Device={device_name}, Value={decoded_value} cm, Datastream={datastream_id}")
+        # The newest recent reading is the dashboard's latest reading
+        stats["avg_water_level"] = round(stats["avg_water_level"], 2)
+        stats["latest_reading"] = {
+            "sensor_id": reading_list[0]["sensor_id"],
+            "water_level": reading_list[0]["water_level"],
+            "timestamp": reading_list[0]["timestamp"]
+        } if reading_list else None
 
         return jsonify({
             "success": True,
-            "message": "Webhook data decoded and stored successfully",
-            "data": {
-                "device_id": device_id,
-                "encoded_value": encoded_value,
-                "decoded_value": decoded_value,
-                "datastream_id": datastream_id,
-                "timestamp": datetime.datetime.now().isoformat()
-            }
-        }), 200
-
+            "stats": stats,
+            "sensors": [
+                {
+                    "sensor_id": sensor["sensor_id"],
+                    "latitude": sensor["latitude"],
+                    "longitude": sensor["longitude"],
+                    "area": sensor["area"]
+                }
+                for sensor in sensors
+            ],
+            "readings": reading_list,
+            "alerts": [alert_to_dict(alert) for alert in alerts]
+        })
     except Exception as e:
-        print(f"[WEBHOOK ERROR] {str(e)}")
-        return jsonify({
-            "success": False,
-            "error": f"Failed to process webhook: {str(e)}"
-        }), 500
-
-@app.route("/api/latest", methods=["GET"])
-def get_latest_reading():
-    """Get the most recent water level reading from database"""
+        return jsonify({"success": False, "error": f"Failed to fetch dashboard snapshot: {str(e)}"}), 500
+
+def analytics_disabled():
+    return jsonify({"success": False, "error": "Analytics backend is not enabled (set ANALYTICS_BACKEND=duckdb)"}), 503
+
+def analytics_range(default_days):
+    """(start, end) epoch seconds from the from/to args, default the last default_days"""
+    end = parse_time(request.args['to']) if request.args.get('to') else int(datetime.datetime.utcnow().timestamp())
+    start = parse_time(request.args['from']) if request.args.get('from') else end - default_days * 86400
+    if end <= start:
+        raise ValueError("'to' must be after 'from'")
+    return start, end
+
+@app.route("/api/analytics/status", methods=["GET"])
+def get_analytics_status():
+    """Columnar store size and how far it is behind the readings table"""
+    if analytics is None:
+        return analytics_disabled()
     try:
-        conn = get_db()
+        stats = analytics.stats()
+        conn = storage.connect()
+        last_id = storage.last_reading_id(conn)
+        conn.close()
+        stats["readings_behind"] = max(0, last_id - stats["synced_id"])
+        return jsonify({"success": True, "backend": ANALYTICS_BACKEND, "sync_seconds": ANALYTICS_SYNC_SECONDS, "analytics": stats})
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Failed to get analytics status: {str(e)}"}), 500
 
-        # Get the latest reading
-        latest_reading = conn.execute(
-            "SELECT * FROM readings ORDER BY timestamp DESC LIMIT 1"
-        ).fetchone()
+@app.route("/api/analytics/area-percentiles", methods=["GET"])
+def get_area_percentiles():
+    """
+    Water level percentiles per area from the columnar store
+    Params: from/to (default last 30 days), percentiles (default 50,90,99)
+    """
+    if analytics is None:
+        return analytics_disabled()
+    try:
+        start, end = analytics_range(30)
+        percentiles = [float(value) for value in request.args.get('percentiles', '50,90,99').split(',')]
+        if not percentiles or len(percentiles) > 20 or not all(0 <= value <= 100 for value in percentiles):
+            raise ValueError("percentiles must be 1 to 20 numbers between 0 and 100")
+    except (ValueError, IndexError) as e:
+        return jsonify({"success": False, "error": f"Invalid parameter: {str(e)}"}), 400
 
-        conn.close()
+    try:
+        areas = analytics.area_percentiles(start, end, percentiles)
+        return jsonify({"success": True, "from": start, "to": end, "areas": areas, "count": len(areas)})
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Failed to compute area percentiles: {str(e)}"}), 500
 
-        if latest_reading:
-            return jsonify({
-                "success": True,
-                "latest_reading": {
-                    "id": latest_reading["id"],
-                    "sensor_id": latest_reading["sensor_id"],
-                    "water_level": latest_reading["water_level"],
-                    "timestamp": latest_reading["timestamp"]
-                }
-            })
-        else:
-            return jsonify({
-                "success": True,
-                "latest_reading": None,
-                "message": "No readings found in database"
-            })
+@app.route("/api/analytics/daily-max", methods=["GET"])
+def get_daily_maxima():
+    """
+    Highest level across all sensors per UTC day from the columnar store
+    Params: from/to (default last 30 days), area
+    """
+    if analytics is None:
+        return analytics_disabled()
+    try:
+        start, end = analytics_range(30)
+    except (ValueError, IndexError) as e:
+        return jsonify({"success": False, "error": f"Invalid parameter: {str(e)}"}), 400
 
+    try:
+        days = analytics.daily_maxima(start, end, request.args.get('area'))
+        return jsonify({"success": True, "from": start, "to": end, "days": days, "count": len(days)})
     except Exception as e:
+        return jsonify({"success": False, "error": f"Failed to compute daily maxima: {str(e)}"}), 500
+
+@app.route("/api/analytics/correlation", methods=["GET"])
+def get_sensor_correlation():
+    """
+    Pairwise correlation of sensors' levels from the columnar store
+    Params: sensor_ids (comma separated, at least 2), from/to (default last
+    7 days), bucket (default 1h)
+    """
+    if analytics is None:
+        return analytics_disabled()
+    sensor_ids = sorted({value.strip() for value in request.args.get('sensor_ids', '').split(',') if value.strip()})
+    if len(sensor_ids) < 2 or len(sensor_ids) > ANALYTICS_MAX_SENSORS:
+        return jsonify({"success": False, "error": f"sensor_ids must list 2 to {ANALYTICS_MAX_SENSORS} sensors"}), 400
+    try:
+        start, end = analytics_range(7)
+        bucket_seconds = parse_bucket(request.args['bucket']) if request.args.get('bucket') else 3600
+    except (ValueError, IndexError) as e:
+        return jsonify({"success": False, "error": f"Invalid parameter: {str(e)}"}), 400
+    if bucket_seconds < 60:
+        return jsonify({"success": False, "error": "bucket must be at least one minute"}), 400
+
+    try:
+        pairs = analytics.correlation(sensor_ids, start, end, bucket_seconds)
         return jsonify({
-            "success": False,
-            "error": f"Failed to fetch latest reading: {str(e)}"
-        }), 500
+            "success": True,
+            "from": start,
+            "to": end,
+            "bucket_seconds": bucket_seconds,
+            "pairs": pairs,
+            "count": len(pairs)
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Failed to compute correlations: {str(e)}"}), 500
 
-create_tables()
+if __name__ == "__main__":
+    host = os.getenv('FLASK_HOST', '0.0.0.0')
+    port = int(os.getenv('FLASK_PORT', '5030'))
+    debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+    # The debug reloader's watcher process does not serve; only its child joins the election
+    if not debug or os.getenv('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
+    app.run(host=host, port=port, debug=debug)
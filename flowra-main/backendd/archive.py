@@ -0,0 +1,284 @@
+"""
+Tiered retention and archival of raw readings and alerts.
+
+Rows older than a table's retention period are moved out of
+water_alert.db into per-month archive files (ARCHIVE_DIR/<table>-YYYY-MM.db).
+Each archive file is a small SQLite database of compressed column chunks:
+up to ARCHIVE_CHUNK_ROWS rows of one sensor per chunk, topped up across
+retention passes, holding the rows' columns as zlib-compressed JSON arrays.
+Chunks are indexed by sensor and time range so the history query layer
+only inflates the chunks a request actually touches, in time order.
+
+Rollup tables are never expired - they are the long-term record.
+"""
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+from ingest import TIMESTAMP_FORMAT
+
+ARCHIVE_DIR = os.path.abspath(os.getenv(
+    'ARCHIVE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')
+))
+RETENTION_CHUNK_SIZE = int(os.getenv('RETENTION_CHUNK_SIZE', '5000'))  # Rows moved per write transaction
+RETENTION_PAUSE_MS = int(os.getenv('RETENTION_PAUSE_MS', '50'))  # Pause between chunks so ingest can write
+ARCHIVE_CHUNK_ROWS = int(os.getenv('ARCHIVE_CHUNK_ROWS', '2000'))  # Rows of one sensor per compressed archive chunk
+# Days of raw rows to keep per table (0 = keep forever)
+RETENTION_POLICIES = {
+    "readings": int(os.getenv('RETENTION_READINGS_DAYS', '30')),
+    "alerts": int(os.getenv('RETENTION_ALERTS_DAYS', '365')),
+}
+
+
+def cutoff_for(days, now=None):
+    """Timestamp string before which rows expire"""
+    now = time.time() if now is None else now
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(now - days * 86400))
+
+
+def archive_path(table, month):
+    return os.path.join(ARCHIVE_DIR, f"{table}-{month}.db")
+
+
+def _open_archive(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chunks(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sensor_id TEXT,
+            first_timestamp TEXT,
+            last_timestamp TEXT,
+            row_count INTEGER,
+            payload BLOB
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_sensor_time ON chunks(sensor_id, first_timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_time ON chunks(first_timestamp)")
+    return conn
+
+
+def _encode(columns, rows):
+    payload = {name: [row[i] for row in rows] for i, name in enumerate(columns)}
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def _decode(payload):
+    columns = json.loads(zlib.decompress(payload).decode("utf-8"))
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*(columns[name] for name in names))]
+
+
+def _write_chunks(table, columns, rows):
+    """
+    Append rows to their month archive files. Each sensor's newest chunk in
+    the month is topped up to ARCHIVE_CHUNK_ROWS before a new one is started,
+    so a pass over many sensors does not leave a chunk per sensor per pass.
+    """
+    sensor_index = columns.index("sensor_id")
+    timestamp_index = columns.index("timestamp")
+    id_index = columns.index("id")
+
+    groups = {}
+    for row in rows:
+        month = str(row[timestamp_index])[:7]
+        groups.setdefault(month, {}).setdefault(row[sensor_index], []).append(row)
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for month, sensors in groups.items():
+        conn = _open_archive(archive_path(table, month))
+        try:
+            for sensor_id, sensor_rows in sensors.items():
+                open_chunk = conn.execute(
+                    "SELECT id, payload FROM chunks WHERE sensor_id = ? AND row_count < ? ORDER BY id DESC LIMIT 1",
+                    (sensor_id, ARCHIVE_CHUNK_ROWS)
+                ).fetchone()
+                if open_chunk is not None:
+                    archived = [tuple(row[name] for name in columns) for row in _decode(open_chunk["payload"])]
+                    # Rows left behind by an interrupted pass are archived again
+                    archived_ids = {row[id_index] for row in archived}
+                    sensor_rows = archived + [row for row in sensor_rows if row[id_index] not in archived_ids]
+                    conn.execute("DELETE FROM chunks WHERE id = ?", (open_chunk["id"],))
+                sensor_rows.sort(key=lambda row: (str(row[timestamp_index]), row[id_index]))
+
+                conn.executemany(
+                    "INSERT INTO chunks(sensor_id, first_timestamp, last_timestamp, row_count, payload) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (
+                            sensor_id,
+                            str(chunk_rows[0][timestamp_index]),
+                            str(chunk_rows[-1][timestamp_index]),
+                            len(chunk_rows),
+                            _encode(columns, chunk_rows)
+                        )
+                        for chunk_rows in (
+                            sensor_rows[start:start + ARCHIVE_CHUNK_ROWS]
+                            for start in range(0, len(sensor_rows), ARCHIVE_CHUNK_ROWS)
+                        )
+                    ]
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def archive_table(read_conn, write_conn, table, days, now=None, max_chunks=None):
+    """
+    Move rows older than `days` from `table` into the archive, a chunk at a time.
+    Archive files are written before the rows are deleted, each delete is its
+    own short transaction, and the history reader ignores duplicate ids, so an
+    interrupted pass never loses rows. Returns the number of rows moved.
+    """
+    if days <= 0:
+        return 0
+
+    cutoff = cutoff_for(days, now)
+    moved = 0
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        cursor = read_conn.execute(
+            f"SELECT * FROM {table} WHERE timestamp < ? ORDER BY timestamp LIMIT ?",
+            (cutoff, RETENTION_CHUNK_SIZE)
+        )
+        columns = [description[0] for description in cursor.description]
+        rows = [tuple(row) for row in cursor.fetchall()]
+        if not rows:
+            break
+
+        _write_chunks(table, columns, rows)
+
+        id_index = columns.index("id")
+        ids = [(row[id_index],) for row in rows]
+        write_conn.executemany(f"DELETE FROM {table} WHERE id = ?", ids)
+        write_conn.execute(
+            "UPDATE stats_counters SET value = value - ? WHERE name = ?",
+            (len(ids), table)
+        )
+        write_conn.commit()
+
+        moved += len(rows)
+        chunks += 1
+        if len(rows) < RETENTION_CHUNK_SIZE:
+            break
+        time.sleep(RETENTION_PAUSE_MS / 1000)
+
+    return moved
+
+
+def run_retention(read_conn, write_conn, now=None):
+    """Apply every retention policy. Returns {table: rows_moved}."""
+    return {
+        table: archive_table(read_conn, write_conn, table, days, now)
+        for table, days in RETENTION_POLICIES.items()
+    }
+
+
+def archived_months(table):
+    """'YYYY-MM' keys of the table's archive files, oldest first"""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    prefix = f"{table}-"
+    return sorted(
+        name[len(prefix):-3] for name in os.listdir(ARCHIVE_DIR)
+        if name.startswith(prefix) and name.endswith(".db") and len(name) == len(prefix) + 10
+    )
+
+
+def _months_between(start, end):
+    """'YYYY-MM' keys from start to end timestamp strings inclusive"""
+    year, month = int(start[0:4]), int(start[5:7])
+    last_year, last_month = int(end[0:4]), int(end[5:7])
+    while (year, month) <= (last_year, last_month):
+        yield f"{year:04d}-{month:02d}"
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+
+def read_archived(table, start, end, sensor_id=None):
+    """
+    Archived rows of `table` with start <= timestamp < end (timestamp strings),
+    optionally for one sensor, oldest first. A generator: chunks are read in
+    first_timestamp order and inflated only once the rows before them have
+    been yielded, so a caller that stops early never decodes the rest.
+    """
+    pending = []  # (timestamp, id, order, row) of decoded chunks, smallest first
+    order = 0
+    last_id = None
+    for month in _months_between(start, end):
+        path = archive_path(table, month)
+        if not os.path.exists(path):
+            continue
+
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            if sensor_id:
+                chunks = conn.execute(
+                    "SELECT first_timestamp, payload FROM chunks "
+                    "WHERE sensor_id = ? AND first_timestamp < ? AND last_timestamp >= ? ORDER BY first_timestamp",
+                    (sensor_id, end, start)
+                )
+            else:
+                chunks = conn.execute(
+                    "SELECT first_timestamp, payload FROM chunks "
+                    "WHERE first_timestamp < ? AND last_timestamp >= ? ORDER BY first_timestamp",
+                    (end, start)
+                )
+            for chunk in chunks:
+                # No chunk still to come holds a row older than this one's first
+                while pending and pending[0][0] < chunk["first_timestamp"]:
+                    _, row_id, _, row = heapq.heappop(pending)
+                    if row_id != last_id:
+                        last_id = row_id
+                        yield row
+                for row in _decode(chunk["payload"]):
+                    if start <= str(row["timestamp"]) < end:
+                        order += 1
+                        heapq.heappush(pending, (str(row["timestamp"]), row["id"], order, row))
+        finally:
+            conn.close()
+
+    # Rows left behind by an interrupted pass sit next to their copy
+    while pending:
+        _, row_id, _, row = heapq.heappop(pending)
+        if row_id != last_id:
+            last_id = row_id
+            yield row
+
+
+def query_history(conn, table, start, end, sensor_id=None, limit=None):
+    """
+    Rows of `table` in [start, end) from the live table and, for the part of
+    the range older than the retention cutoff, the archive. Oldest first.
+    """
+    days = RETENTION_POLICIES.get(table, 0)
+    rows = []
+    if days > 0 and start < cutoff_for(days):
+        rows.extend(itertools.islice(read_archived(table, start, end, sensor_id), limit or None))
+
+    if limit and len(rows) >= limit:
+        return rows[:limit]
+    # Fetch a full `limit` - ids already read from the archive (left behind
+    # by an interrupted retention pass) are dropped below
+    live_limit = limit or -1
+
+    if sensor_id:
+        cursor = conn.execute(
+            f"SELECT * FROM {table} WHERE sensor_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp, id LIMIT ?",
+            (sensor_id, start, end, live_limit)
+        )
+    else:
+        cursor = conn.execute(
+            f"SELECT * FROM {table} WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp, id LIMIT ?",
+            (start, end, live_limit)
+        )
+    seen = {row["id"] for row in rows}
+    rows.extend(dict(row) for row in cursor if row["id"] not in seen)
+
+    return rows[:limit] if limit else rows
@@ -0,0 +1,225 @@
+"""
+Compact binary ingest format for devices that post directly to the backend.
+
+A request body is one or more frames back to back. Each frame carries many
+samples from one device as scaled int16 levels, so a reading costs two
+bytes on the wire and the server decodes a whole frame with one array
+conversion instead of parsing JSON per reading. All integers are
+little-endian (the ESP32's native order):
+
+    offset   size  field
+    0        2     magic b"FL"
+    2        1     format version (1)
+    3        1     channels per sample, 1-16 (channel c is stored as pin Vc)
+    4        1     device id length n, 1-64
+    5        n     device id, UTF-8
+    5+n      4     sequence number (uint32), increasing per frame
+    9+n      4     time of the first sample, Unix seconds (uint32);
+                   0 = device has no clock, last sample taken on arrival
+    13+n     2     seconds between samples (uint16)
+    15+n     2     scale divisor (uint16), level = value / scale
+    17+n     2     sample count (uint16)
+    19+n     2*c*k levels (int16), sample by sample; -32768 = no value
+    ...      4     CRC-32 of all the bytes before it (uint32)
+
+A frame whose sequence number and start time are not newer than the last
+frame stored for the device is a retransmission and is skipped. A timed
+device that restarts its sequence after a reboot is still accepted because
+its clock has moved on. An untimed frame is judged by its sequence alone:
+one more than RESTART_WINDOW behind the last stored frame is taken as a
+restarted counter, not a retransmission, so devices should not resend
+frames older than that.
+"""
+import array
+import collections
+import struct
+import sys
+import time
+import zlib
+
+from fleet import sensor_id_for
+from ingest import TIMESTAMP_FORMAT
+
+MAGIC = b"FL"
+VERSION = 1
+MISSING = -32768
+MAX_CHANNELS = 16
+MAX_DEVICE_ID = 64
+RESTART_WINDOW = 256
+CONTENT_TYPE = "application/octet-stream"
+
+_PREFIX = struct.Struct("<2sBBB")
+_FIELDS = struct.Struct("<IIHHH")
+_CRC = struct.Struct("<I")
+
+Frame = collections.namedtuple(
+    "Frame", ["device_id", "sequence", "timestamp", "interval", "scale", "channels", "levels"]
+)
+
+
+def encode_frame(device_id, sequence, timestamp, samples, interval=1, scale=100):
+    """
+    Reference encoder. samples is a list of levels (one channel) or of
+    per-channel lists; None marks a missing value. Levels are multiplied
+    by scale and rounded. Raises ValueError for values that do not fit.
+    """
+    device = device_id.encode("utf-8")
+    if not 1 <= len(device) <= MAX_DEVICE_ID:
+        raise ValueError(f"device id must be 1-{MAX_DEVICE_ID} bytes")
+    rows = [sample if isinstance(sample, (list, tuple)) else [sample] for sample in samples]
+    channels = len(rows[0]) if rows else 1
+    if not 1 <= channels <= MAX_CHANNELS or any(len(row) != channels for row in rows):
+        raise ValueError(f"every sample needs the same number of channels (1-{MAX_CHANNELS})")
+    if len(rows) > 0xFFFF:
+        raise ValueError("at most 65535 samples per frame")
+
+    levels = array.array("h")
+    for row in rows:
+        for level in row:
+            if level is None:
+                levels.append(MISSING)
+                continue
+            value = int(round(level * scale))
+            if not MISSING < value <= 32767:
+                raise ValueError(f"level {level} does not fit an int16 at scale {scale}")
+            levels.append(value)
+    if sys.byteorder == "big":
+        levels.byteswap()
+
+    body = b"".join([
+        _PREFIX.pack(MAGIC, VERSION, channels, len(device)),
+        device,
+        _FIELDS.pack(sequence, int(timestamp), interval, scale, len(rows)),
+        levels.tobytes()
+    ])
+    return body + _CRC.pack(zlib.crc32(body))
+
+
+def decode_frames(data, max_levels=None):
+    """
+    Split a request body into frames. Returns (frames, errors): a frame
+    with a bad checksum or field is reported as {"index", "error"} and
+    skipped; a body that cannot be split further stops decoding there.
+    """
+    view = memoryview(data)
+    frames = []
+    errors = []
+    offset = 0
+    total_levels = 0
+    index = 0
+    while offset < len(view):
+        start = offset
+        try:
+            if len(view) - offset < _PREFIX.size:
+                raise ValueError("truncated frame header")
+            magic, version, channels, id_length = _PREFIX.unpack_from(view, offset)
+            if magic != MAGIC:
+                raise ValueError("bad magic, not a frame")
+            if version != VERSION:
+                raise ValueError(f"unsupported frame version {version}")
+            offset += _PREFIX.size
+            if len(view) - offset < id_length + _FIELDS.size:
+                raise ValueError("truncated frame header")
+            device_id = bytes(view[offset:offset + id_length]).decode("utf-8")
+            offset += id_length
+            sequence, timestamp, interval, scale, count = _FIELDS.unpack_from(view, offset)
+            offset += _FIELDS.size
+            levels_size = 2 * channels * count
+            if len(view) - offset < levels_size + _CRC.size:
+                raise ValueError("truncated frame body")
+        except (ValueError, UnicodeDecodeError) as e:
+            # Without a trustworthy length the next frame cannot be found
+            errors.append({"index": index, "error": str(e)})
+            break
+
+        levels_end = offset + levels_size
+        offset = levels_end + _CRC.size
+        try:
+            (crc,) = _CRC.unpack_from(view, levels_end)
+            if zlib.crc32(view[start:levels_end]) != crc:
+                raise ValueError("checksum mismatch")
+            if not 1 <= channels <= MAX_CHANNELS or not 1 <= id_length <= MAX_DEVICE_ID:
+                raise ValueError("channels or device id length out of range")
+            if scale == 0:
+                raise ValueError("scale must not be 0")
+            total_levels += channels * count
+            if max_levels is not None and total_levels > max_levels:
+                raise ValueError(f"too many samples in one request (max {max_levels})")
+
+            levels = array.array("h")
+            levels.frombytes(view[levels_end - levels_size:levels_end])
+            if sys.byteorder == "big":
+                levels.byteswap()
+            frames.append(Frame(device_id, sequence, timestamp, interval, scale, channels, levels))
+        except ValueError as e:
+            errors.append({"index": index, "device_id": device_id, "sequence": sequence, "error": str(e)})
+        index += 1
+    return frames, errors
+
+
+def frame_readings(frame, received_at=None):
+    """(sensor_id, water_level, timestamp) readings of a frame, missing values skipped"""
+    count = len(frame.levels) // frame.channels
+    start = frame.timestamp
+    if not start:
+        start = (received_at or time.time()) - (count - 1) * frame.interval
+    sensor_ids = [sensor_id_for(frame.device_id, f"V{channel}") for channel in range(frame.channels)]
+    scale = float(frame.scale)
+
+    readings = []
+    for sample in range(count):
+        timestamp = time.strftime(TIMESTAMP_FORMAT, time.gmtime(start + sample * frame.interval))
+        base = sample * frame.channels
+        for channel, sensor_id in enumerate(sensor_ids):
+            value = frame.levels[base + channel]
+            if value != MISSING:
+                readings.append((sensor_id, value / scale, timestamp))
+    return readings
+
+
+def new_frames(conn, frames):
+    """
+    Frames not stored before, by each device's last (sequence, timestamp).
+    Returns (frames, duplicates).
+    """
+    devices = sorted({frame.device_id for frame in frames})
+    last = {}
+    if devices:
+        placeholders = ",".join("?" * len(devices))
+        for row in conn.execute(
+            f"SELECT device_id, sequence, timestamp FROM ingest_sequences WHERE device_id IN ({placeholders})",
+            devices
+        ):
+            last[row["device_id"]] = (row["sequence"], row["timestamp"])
+
+    accepted = []
+    duplicates = 0
+    for frame in frames:
+        previous = last.get(frame.device_id)
+        if previous is not None and frame.sequence <= previous[0] and frame.timestamp <= previous[1]:
+            # Untimed frames (timestamp 0) are judged by sequence alone; a
+            # large step back means the device lost its counter
+            if frame.timestamp or previous[0] - frame.sequence <= RESTART_WINDOW:
+                duplicates += 1
+                continue
+        accepted.append(frame)
+        last[frame.device_id] = (frame.sequence, frame.timestamp)
+    return accepted, duplicates
+
+
+def record_sequences(conn, frames):
+    """Remember the newest stored frame per device (caller commits)"""
+    newest = {}
+    for frame in frames:
+        newest[frame.device_id] = frame
+    conn.executemany(
+        """
+        INSERT INTO ingest_sequences(device_id, sequence, timestamp, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(device_id) DO UPDATE SET
+            sequence = excluded.sequence,
+            timestamp = excluded.timestamp,
+            updated_at = excluded.updated_at
+        """,
+        [(frame.device_id, frame.sequence, frame.timestamp) for frame in newest.values()]
+    )
@@ -0,0 +1,128 @@
+"""
+Client for the Blynk HTTP external API.
+
+One pooled requests.Session is shared by the background poller and the
+fetch endpoints, so repeated polls reuse keep-alive TCP/TLS connections.
+Connection errors, timeouts and 429/5xx answers are retried with
+exponential backoff. Several pins are read with a single multi-pin call:
+GET /external/api/get?token=...&V0&V1&V9 answers {"V0": ..., "V1": ..., ...}.
+"""
+import json
+import time
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
+from metrics import BLYNK_REQUEST_SECONDS, BLYNK_ERRORS, BLYNK_ERROR_KINDS
+
+_ERRORS = {kind: BLYNK_ERRORS.labels(kind) for kind in BLYNK_ERROR_KINDS}
+
+
+def status_kind(status_code):
+    """BLYNK_ERRORS kind for a non-200 status code"""
+    if 400 <= status_code < 500:
+        return "http_4xx"
+    if 500 <= status_code < 600:
+        return "http_5xx"
+    return "http_other"
+
+
+class BlynkError(Exception):
+    """Non-200 answer from the Blynk API"""
+
+    def __init__(self, status_code, details):
+        super().__init__(f"Blynk API returned status code {status_code}")
+        self.status_code = status_code
+        self.details = details
+
+
+def parse_value(value):
+    """Number if the pin value is numeric, otherwise the value as given"""
+    if isinstance(value, list) and len(value) == 1:
+        value = value[0]
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+class BlynkClient:
+    def __init__(self, base_url, timeout=10, retries=3, backoff=0.5, pool_size=10):
+        self.base_url = base_url
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            # Hand the last error response back instead of raising
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _get(self, token, pins):
+        query = "&".join([f"token={quote(token, safe='')}"] + [quote(pin.strip(), safe='') for pin in pins])
+        started = time.perf_counter()
+        try:
+            response = self.session.get(f"{self.base_url}?{query}", timeout=self.timeout)
+        except requests.exceptions.Timeout:
+            _ERRORS["timeout"].inc()
+            raise
+        except requests.exceptions.ConnectionError as e:
+            # Read timeouts that used up the retries arrive wrapped in a ConnectionError
+            if isinstance(getattr(e.args[0] if e.args else None, "reason", None), ReadTimeoutError):
+                _ERRORS["timeout"].inc()
+                raise requests.exceptions.ReadTimeout(*e.args, request=e.request, response=e.response) from e
+            _ERRORS["connection"].inc()
+            raise
+        except requests.exceptions.RequestException:
+            _ERRORS["request"].inc()
+            raise
+        finally:
+            BLYNK_REQUEST_SECONDS.observe(time.perf_counter() - started)
+        if response.status_code != 200:
+            _ERRORS[status_kind(response.status_code)].inc()
+            raise BlynkError(response.status_code, response.text)
+        return response.text
+
+    def get_pin(self, token, pin):
+        """One pin's value (float when numeric)"""
+        return parse_value(self._get(token, [pin]))
+
+    def get_pins(self, token, pins):
+        """
+        Several pins in one request. Returns {pin: value}; pins the device
+        has never written are missing from the result.
+        """
+        pins = [pin.strip() for pin in pins]
+        if len(pins) == 1:
+            return {pins[0]: self.get_pin(token, pins[0])}
+
+        body = self._get(token, pins)
+        try:
+            values = json.loads(body)
+        except ValueError:
+            raise BlynkError(200, f"Unexpected multi-pin response: {body[:200]}")
+        if not isinstance(values, dict):
+            raise BlynkError(200, f"Unexpected multi-pin response: {body[:200]}")
+        return {pin: parse_value(values[pin]) for pin in pins if pin in values}
+
+    def close(self):
+        self.session.close()
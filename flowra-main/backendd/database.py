@@ -1,6 +1,230 @@
+import os
+import queue
 import sqlite3
+import threading
+import time
 
-def get_db():
-    conn=sqlite3.connect("water_alert.db")
-    conn.row_factory=sqlite3.Row
+from metrics import DB_QUERY_SECONDS, query_labels
+
+# Absolute path so the app, scripts and background jobs all hit the same file
+# regardless of the working directory they were started from
+DB_PATH = os.path.abspath(os.getenv(
+    'DATABASE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'water_alert.db')
+))
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))  # Idle connections kept per pool
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))  # Wait this long on a locked database
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '65536'))  # Page cache per connection
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))  # Memory-mapped I/O size in bytes
+
+
+def _apply_pragmas(conn):
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def _connect_writer(path):
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    # WAL lets readers keep going while a writer commits; NORMAL is durable
+    # across application crashes and only fsyncs at checkpoints
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    _apply_pragmas(conn)
     return conn
+
+
+def _connect_reader(path):
+    conn = sqlite3.connect(
+        f"file:{path}?mode=ro",
+        uri=True,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False
+    )
+    _apply_pragmas(conn)
+    return conn
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a pooled sqlite3 connection.
+    Behaves like sqlite3.Connection, but close() hands the connection back
+    to its pool instead of closing it, so existing get_db()/close() call
+    sites keep working unchanged.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._connection(), name)
+
+    def _connection(self):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return conn
+
+    # Timed for /metrics: statement execution (not fetching) and commits
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return self._connection().execute(sql, parameters)
+        finally:
+            DB_QUERY_SECONDS.labels(*query_labels(sql)).observe(time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return self._connection().executemany(sql, seq_of_parameters)
+        finally:
+            DB_QUERY_SECONDS.labels(*query_labels(sql)).observe(time.perf_counter() - started)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return self._connection().commit()
+        finally:
+            DB_QUERY_SECONDS.labels("COMMIT", "").observe(time.perf_counter() - started)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """LIFO pool of reusable SQLite connections for one database file"""
+
+    def __init__(self, path, connect, size=DB_POOL_SIZE):
+        self.path = path
+        self._connect = connect
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _check_fork(self):
+        # Connections must never cross a fork (e.g. gunicorn pre-fork workers)
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle = queue.LifoQueue(maxsize=self._idle.maxsize)
+                    self._pid = os.getpid()
+
+    def acquire(self):
+        self._check_fork()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        if self._pid != os.getpid():
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_write_pool = ConnectionPool(DB_PATH, _connect_writer)
+_read_pool = ConnectionPool(DB_PATH, _connect_reader)
+
+
+def get_db():
+    """Read/write connection from the pool. Call close() to return it."""
+    return _write_pool.acquire()
+
+
+def get_read_db():
+    """
+    Read-only connection for GET endpoints.
+    In WAL mode these never wait on ingest writers.
+    """
+    try:
+        return _read_pool.acquire()
+    except sqlite3.OperationalError:
+        # Database file not created yet - fall back to the writer pool
+        return _write_pool.acquire()
+
+
+_version_conn = None
+_version_pid = None
+_version_lock = threading.Lock()
+
+
+def data_version():
+    """
+    A value that changes whenever any connection, in this process or
+    another, commits to the database: PRAGMA data_version read from a
+    connection that never writes. Lets a worker notice other workers' writes.
+    """
+    global _version_conn, _version_pid
+    with _version_lock:
+        if _version_conn is None or _version_pid != os.getpid():
+            _version_conn = _connect_reader(DB_PATH)
+            _version_pid = os.getpid()
+        return _version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def shared_version(name):
+    """
+    The shared_versions value of name (0 if unset), read on the same
+    connection as data_version(). Lets a single server process notice
+    writes from a manage.py command without re-reading on every commit.
+    """
+    global _version_conn, _version_pid
+    with _version_lock:
+        if _version_conn is None or _version_pid != os.getpid():
+            _version_conn = _connect_reader(DB_PATH)
+            _version_pid = os.getpid()
+        row = _version_conn.execute("SELECT version FROM shared_versions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+
+def bump_shared_version(conn, name):
+    """Increment a shared_versions row (caller commits)"""
+    conn.execute(
+        """
+        INSERT INTO shared_versions(name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+        """,
+        (name,)
+    )
+
+
+def close_all():
+    """Close every idle pooled connection (used on shutdown)"""
+    global _version_conn
+    _write_pool.close_all()
+    _read_pool.close_all()
+    with _version_lock:
+        if _version_conn is not None and _version_pid == os.getpid():
+            _version_conn.close()
+        _version_conn = None
@@ -0,0 +1,213 @@
+"""
+In-process publish/subscribe hub behind the Server-Sent Events stream.
+
+Ingest paths publish small deltas (new readings, alerts, sensor changes)
+after their transaction commits; every open /api/stream connection has a
+bounded queue that the hub pushes into. A slow client whose queue fills up
+is dropped and reconnects with Last-Event-ID, replaying from a short
+in-memory backlog, so one stalled browser never slows down ingest.
+
+A hub only sees what its own process publishes. When several server
+processes share the database, a CommitRelay in each of them tails the
+tables by id and publishes the rows the other processes committed.
+"""
+import collections
+import itertools
+import json
+import queue
+import threading
+
+
+class Subscriber:
+    """One SSE connection's queue of (event_id, event_type, data_json)"""
+
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = False
+
+    def get(self, timeout):
+        """Next event, or None on timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventHub:
+    def __init__(self, max_queue=1000, backlog=1000):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._backlog = collections.deque(maxlen=backlog)
+        self.max_queue = max_queue
+        self.published_total = 0
+        self.dropped_total = 0
+
+    def subscribe(self, last_event_id=None):
+        """
+        Register a new subscriber. With last_event_id, events published after
+        it are replayed if still in the backlog; returns (subscriber, resync)
+        where resync tells the client to reload full state instead.
+        """
+        subscriber = Subscriber(self.max_queue)
+        resync = False
+        with self._lock:
+            if last_event_id is not None:
+                missed = [event for event in self._backlog if event[0] > last_event_id]
+                oldest = self._backlog[0][0] if self._backlog else None
+                # Events between last_event_id and the backlog start are gone
+                resync = oldest is not None and oldest > last_event_id + 1
+                for event in missed[-self.max_queue:]:
+                    subscriber.queue.put_nowait(event)
+            self._subscribers.add(subscriber)
+        return subscriber, resync
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event_type, data):
+        """Serialize once and fan out to every subscriber without blocking"""
+        with self._lock:
+            event = (next(self._ids), event_type, json.dumps(data, default=str))
+            self._backlog.append(event)
+            self.published_total += 1
+            for subscriber in list(self._subscribers):
+                try:
+                    subscriber.queue.put_nowait(event)
+                except queue.Full:
+                    subscriber.dropped = True
+                    self._subscribers.discard(subscriber)
+                    self.dropped_total += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published_total": self.published_total,
+                "dropped_total": self.dropped_total,
+                "backlog": len(self._backlog)
+            }
+
+
+class CommitRelay:
+    """
+    Publishes rows committed by other processes to a local hub.
+
+    feeds maps an event type to (last_id(), fetch(after_id, limit) -> rows)
+    where rows are dicts with an "id", in id order. Every interval the relay
+    reads version(), which must change on any commit in any process (e.g.
+    database.data_version); when it has, each feed is read past the last id
+    seen and the rows this process did not claim are published as
+    {"count": n, "<event type>": rows}. One poll reads at most
+    max_rows_per_event rows per feed: a relay far behind skips to the newest
+    ones, as a single event would only carry those anyway.
+
+    Local writes commit through commit() so their rows are claimed as soon
+    as they are visible. The relay reads without the lock and only takes it
+    to filter out claimed rows, so a large catch-up never holds up a commit.
+    """
+
+    def __init__(self, hub, version, feeds, interval=0.5, max_rows_per_event=200):
+        self.hub = hub
+        self._version = version
+        self._feeds = feeds
+        self.interval = interval
+        self.max_rows_per_event = max_rows_per_event
+        self._lock = threading.Lock()
+        self._cursors = {}
+        self._own = {event_type: set() for event_type in feeds}
+        self._last_version = None
+        self._stopping = threading.Event()
+        self._thread = None
+        self.relayed_total = 0
+        self.skipped_total = 0
+        self.failed_total = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._last_version = self._version()
+        cursors = {event_type: last_id() for event_type, (last_id, _) in self._feeds.items()}
+        with self._lock:
+            self._cursors = cursors
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="stream-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def commit(self, commit, **row_ids):
+        """
+        Run commit() and claim row_ids ({event type: ids}) as published
+        locally. The relay filters rows under the same lock, so any row it
+        has read is claimed by then if it is ours.
+        """
+        if not self.running:
+            return commit()
+        with self._lock:
+            result = commit()
+            for event_type, ids in row_ids.items():
+                self._own[event_type].update(ids)
+            return result
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                self.failed_total += 1
+                print(f"[STREAM] Relaying other processes' commits failed: {e}")
+
+    def poll(self):
+        """Publish what other processes committed since the last call"""
+        version = self._version()
+        if version == self._last_version:
+            return
+        # Rows committed after this point change the version again
+        self._last_version = version
+        for event_type, (last_id, fetch) in self._feeds.items():
+            self._relay(event_type, last_id, fetch)
+
+    def _relay(self, event_type, last_id, fetch):
+        """Publish the feed's rows from the cursor up to its current last id"""
+        cursor = self._cursors[event_type]
+        newest = last_id()
+        skipped_to = cursor
+        if newest - cursor > self.max_rows_per_event:
+            skipped_to = newest - self.max_rows_per_event
+        rows = fetch(skipped_to, self.max_rows_per_event) if newest > cursor else []
+
+        with self._lock:
+            own = self._own[event_type]
+            skipped = skipped_to - cursor - sum(1 for row_id in own if cursor < row_id <= skipped_to)
+            relayed = [row for row in rows if row["id"] not in own]
+            new_cursor = rows[-1]["id"] if rows else skipped_to
+            # Claims at or below the cursor are done, or were never stored
+            own.difference_update([row_id for row_id in own if row_id <= new_cursor])
+            self._cursors[event_type] = new_cursor
+
+        count = skipped + len(relayed)
+        if count:
+            self.relayed_total += len(relayed)
+            self.skipped_total += skipped
+            self.hub.publish(event_type, {"count": count, event_type: relayed})
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self.running,
+                "cursors": dict(self._cursors),
+                "relayed_total": self.relayed_total,
+                "skipped_total": self.skipped_total,
+                "failed_total": self.failed_total
+            }
+
+
+def format_event(event):
+    """SSE wire format for an (event_id, event_type, data_json) tuple"""
+    event_id, event_type, data = event
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
@@ -0,0 +1,195 @@
+"""
+Local stand-in for the Blynk HTTP external API, for load tests of the
+polling paths (/api/fetch-blynk, /api/store-reading and the fleet poller).
+
+It answers GET /external/api/get?token=...&V0&V1&V9 like blynk.cloud: one
+pin as a bare value, several pins as a JSON object. Values are encoded the
+way the ESP32 sketches send them (level * 100) and wander per token and
+pin; the heartbeat pin answers the current Unix time, or an hour ago for
+tokens marked offline. Latency, a share of 5xx answers or a fixed number
+of failures can be injected to see how the backend copes with a slow or
+flaky upstream. With a token list, other tokens get Blynk's 400 answer.
+
+Usage:
+    python fake_blynk.py --port 9444 --latency-ms 30 --error-rate 0.01
+    BLYNK_BASE_URL=http://127.0.0.1:9444/external/api/get python app.py
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, unquote
+
+API_PATH = "/external/api/get"
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients (the backend's pooled sessions) hang up when they exit
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeBlynk:
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0, error_rate=0.0,
+                 heartbeat_pin="V9", seed=None, tokens=None):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.heartbeat_pin = heartbeat_pin
+        # None accepts any token
+        self.tokens = set(tokens) if tokens is not None else None
+        self.offline_tokens = set()
+        self.requests_total = 0
+        self.errors_total = 0
+        self.connections_total = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._fail_next = []
+        self._levels = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        """Value for BLYNK_BASE_URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{API_PATH}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-blynk", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests_total": self.requests_total,
+                "errors_total": self.errors_total,
+                "connections_total": self.connections_total,
+                "max_in_flight": self.max_in_flight
+            }
+
+    def fail_next(self, count, status=503):
+        """Answer the next count requests with status"""
+        with self._lock:
+            self._fail_next.extend([status] * count)
+
+    def _level(self, token, pin):
+        """Next encoded level for a pin: a random walk that now and then crosses 70 cm"""
+        with self._lock:
+            level = self._levels.get((token, pin))
+            if level is None:
+                level = self._random.uniform(10, 60)
+            level = min(100.0, max(0.0, level + self._random.gauss(0, 2)))
+            self._levels[(token, pin)] = level
+            return int(round(level * 100))
+
+    def answer(self, token, pins):
+        """(status, body) for a request; also counts it"""
+        with self._lock:
+            self.requests_total += 1
+            failed = self._fail_next.pop(0) if self._fail_next else None
+            if failed is None and self.error_rate and self._random.random() < self.error_rate:
+                failed = 503
+            if failed:
+                self.errors_total += 1
+        if failed:
+            return failed, json.dumps({"error": {"message": "Service unavailable"}})
+        if not token or (self.tokens is not None and token not in self.tokens):
+            return 400, json.dumps({"error": {"message": "Invalid token."}})
+
+        values = {}
+        for pin in pins:
+            if pin == self.heartbeat_pin:
+                values[pin] = int(time.time()) - (3600 if token in self.offline_tokens else 0)
+            else:
+                values[pin] = self._level(token, pin)
+        if len(pins) == 1:
+            return 200, str(values[pins[0]])
+        return 200, json.dumps(values)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections_total += 1
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                if parts.path != API_PATH:
+                    self._send(404, json.dumps({"error": {"message": "Not found"}}))
+                    return
+                token = None
+                pins = []
+                for item in parts.query.split("&"):
+                    key, _, value = item.partition("=")
+                    key = unquote(key)
+                    if key == "token":
+                        token = unquote(value)
+                    elif key:
+                        pins.append(key)
+                with fake._lock:
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                try:
+                    if fake.latency_ms:
+                        time.sleep(fake.latency_ms / 1000.0)
+                    self._send(*fake.answer(token, pins or ["V0"]))
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+            def _send(self, status, body):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json" if body.startswith(("{", "[")) else "text/plain")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Blynk external API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9444)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--heartbeat-pin", default="V9", help="Pin that answers the current Unix time")
+    args = parser.parse_args(argv)
+
+    fake = FakeBlynk(args.host, args.port, args.latency_ms, args.error_rate, args.heartbeat_pin).start()
+    print(f"[FAKE BLYNK] Serving {fake.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
+        print(f"[FAKE BLYNK] {fake.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+Concurrent poller for a fleet of Blynk devices.
+
+Devices live in the `devices` table, each with its own auth token, pins,
+heartbeat pin and poll interval. One dispatcher thread keeps a heap of
+next-poll times and hands due devices to a bounded worker pool, so a
+thousand devices cost one heap entry each rather than a thread or
+scheduler job each. First polls are spread over each device's interval
+and every reschedule is jittered, so devices never poll in lockstep. A
+device that is offline or failing is backed off exponentially on its own,
+without slowing down the rest of the fleet.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ingest import utc_now
+
+
+def load_devices(conn):
+    """Enabled devices from the registry as {device_id: config}"""
+    devices = {}
+    for row in conn.execute("SELECT * FROM devices WHERE enabled = 1"):
+        devices[row["device_id"]] = {
+            "device_id": row["device_id"],
+            "token": row["token"],
+            "pins": [pin.strip() for pin in (row["pins"] or "").split(",") if pin.strip()],
+            "heartbeat_pin": (row["heartbeat_pin"] or "").strip() or None,
+            "interval_seconds": max(1, row["interval_seconds"]),
+            "value_divisor": row["value_divisor"] or 1
+        }
+    return devices
+
+
+def sensor_id_for(device_id, pin):
+    return f"{device_id}_{pin}"
+
+
+class FleetPoller:
+    """Polls every registered device on its own schedule with bounded concurrency"""
+
+    def __init__(self, client, load_devices, store_readings, max_workers=32, jitter=0.1,
+                 max_backoff=3600, heartbeat_timeout=15, refresh_seconds=60, liveness=None):
+        # load_devices() -> {device_id: config}; store_readings(readings) commits them
+        self._client = client
+        self._liveness = liveness
+        self._load_devices = load_devices
+        self._store_readings = store_readings
+        self.max_workers = max_workers
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.heartbeat_timeout = heartbeat_timeout
+        self.refresh_seconds = refresh_seconds
+
+        self._devices = {}
+        self._stats = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fleet-poll")
+        # Held for each poll in progress, so due devices wait in the heap
+        # rather than piling up in the executor's queue
+        self._slots = threading.Semaphore(max_workers)
+        self._in_flight = 0
+        self._stopping = False
+        self._refresh_due = 0
+        self._thread = None
+
+        self.polls_total = 0
+        self.errors_total = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="fleet-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def refresh(self):
+        """Reload the registry on the dispatcher's next pass (after device changes)"""
+        with self._cond:
+            self._refresh_due = 0
+            self._cond.notify_all()
+
+    def _jittered(self, seconds):
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _schedule(self, device_id, delay):
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), device_id))
+        self._cond.notify_all()
+
+    def _apply_registry(self, devices):
+        with self._cond:
+            for device_id, device in devices.items():
+                if device_id not in self._devices:
+                    self._stats[device_id] = {
+                        "status": "pending",
+                        "polls": 0,
+                        "successes": 0,
+                        "consecutive_failures": 0,
+                        "last_latency_ms": None,
+                        "avg_latency_ms": None,
+                        "last_attempt": None,
+                        "last_success": None,
+                        "last_error": None,
+                        "next_poll": None,
+                        "busy": False
+                    }
+                    # Spread first polls over one interval
+                    self._schedule(device_id, random.uniform(0, device["interval_seconds"]))
+            for device_id in set(self._devices) - set(devices):
+                self._stats.pop(device_id, None)
+            self._devices = devices
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                refresh = time.monotonic() >= self._refresh_due
+                if refresh:
+                    self._refresh_due = time.monotonic() + self.refresh_seconds
+
+            if refresh:
+                try:
+                    self._apply_registry(self._load_devices())
+                except Exception as e:
+                    print(f"[FLEET ERROR] Failed to load device registry: {str(e)}")
+
+            with self._cond:
+                now = time.monotonic()
+                wait = self._refresh_due - now
+                if self._heap:
+                    wait = min(wait, self._heap[0][0] - now)
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                if not self._heap or self._heap[0][0] > now:
+                    continue
+                _, _, device_id = heapq.heappop(self._heap)
+                device = self._devices.get(device_id)
+                stats = self._stats.get(device_id)
+                # Removed from the registry, or already being polled
+                if device is None or stats is None or stats["busy"]:
+                    continue
+                stats["busy"] = True
+
+            self._slots.acquire()
+            with self._cond:
+                self._in_flight += 1
+            self._executor.submit(self._poll, device)
+
+    def _poll(self, device):
+        device_id = device["device_id"]
+        started = time.monotonic()
+        error = None
+        status = "online"
+        try:
+            heartbeat_pin = device["heartbeat_pin"]
+            pins = ([heartbeat_pin] if heartbeat_pin else []) + device["pins"]
+            values = self._client.get_pins(device["token"], pins)
+
+            if heartbeat_pin:
+                heartbeat = values.get(heartbeat_pin)
+                if isinstance(heartbeat, float) and self._liveness is not None:
+                    self._liveness.record_heartbeat(device_id, heartbeat, "poll")
+                if not isinstance(heartbeat, float) or time.time() - heartbeat > self.heartbeat_timeout:
+                    status = "offline"
+
+            if status == "online":
+                timestamp = utc_now()
+                readings = [
+                    (sensor_id_for(device_id, pin), values[pin] / device["value_divisor"], timestamp)
+                    for pin in device["pins"]
+                    if isinstance(values.get(pin), float)
+                ]
+                if readings:
+                    self._store_readings(readings)
+        except Exception as e:
+            status = "error"
+            error = str(e)
+        finally:
+            latency_ms = round((time.monotonic() - started) * 1000, 1)
+            self._finish(device, status, error, latency_ms)
+
+    def _finish(self, device, status, error, latency_ms):
+        device_id = device["device_id"]
+        with self._cond:
+            # Reschedule with the current registry entry (interval may have changed)
+            device = self._devices.get(device_id, device)
+            self.polls_total += 1
+            self._in_flight -= 1
+            stats = self._stats.get(device_id)
+            if stats is not None:
+                stats["busy"] = False
+                stats["status"] = status
+                stats["polls"] += 1
+                stats["last_attempt"] = utc_now()
+                stats["last_latency_ms"] = latency_ms
+                stats["avg_latency_ms"] = latency_ms if stats["avg_latency_ms"] is None \
+                    else round(stats["avg_latency_ms"] * 0.8 + latency_ms * 0.2, 1)
+
+                if status == "online":
+                    stats["successes"] += 1
+                    stats["consecutive_failures"] = 0
+                    stats["last_success"] = stats["last_attempt"]
+                    stats["last_error"] = None
+                    delay = device["interval_seconds"]
+                else:
+                    if status == "error":
+                        self.errors_total += 1
+                        stats["last_error"] = error
+                    stats["consecutive_failures"] += 1
+                    # Exponential backoff per device, capped
+                    delay = min(
+                        device["interval_seconds"] * 2 ** min(stats["consecutive_failures"], 16),
+                        max(self.max_backoff, device["interval_seconds"])
+                    )
+
+                delay = self._jittered(delay)
+                stats["next_poll"] = time.time() + delay
+                if device_id in self._devices:
+                    self._schedule(device_id, delay)
+        self._slots.release()
+
+    def stats(self):
+        with self._cond:
+            devices = []
+            for device_id, stats in sorted(self._stats.items()):
+                entry = {key: value for key, value in stats.items() if key not in ("busy", "next_poll")}
+                entry["device_id"] = device_id
+                entry["next_poll_in_seconds"] = round(max(0, stats["next_poll"] - time.time()), 1) \
+                    if stats["next_poll"] is not None else None
+                devices.append(entry)
+
+            by_status = {}
+            for stats in self._stats.values():
+                by_status[stats["status"]] = by_status.get(stats["status"], 0) + 1
+
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "devices": len(self._stats),
+                "by_status": by_status,
+                "in_flight": self._in_flight,
+                "max_workers": self.max_workers,
+                "polls_total": self.polls_total,
+                "errors_total": self.errors_total,
+                "device_stats": devices
+            }
@@ -0,0 +1,29 @@
+"""
+gunicorn settings for serving the backend from several processes.
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+    WEB_CONCURRENCY=4 GUNICORN_THREADS=16 gunicorn -c gunicorn.conf.py wsgi:app
+
+Every worker serves HTTP; the one holding LEADER_LOCK_PATH also runs the
+scheduled jobs and the fleet poller (see leader.py).
+"""
+import os
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', '5030')}"
+# SQLite takes one writer at a time, so more processes mostly help reads
+workers = int(os.getenv('WEB_CONCURRENCY', min(4, (os.cpu_count() or 1) * 2 + 1)))
+# Threaded workers: every open /api/stream connection holds a thread
+worker_class = "gthread"
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# Each worker imports the app after forking, so no scheduler threads or
+# database connections are inherited across fork()
+preload_app = False
+graceful_timeout = 30
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    # The app enables cross-worker alert and cache sync when this is above 1,
+    # also when the worker count came from -w instead of the environment
+    os.environ['WEB_CONCURRENCY'] = str(server.cfg.workers)
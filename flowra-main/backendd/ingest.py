@@ -0,0 +1,174 @@
+import collections
+import datetime
+import json
+
+import rollups
+import stats
+
+# Same layout SQLite uses for CURRENT_TIMESTAMP, so batch rows sort with the rest
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Row ids assigned to a stored batch, which readings opened an alert episode,
+# and how many open episodes the batch updated
+InsertResult = collections.namedtuple("InsertResult", ["reading_ids", "alert_flags", "alert_ids", "alerts_updated"])
+
+
+def utc_now():
+    """Current UTC time formatted like SQLite's CURRENT_TIMESTAMP"""
+    return datetime.datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+
+
+def normalize_timestamp(value):
+    """
+    Convert a client supplied timestamp to the stored UTC text format.
+    Accepts Unix seconds (int/float/numeric string) or an ISO-8601 string.
+    Returns None when no timestamp was given, raises ValueError when invalid.
+    """
+    if value is None or value == "":
+        return None
+
+    if isinstance(value, bool):
+        raise ValueError("Invalid timestamp")
+
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+            return parsed.strftime(TIMESTAMP_FORMAT)
+
+    if isinstance(value, (int, float)):
+        parsed = datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+        return parsed.strftime(TIMESTAMP_FORMAT)
+
+    raise ValueError("Invalid timestamp")
+
+
+def parse_batch(raw_body, content_type=""):
+    """
+    Parse a batch request body into a list of items.
+    Supports a JSON array, a JSON object with a "readings" array, or NDJSON
+    (one JSON object per line). Raises ValueError on malformed bodies.
+    """
+    text = raw_body.decode("utf-8") if isinstance(raw_body, bytes) else raw_body
+    text = text.strip()
+
+    if not text:
+        raise ValueError("Empty request body")
+
+    is_ndjson = "ndjson" in (content_type or "") or "jsonlines" in (content_type or "")
+
+    if not is_ndjson:
+        try:
+            payload = json.loads(text)
+        except json.JSONDecodeError:
+            # Not a single JSON document - fall back to NDJSON
+            is_ndjson = True
+        else:
+            if isinstance(payload, dict) and isinstance(payload.get("readings"), list):
+                return payload["readings"]
+            if isinstance(payload, list):
+                return payload
+            if isinstance(payload, dict):
+                return [payload]
+            raise ValueError("Expected a JSON array of readings")
+
+    items = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except json.JSONDecodeError:
+            raise ValueError(f"Invalid JSON on line {line_number}")
+    return items
+
+
+def validate_reading(item):
+    """
+    Validate a single batch item.
+    Returns ((sensor_id, water_level, timestamp), None) or (None, error_message)
+    """
+    if not isinstance(item, dict):
+        return None, "Reading must be a JSON object"
+
+    sensor_id = item.get("sensor_id")
+    if not isinstance(sensor_id, str) or not sensor_id.strip():
+        return None, "sensor_id is required"
+
+    water_level = item.get("water_level")
+    if isinstance(water_level, bool):
+        return None, "water_level must be a number"
+    try:
+        water_level = float(water_level)
+    except (TypeError, ValueError):
+        return None, "water_level must be a number"
+    if water_level != water_level or water_level in (float("inf"), float("-inf")):
+        return None, "water_level must be a finite number"
+
+    try:
+        timestamp = normalize_timestamp(item.get("timestamp"))
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None, f"Invalid timestamp: {item.get('timestamp')}"
+
+    return (sensor_id.strip(), water_level, timestamp or utc_now()), None
+
+
+def insert_readings(conn, readings, alert_engine):
+    """
+    Insert validated (sensor_id, water_level, timestamp) tuples, run them
+    through the alert engine, and update the per-sensor latest values and
+    the running dashboard stats and rollups using executemany.
+    The caller owns the transaction and commits once for the whole batch.
+    Returns an InsertResult; reading ids are contiguous because the
+    transaction holds the write lock for the whole batch.
+    """
+    conn.executemany(
+        "INSERT INTO readings(sensor_id, water_level, timestamp) VALUES (?, ?, ?)",
+        readings
+    )
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    reading_ids = list(range(last_id - len(readings) + 1, last_id + 1))
+
+    # Runs after the first insert, so the write lock serializes episodes
+    alert_flags, alert_ids, alerts_updated = alert_engine.process(conn, readings)
+
+    # One upsert per sensor, keeping the newest reading of the batch
+    latest = {}
+    for reading in readings:
+        current = latest.get(reading[0])
+        if current is None or reading[2] >= current[2]:
+            latest[reading[0]] = reading
+    conn.executemany(
+        """
+        INSERT INTO sensor_latest(sensor_id, water_level, timestamp) VALUES (?, ?, ?)
+        ON CONFLICT(sensor_id) DO UPDATE SET
+            water_level = excluded.water_level,
+            timestamp = excluded.timestamp
+        WHERE excluded.timestamp >= sensor_latest.timestamp
+        """,
+        list(latest.values())
+    )
+    stats.record_readings(conn, readings, len(alert_ids))
+    rollups.record_readings(conn, readings)
+
+    return InsertResult(reading_ids, alert_flags, alert_ids, alerts_updated)
+
+
+def rebuild_sensor_latest(conn):
+    """
+    Repopulate sensor_latest from readings (newest reading per sensor).
+    Runs in the caller's transaction. Returns the number of sensors written.
+    """
+    conn.execute("DELETE FROM sensor_latest")
+    # SQLite returns the other columns from the row holding MAX(timestamp)
+    cursor = conn.execute("""
+        INSERT INTO sensor_latest(sensor_id, water_level, timestamp)
+        SELECT sensor_id, water_level, MAX(timestamp)
+        FROM readings
+        GROUP BY sensor_id
+    """)
+    return cursor.rowcount
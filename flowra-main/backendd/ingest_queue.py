@@ -0,0 +1,192 @@
+"""
+Write-behind ingest queue with group commit.
+
+Request handlers validate readings and submit them here instead of writing
+to SQLite themselves. A single writer thread drains the queue and commits
+readings in groups - whenever group_size readings are waiting or
+flush_interval_ms has passed since the first one arrived - so the HTTP
+response no longer waits for a disk fsync. A group that still fails after
+max_retries is split in halves and written again, down to single readings,
+so one bad reading does not take the rest of its group with it.
+"""
+import collections
+import os
+import threading
+import time
+
+
+class IngestQueueFull(Exception):
+    """Raised when the queue cannot accept readings (backpressure)"""
+
+
+class WriteBehindQueue:
+    """Bounded in-process queue drained by one group-committing writer thread"""
+
+    def __init__(self, write_batch, max_size=50000, group_size=1000,
+                 flush_interval_ms=50, enqueue_timeout_ms=0, max_retries=3):
+        # write_batch(readings) must store the readings and commit
+        self._write_batch = write_batch
+        self.max_size = max_size
+        self.group_size = group_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self.max_retries = max_retries
+
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._stopping = False
+        self._thread = None
+        self._pid = None
+
+        # Counters
+        self.enqueued_total = 0
+        self.committed_total = 0
+        self.rejected_total = 0
+        self.failed_total = 0
+        self.batches_committed = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+
+    def _ensure_started(self):
+        # Started lazily so a pre-fork master never owns the writer thread
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, readings):
+        """
+        Queue readings for the writer thread (all or nothing).
+        Blocks up to enqueue_timeout_ms while the queue is full, then raises
+        IngestQueueFull.
+        """
+        readings = list(readings)
+        if not readings:
+            return
+
+        with self._cond:
+            if self._stopping:
+                raise IngestQueueFull("Ingest queue is shutting down")
+            self._ensure_started()
+
+            deadline = time.monotonic() + self.enqueue_timeout
+            while len(self._items) + len(readings) > self.max_size:
+                remaining = deadline - time.monotonic()
+                if len(readings) > self.max_size or remaining <= 0:
+                    self.rejected_total += len(readings)
+                    raise IngestQueueFull(
+                        f"Ingest queue full ({len(self._items)}/{self.max_size} readings waiting)"
+                    )
+                self._cond.wait(remaining)
+
+            self._items.extend(readings)
+            self.enqueued_total += len(readings)
+            self._cond.notify_all()
+
+    def _next_group(self):
+        with self._cond:
+            while not self._items and not self._stopping:
+                self._cond.wait()
+
+            # Give the group a short window to fill up before committing
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._items) < self.group_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            size = min(self.group_size, len(self._items))
+            group = [self._items.popleft() for _ in range(size)]
+            self._in_flight = size
+            # Wake producers waiting for space
+            self._cond.notify_all()
+            return group
+
+    def _write(self, group, attempts):
+        for attempt in range(1, attempts + 1):
+            try:
+                self._write_batch(group)
+                return True
+            except Exception as e:
+                print(f"[INGEST ERROR] Group commit of {len(group)} readings failed (attempt {attempt}/{attempts}): {str(e)}")
+                if attempt < attempts:
+                    time.sleep(0.05 * attempt)
+        return False
+
+    def _commit(self, group, attempts=None):
+        """
+        Write group, retrying it max_retries times, then its halves once
+        each, recursively. Returns the sizes of the batches that committed.
+        """
+        if self._write(group, attempts or self.max_retries):
+            return [len(group)]
+        if len(group) == 1:
+            print(f"[INGEST ERROR] Dropped reading {group[0]}")
+            return []
+        middle = len(group) // 2
+        return self._commit(group[:middle], 1) + self._commit(group[middle:], 1)
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            if group:
+                batches = self._commit(group)
+
+            with self._cond:
+                if group:
+                    committed = sum(batches)
+                    self.committed_total += committed
+                    self.failed_total += len(group) - committed
+                    if batches:
+                        self.batches_committed += len(batches)
+                        self.last_batch_size = batches[-1]
+                        self.max_batch_size = max(self.max_batch_size, *batches)
+                self._in_flight = 0
+                self._cond.notify_all()
+                if self._stopping and not self._items:
+                    return
+
+    def flush(self, timeout=None):
+        """Wait until every queued reading has been committed. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._items or self._in_flight:
+                if self._thread is None or not self._thread.is_alive():
+                    return not self._items
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=30):
+        """Flush pending readings and stop the writer thread (used on shutdown)"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout)
+        if self._items:
+            print(f"[INGEST WARNING] {len(self._items)} queued readings were not written before shutdown")
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": len(self._items),
+                "in_flight": self._in_flight,
+                "max_queue_size": self.max_size,
+                "group_size": self.group_size,
+                "flush_interval_ms": int(self.flush_interval * 1000),
+                "enqueued_total": self.enqueued_total,
+                "committed_total": self.committed_total,
+                "rejected_total": self.rejected_total,
+                "failed_total": self.failed_total,
+                "batches_committed": self.batches_committed,
+                "last_batch_size": self.last_batch_size,
+                "max_batch_size": self.max_batch_size,
+                "avg_batch_size": round(self.committed_total / self.batches_committed, 2) if self.batches_committed else 0
+            }
@@ -0,0 +1,92 @@
+"""
+Leader election among the processes serving one database.
+
+Every worker serves HTTP, but the scheduler's jobs and the fleet poller
+must run in exactly one process, or every job runs once per worker. The
+leader is whichever process holds an exclusive, non-blocking flock() on a
+lock file next to the database. The kernel drops the lock when its holder
+exits or is killed, so a follower that keeps retrying takes over within
+LEADER_RETRY_SECONDS after the leader worker is restarted or recycled.
+
+Platforms without fcntl (Windows, where gunicorn does not run either)
+serve from one process, which is always the leader.
+"""
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class LeaderLock:
+    def __init__(self, path, on_elected, retry_seconds=10):
+        # on_elected() runs once, in the process that wins the lock
+        self.path = path
+        self.retry_seconds = retry_seconds
+        self._on_elected = on_elected
+        self._file = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.is_leader = False
+        self.elected_at = None
+
+    def _try_acquire(self):
+        if fcntl is None:
+            return True
+        lock_file = open(self.path, "a+")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Who holds it, for people looking at the file
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        # Kept open for the life of the process: closing it releases the lock
+        self._file = lock_file
+        return True
+
+    def _elect(self):
+        with self._lock:
+            if self.is_leader or not self._try_acquire():
+                return False
+            self.is_leader = True
+            self.elected_at = time.time()
+        print(f"[LEADER] Process {os.getpid()} holds {self.path}; running scheduled jobs and pollers")
+        self._on_elected()
+        return True
+
+    def start(self):
+        """Take the lock now if it is free, otherwise keep retrying in the background"""
+        if self._elect():
+            return
+        print(f"[LEADER] Process {os.getpid()} is a follower; serving HTTP only")
+        self._thread = threading.Thread(target=self._retry, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def _retry(self):
+        while not self._stopping.wait(self.retry_seconds):
+            if self._elect():
+                return
+
+    def stop(self):
+        self._stopping.set()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.is_leader = False
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "is_leader": self.is_leader,
+            "elected_at": self.elected_at,
+            "lock_path": self.path
+        }
@@ -0,0 +1,172 @@
+"""
+In-memory device liveness cache.
+
+Records, per device, the last heartbeat value (the Unix time the device
+wrote to its heartbeat pin) and the last time any traffic from it arrived.
+It is fed passively by webhooks, ingest requests and the pollers; a status
+check only calls Blynk when nothing has been learned about the device for
+max_age seconds, and at most one such refresh per device runs at a time.
+"""
+import re
+import threading
+import time
+
+# <device_id>_<pin> sensor ids, as written by the webhook and the fleet poller
+_PIN_SUFFIX = re.compile(r"^(.+)_V\d+$")
+
+
+def device_for_sensor(sensor_id):
+    """Device a sensor id belongs to ('drain-42_V0' -> 'drain-42')"""
+    match = _PIN_SUFFIX.match(str(sensor_id))
+    return match.group(1) if match else str(sensor_id)
+
+
+class LivenessCache:
+    def __init__(self, heartbeat_timeout=15, max_age=10, refresh_heartbeat=None, max_devices=100000):
+        # refresh_heartbeat(device_id) -> heartbeat epoch, or None if the
+        # device cannot be queried actively
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_age = max_age
+        self._refresh_heartbeat = refresh_heartbeat
+        self.max_devices = max_devices
+
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._refreshing = {}
+
+        self.lookups = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def _entry(self, device_id):
+        entry = self._devices.get(device_id)
+        if entry is None:
+            if len(self._devices) >= self.max_devices:
+                # Forget the devices heard from least recently
+                oldest = sorted(self._devices, key=lambda key: self._devices[key]["learned_at"])
+                for key in oldest[:max(1, self.max_devices // 10)]:
+                    del self._devices[key]
+            entry = self._devices[device_id] = {
+                "heartbeat": None,
+                "last_seen": None,
+                "learned_at": 0,
+                "checked_at": 0,
+                "source": None,
+                "error": None
+            }
+        return entry
+
+    def record_heartbeat(self, device_id, heartbeat, source):
+        """A heartbeat pin value read from Blynk or received by webhook"""
+        now = time.time()
+        with self._lock:
+            entry = self._entry(device_id)
+            if entry["heartbeat"] is None or heartbeat > entry["heartbeat"]:
+                entry["heartbeat"] = heartbeat
+            entry["learned_at"] = now
+            entry["source"] = source
+            entry["error"] = None
+
+    def record_seen(self, device_id, source):
+        """Any traffic from the device (webhook call, ingest request)"""
+        now = time.time()
+        with self._lock:
+            entry = self._entry(device_id)
+            entry["last_seen"] = now
+            entry["learned_at"] = now
+            entry["source"] = source
+
+    def _snapshot(self, device_id, entry, now):
+        heartbeat_age = now - entry["heartbeat"] if entry["heartbeat"] is not None else None
+        seen_age = now - entry["last_seen"] if entry["last_seen"] is not None else None
+        online = any(
+            age is not None and age <= self.heartbeat_timeout
+            for age in (heartbeat_age, seen_age)
+        )
+        return {
+            "device_id": device_id,
+            "online": online,
+            "heartbeat": entry["heartbeat"],
+            "heartbeat_age_seconds": round(heartbeat_age, 1) if heartbeat_age is not None else None,
+            "last_seen_age_seconds": round(seen_age, 1) if seen_age is not None else None,
+            "source": entry["source"],
+            "info_age_seconds": round(now - entry["learned_at"], 1) if entry["learned_at"] else None,
+            "error": entry["error"]
+        }
+
+    def _refresh(self, device_id):
+        # Single flight: concurrent checks of a stale device share one call
+        with self._lock:
+            event = self._refreshing.get(device_id)
+            leader = event is None
+            if leader:
+                event = self._refreshing[device_id] = threading.Event()
+
+        if not leader:
+            event.wait(self.max_age)
+            return
+
+        try:
+            with self._lock:
+                self.refreshes += 1
+            heartbeat = self._refresh_heartbeat(device_id)
+            with self._lock:
+                entry = self._entry(device_id)
+                entry["checked_at"] = time.time()
+            if heartbeat is not None:
+                self.record_heartbeat(device_id, heartbeat, "refresh")
+        except Exception as e:
+            with self._lock:
+                self.refresh_errors += 1
+                entry = self._entry(device_id)
+                # Do not retry a failing device on every check
+                entry["checked_at"] = time.time()
+                entry["error"] = str(e)
+        finally:
+            with self._lock:
+                self._refreshing.pop(device_id, None)
+            event.set()
+
+    def status(self, device_id, refresh=True):
+        """
+        Liveness of one device from memory; queries Blynk first only if
+        nothing was learned or checked within max_age seconds
+        """
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            entry = self._devices.get(device_id)
+            stale = entry is None or now - max(entry["learned_at"], entry["checked_at"]) > self.max_age
+
+        if refresh and stale and self._refresh_heartbeat is not None:
+            self._refresh(device_id)
+
+        with self._lock:
+            entry = self._devices.get(device_id)
+            if entry is None:
+                return {
+                    "device_id": device_id,
+                    "online": False,
+                    "heartbeat": None,
+                    "heartbeat_age_seconds": None,
+                    "last_seen_age_seconds": None,
+                    "source": None,
+                    "info_age_seconds": None,
+                    "error": None
+                }
+            return self._snapshot(device_id, entry, time.time())
+
+    def all_status(self):
+        """Every known device, from memory only"""
+        now = time.time()
+        with self._lock:
+            return [self._snapshot(device_id, entry, now) for device_id, entry in sorted(self._devices.items())]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "devices": len(self._devices),
+                "lookups": self.lookups,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors
+            }
@@ -0,0 +1,489 @@
+"""
+Ingest load test for the Flowra backend.
+
+Replays webhook-style traffic from many devices against the ingest
+endpoints at one or more target rates and reports throughput, p50/p95/p99
+latency and error rate per endpoint. By default a fresh backend (app.py
+with an empty database) is started for every database configuration and
+pointed at a local fake Blynk API (fake_blynk.py), so the polling paths
+can be loaded without touching blynk.cloud.
+
+Arrivals are open-loop: requests are scheduled up front (Poisson at the
+target rate, plus optional bursts where every device posts at once, as
+after a gateway reconnect) and latency is measured from the scheduled
+send time. When the server falls behind, queueing delay shows up in the
+percentiles instead of silently lowering the offered rate.
+
+Usage:
+    python loadtest.py --rate 50,100,200 --duration 20
+    python loadtest.py --config sync --config write-behind --mix webhook=80,fetch_blynk=20
+    python loadtest.py --config "wal-small-cache:DB_CACHE_SIZE_KB=2000,DB_MMAP_SIZE=0"
+    python loadtest.py --save-baseline baseline.json
+    python loadtest.py --baseline baseline.json       Exit 1 if a result regressed
+    python loadtest.py --url http://127.0.0.1:5030    Load a server that is already running
+"""
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from fake_blynk import FakeBlynk
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+TOKEN = "loadtest-token"
+HEARTBEAT_PIN = "V9"
+
+# Named database configurations; anything else is given as NAME:KEY=VALUE,...
+CONFIGS = {
+    "sync": {"INGEST_WRITE_BEHIND": "false"},
+    "write-behind": {"INGEST_WRITE_BEHIND": "true"},
+    "small-cache": {"INGEST_WRITE_BEHIND": "false", "DB_CACHE_SIZE_KB": "2000", "DB_MMAP_SIZE": "0"}
+}
+ENDPOINTS = ("webhook", "sensor_data", "fetch_blynk")
+
+
+class Device:
+    """One simulated field device: a few pins whose levels drift, plus a heartbeat"""
+
+    def __init__(self, device_id, pins, rng):
+        self.device_id = device_id
+        self.pins = pins
+        self._rng = rng
+        self._levels = {pin: rng.uniform(10, 60) for pin in pins}
+        self._next_pin = 0
+
+    def next_value(self):
+        """(pin, value) of the device's next post, heartbeat included in the rotation"""
+        pins = self.pins + [HEARTBEAT_PIN]
+        pin = pins[self._next_pin % len(pins)]
+        self._next_pin += 1
+        if pin == HEARTBEAT_PIN:
+            return pin, int(time.time())
+        # Mostly small moves, now and then a storm surge past the threshold
+        step = self._rng.gauss(0, 2) if self._rng.random() > 0.01 else self._rng.uniform(20, 40)
+        level = min(100.0, max(0.0, self._levels[pin] + step))
+        self._levels[pin] = level
+        return pin, round(level, 2)
+
+
+def build_request(endpoint, device):
+    """(method, path, params, body) for one request from a device"""
+    pin, value = device.next_value()
+    if endpoint == "webhook":
+        return "POST", "/api/webhook/blynk", None, {"pin": pin, "value": value, "device_id": device.device_id}
+    if endpoint == "sensor_data":
+        return "POST", "/api/sensor_data", None, {"sensor_id": f"{device.device_id}_{pin}", "water_level": value}
+    if endpoint == "fetch_blynk":
+        pin = device.pins[0]
+        return "GET", "/api/fetch-blynk", {"token": TOKEN, "pin": pin, "sensor_id": f"{device.device_id}_{pin}"}, None
+    raise ValueError(f"Unknown endpoint {endpoint}")
+
+
+def build_schedule(rate, duration, mix, devices, burst_every=0, burst_size=0, seed=0):
+    """
+    Time-ordered [(offset_seconds, endpoint, request)] for one step:
+    Poisson arrivals at rate requests/second, plus a burst of burst_size
+    requests every burst_every seconds
+    """
+    rng = random.Random(seed)
+    endpoints = list(mix)
+    weights = [mix[endpoint] for endpoint in endpoints]
+    arrivals = []
+    offset = rng.expovariate(rate)
+    while offset < duration:
+        arrivals.append((offset, rng.choice(devices)))
+        offset += rng.expovariate(rate)
+    if burst_every and burst_size:
+        burst = burst_every
+        while burst < duration:
+            # Every device at once, as when a gateway comes back online
+            arrivals.extend((burst, devices[index % len(devices)]) for index in range(burst_size))
+            burst += burst_every
+    arrivals.sort(key=lambda arrival: arrival[0])
+
+    schedule = []
+    for offset, device in arrivals:
+        endpoint = rng.choices(endpoints, weights)[0]
+        schedule.append((offset, endpoint, build_request(endpoint, device)))
+    return schedule
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    rank = min(len(values), max(1, math.ceil(fraction * len(values))))
+    return values[rank - 1]
+
+
+def run_step(base_url, schedule, concurrency, timeout):
+    """
+    Send a schedule with concurrency worker threads. Returns
+    {endpoint: {"latencies", "errors", "statuses"}} and the elapsed seconds.
+    """
+    results = {}
+    lock = threading.Lock()
+    position = [0]
+    started = time.perf_counter() + 0.2
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                if position[0] >= len(schedule):
+                    break
+                offset, endpoint, (method, path, params, body) = schedule[position[0]]
+                position[0] += 1
+            due = started + offset
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                response = session.request(method, base_url + path, params=params, json=body, timeout=timeout)
+                status = response.status_code
+            except requests.exceptions.RequestException as e:
+                status = type(e).__name__
+            latency = time.perf_counter() - due
+            with lock:
+                result = results.setdefault(endpoint, {"latencies": [], "errors": 0, "statuses": {}})
+                result["latencies"].append(latency)
+                result["statuses"][str(status)] = result["statuses"].get(str(status), 0) + 1
+                if not isinstance(status, int) or status >= 400:
+                    result["errors"] += 1
+        session.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, max(time.perf_counter() - started, 0.001)
+
+
+def summarize(config, rate, results, elapsed):
+    """One report row per endpoint plus an "all" row"""
+    rows = []
+    combined = {"latencies": [], "errors": 0, "statuses": {}}
+    for endpoint in sorted(results):
+        result = results[endpoint]
+        rows.append(_row(config, rate, endpoint, result, elapsed))
+        combined["latencies"].extend(result["latencies"])
+        combined["errors"] += result["errors"]
+        for status, count in result["statuses"].items():
+            combined["statuses"][status] = combined["statuses"].get(status, 0) + count
+    rows.append(_row(config, rate, "all", combined, elapsed))
+    return rows
+
+
+def _row(config, rate, endpoint, result, elapsed):
+    latencies = sorted(result["latencies"])
+    requests_sent = len(latencies)
+    return {
+        "config": config,
+        "rate": rate,
+        "endpoint": endpoint,
+        "requests": requests_sent,
+        "errors": result["errors"],
+        "error_rate": round(result["errors"] / requests_sent, 4) if requests_sent else 0,
+        "throughput": round((requests_sent - result["errors"]) / elapsed, 1),
+        "p50_ms": _milliseconds(percentile(latencies, 0.50)),
+        "p95_ms": _milliseconds(percentile(latencies, 0.95)),
+        "p99_ms": _milliseconds(percentile(latencies, 0.99)),
+        "max_ms": _milliseconds(latencies[-1] if latencies else None),
+        "statuses": result["statuses"]
+    }
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def parse_config(value):
+    """'sync' or 'name:KEY=VALUE,KEY=VALUE' -> (name, env)"""
+    if value in CONFIGS:
+        return value, CONFIGS[value]
+    name, _, settings = value.partition(":")
+    if not name or not settings:
+        raise argparse.ArgumentTypeError(f"config must be one of {', '.join(CONFIGS)} or NAME:KEY=VALUE,...")
+    env = {}
+    for setting in settings.split(","):
+        key, _, val = setting.partition("=")
+        if not key.strip():
+            raise argparse.ArgumentTypeError(f"Bad setting {setting!r} in config {name}")
+        env[key.strip()] = val.strip()
+    return name, env
+
+
+def parse_mix(value):
+    """'webhook=70,sensor_data=30' -> {endpoint: weight}"""
+    mix = {}
+    for part in value.split(","):
+        endpoint, _, weight = part.partition("=")
+        endpoint = endpoint.strip()
+        if endpoint not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"endpoint must be one of {', '.join(ENDPOINTS)}")
+        try:
+            mix[endpoint] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Bad weight for {endpoint}: {weight}")
+    return mix
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BackendProcess:
+    """app.py in a subprocess with its own empty database and settings"""
+
+    def __init__(self, env, blynk_url, workdir, fleet=False):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_path = os.path.join(workdir, "server.log")
+        self.env = dict(os.environ)
+        self.env.update({
+            "DATABASE_PATH": os.path.join(workdir, "loadtest.db"),
+            "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+            "FLASK_HOST": "127.0.0.1",
+            "FLASK_PORT": str(self.port),
+            "FLASK_DEBUG": "false",
+            "BLYNK_BASE_URL": blynk_url,
+            "BLYNK_AUTH_TOKEN": TOKEN,
+            "BLYNK_RETRIES": "0",
+            "FLEET_POLLING": "true" if fleet else "false",
+            "FLEET_REFRESH_SECONDS": "1"
+        })
+        self.env.update(env)
+        self._process = None
+        self._log = None
+
+    def start(self, timeout=30):
+        self._log = open(self.log_path, "w")
+        self._process = subprocess.Popen(
+            [sys.executable, os.path.join(BACKEND_DIR, "app.py")],
+            cwd=BACKEND_DIR, env=self.env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"Backend exited with {self._process.returncode}, see {self.log_path}")
+            try:
+                if requests.get(f"{self.url}/api/ingest/status", timeout=1).status_code == 200:
+                    return self
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"Backend did not start within {timeout}s, see {self.log_path}")
+
+    def stop(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        if self._log is not None:
+            self._log.close()
+
+
+def register_fleet(base_url, count, interval_seconds):
+    """Register count devices for the fleet poller, all served by the fake Blynk API"""
+    for index in range(count):
+        response = requests.post(f"{base_url}/api/devices", json={
+            "device_id": f"loadtest-fleet-{index:04d}",
+            "token": f"loadtest-fleet-token-{index:04d}",
+            "pins": ["V0", "V1"],
+            "heartbeat_pin": HEARTBEAT_PIN,
+            "interval_seconds": interval_seconds
+        }, timeout=10)
+        response.raise_for_status()
+
+
+def fleet_counters(base_url):
+    """(polls_total, errors_total) of the server's fleet poller"""
+    try:
+        fleet = requests.get(f"{base_url}/api/fleet/status", timeout=5).json()["fleet"]
+    except (requests.exceptions.RequestException, ValueError, KeyError):
+        return None
+    return fleet["polls_total"], fleet["errors_total"]
+
+
+def run_config(name, base_url, args, mix, devices):
+    """Every rate step against one backend. Returns report rows."""
+    rows = []
+    if args.fleet_devices:
+        register_fleet(base_url, args.fleet_devices, args.fleet_interval)
+    for step, rate in enumerate(args.rate):
+        schedule = build_schedule(rate, args.duration, mix, devices,
+                                  args.burst_every, args.burst_size, seed=args.seed + step)
+        fleet_before = fleet_counters(base_url) if args.fleet_devices else None
+        print(f"[LOADTEST] {name}: {len(schedule)} requests at {rate}/s for {args.duration}s")
+        results, elapsed = run_step(base_url, schedule, args.concurrency, args.timeout)
+        step_rows = summarize(name, rate, results, elapsed)
+
+        fleet_after = fleet_counters(base_url) if args.fleet_devices else None
+        if fleet_before and fleet_after:
+            polls = fleet_after[0] - fleet_before[0]
+            errors = fleet_after[1] - fleet_before[1]
+            step_rows.append({
+                "config": name, "rate": rate, "endpoint": "fleet_poll", "requests": polls, "errors": errors,
+                "error_rate": round(errors / polls, 4) if polls else 0,
+                "throughput": round((polls - errors) / elapsed, 1),
+                "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None, "statuses": {}
+            })
+        print_rows(step_rows)
+        rows.extend(step_rows)
+    return rows
+
+
+def sustained_rates(rows, slo_ms, max_error_rate):
+    """Highest step per config whose overall p99 and error rate stayed within the limits"""
+    sustained = {}
+    for row in rows:
+        if row["endpoint"] != "all":
+            continue
+        sustained.setdefault(row["config"], None)
+        if row["p99_ms"] is not None and row["p99_ms"] <= slo_ms and row["error_rate"] <= max_error_rate:
+            if sustained[row["config"]] is None or row["rate"] > sustained[row["config"]]:
+                sustained[row["config"]] = row["rate"]
+    return sustained
+
+
+def compare_to_baseline(rows, baseline_rows, tolerance, min_delta_ms=2.0):
+    """
+    Regressions against a saved run, matched on config, rate and endpoint:
+    throughput down, p95/p99 up by more than tolerance (and min_delta_ms),
+    or error rate up by more than a percentage point
+    """
+    baseline = {(row["config"], row["rate"], row["endpoint"]): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        before = baseline.get((row["config"], row["rate"], row["endpoint"]))
+        if before is None:
+            continue
+        label = f"{row['config']} @ {row['rate']}/s {row['endpoint']}"
+        if before["throughput"] and row["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {before['throughput']} -> {row['throughput']} req/s")
+        for key in ("p95_ms", "p99_ms"):
+            if before[key] is None or row[key] is None:
+                continue
+            if row[key] > before[key] * (1 + tolerance) and row[key] - before[key] > min_delta_ms:
+                regressions.append(f"{label}: {key} {before[key]} -> {row[key]}")
+        if row["error_rate"] > before["error_rate"] + 0.01:
+            regressions.append(f"{label}: error rate {before['error_rate']} -> {row['error_rate']}")
+    return regressions
+
+
+def print_rows(rows):
+    print(f"  {'endpoint':<12} {'req':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    for row in rows:
+        cells = [_cell(row[key]) for key in ("p50_ms", "p95_ms", "p99_ms")]
+        print(f"  {row['endpoint']:<12} {row['requests']:>7} {row['throughput']:>8} "
+              f"{cells[0]:>9} {cells[1]:>9} {cells[2]:>9} {row['error_rate']:>8.2%}")
+
+
+def _cell(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest load test for the Flowra backend")
+    parser.add_argument("--url", help="Load a running server instead of starting one per config")
+    parser.add_argument("--config", action="append", type=parse_config,
+                        help=f"Database configuration: {', '.join(CONFIGS)} or NAME:KEY=VALUE,... (repeatable)")
+    parser.add_argument("--rate", type=lambda value: [float(rate) for rate in value.split(",")], default=[50.0, 100.0, 200.0],
+                        help="Target requests per second, comma separated for a ramp (default: 50,100,200)")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per rate step")
+    parser.add_argument("--mix", type=parse_mix, default={"webhook": 70.0, "sensor_data": 30.0},
+                        help=f"Endpoint weights, e.g. webhook=70,sensor_data=20,fetch_blynk=10 ({', '.join(ENDPOINTS)})")
+    parser.add_argument("--devices", type=int, default=200, help="Simulated devices posting")
+    parser.add_argument("--pins", type=int, default=2, help="Water level pins per device")
+    parser.add_argument("--burst-every", type=float, default=0, help="Seconds between bursts (0 = none)")
+    parser.add_argument("--burst-size", type=int, default=0, help="Requests per burst (default: one per device)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Client worker threads")
+    parser.add_argument("--timeout", type=float, default=10, help="Client timeout per request in seconds")
+    parser.add_argument("--fleet-devices", type=int, default=0,
+                        help="Devices registered for the fleet poller against the fake Blynk API")
+    parser.add_argument("--fleet-interval", type=int, default=5, help="Poll interval of those devices in seconds")
+    parser.add_argument("--blynk-latency-ms", type=float, default=20, help="Latency of the fake Blynk API")
+    parser.add_argument("--blynk-error-rate", type=float, default=0.0, help="Share of fake Blynk calls answered with 503")
+    parser.add_argument("--slo-ms", type=float, default=250, help="p99 limit for the sustained rate")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error rate limit for the sustained rate")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--save-baseline", help="Write the results as a baseline file")
+    parser.add_argument("--baseline", help="Compare with a baseline file and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    if args.burst_every and not args.burst_size:
+        args.burst_size = args.devices
+    rng = random.Random(args.seed)
+    devices = [Device(f"loadtest-{index:04d}", [f"V{pin}" for pin in range(args.pins)], rng)
+               for index in range(args.devices)]
+
+    rows = []
+    fake = FakeBlynk(latency_ms=args.blynk_latency_ms, error_rate=args.blynk_error_rate, seed=args.seed).start()
+    try:
+        if args.url:
+            rows.extend(run_config("external", args.url.rstrip("/"), args, args.mix, devices))
+        else:
+            for name, env in args.config or [("sync", CONFIGS["sync"])]:
+                workdir = tempfile.mkdtemp(prefix=f"flowra-loadtest-{name}-")
+                backend = BackendProcess(env, fake.url, workdir, fleet=bool(args.fleet_devices)).start()
+                try:
+                    rows.extend(run_config(name, backend.url, args, args.mix, devices))
+                finally:
+                    backend.stop()
+    finally:
+        fake.stop()
+
+    sustained = sustained_rates(rows, args.slo_ms, args.max_error_rate)
+    for name, rate in sustained.items():
+        print(f"[LOADTEST] {name}: highest rate within p99 <= {args.slo_ms:g} ms and "
+              f"{args.max_error_rate:.0%} errors: {f'{rate:g}/s' if rate else 'none'}")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "settings": {
+            "duration": args.duration, "mix": args.mix, "devices": args.devices,
+            "burst_every": args.burst_every, "burst_size": args.burst_size,
+            "concurrency": args.concurrency, "blynk_latency_ms": args.blynk_latency_ms
+        },
+        "sustained": sustained,
+        "results": rows
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as target:
+                json.dump(report, target, indent=2)
+            print(f"[LOADTEST] Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as source:
+            baseline = json.load(source)
+        regressions = compare_to_baseline(rows, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"[REGRESSION] {len(regressions)} result(s) worse than {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"[LOADTEST] No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+"""
+Maintenance commands for the Flowra backend.
+
+Usage:
+    python manage.py migrate              Apply pending schema migrations
+    python manage.py status               Show applied schema migrations
+    python manage.py explain [--strict]   Print EXPLAIN QUERY PLAN for every query the app issues
+    python manage.py rebuild-latest       Repopulate sensor_latest from readings
+    python manage.py reconcile-stats      Recompute dashboard counters from the tables
+    python manage.py rebuild-rollups      Recompute minute/hour/day rollups from live readings
+    python manage.py retention            Archive readings and alerts past their retention period
+    python manage.py import-sensors FILE  Register or update sensor locations from CSV or GeoJSON
+    python manage.py rebuild-spatial      Repopulate the sensor spatial index
+    python manage.py sync-analytics       Copy new readings to the columnar analytics store
+    python manage.py rebuild-analytics    Recreate the columnar analytics store from readings
+"""
+import argparse
+import ast
+import os
+import re
+import sys
+import time
+
+from database import get_db, get_read_db, bump_shared_version, DB_PATH
+from migrations import migrate, current_version, MIGRATIONS
+from ingest import rebuild_sensor_latest
+from stats import reconcile
+from rollups import rebuild_rollups
+from archive import run_retention, archived_months, RETENTION_POLICIES, ARCHIVE_DIR
+from spatial import rebuild_spatial_index
+from sensor_import import detect_format, parse_sensors, import_sensors, FORMATS
+from storage import open_storage
+from analytics import ColumnarStore, AnalyticsUnavailable
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SQL_PATTERN = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b", re.IGNORECASE)
+# Tables that grow with every reading - a full scan of these is a bug
+HOT_TABLES = ("readings", "alerts")
+# Modules whose SQL runs on DuckDB, not SQLite
+NON_SQLITE_MODULES = ("analytics.py",)
+
+
+def collect_queries():
+    """
+    Find every SQL statement literal in the backend modules.
+    Returns a list of (location, sql) sorted by file and line.
+    """
+    queries = []
+    for filename in sorted(os.listdir(BACKEND_DIR)):
+        if not filename.endswith(".py") or filename in (os.path.basename(__file__),) + NON_SQLITE_MODULES:
+            continue
+        path = os.path.join(BACKEND_DIR, filename)
+        with open(path, encoding="utf-8") as source:
+            tree = ast.parse(source.read(), filename=filename)
+        # Docstrings are bare expression statements - never queries
+        docstrings = {id(node.value) for node in ast.walk(tree) if isinstance(node, ast.Expr)}
+        for node in ast.walk(tree):
+            if id(node) in docstrings:
+                continue
+            if isinstance(node, ast.Constant) and isinstance(node.value, str) and SQL_PATTERN.match(node.value):
+                queries.append((f"{filename}:{node.lineno}", " ".join(node.value.split())))
+    return sorted(queries, key=lambda q: (q[0].split(":")[0], int(q[0].split(":")[1])))
+
+
+def _placeholder_count(sql):
+    # Ignore '?' inside quoted string literals
+    return re.sub(r"'[^']*'", "", sql).count("?")
+
+
+def explain(strict=False):
+    conn = get_db()
+    full_scans = []
+    try:
+        for location, sql in collect_queries():
+            print(f"\n{location}\n  {sql}")
+            try:
+                plan = conn.execute(
+                    f"EXPLAIN QUERY PLAN {sql}",
+                    (None,) * _placeholder_count(sql)
+                ).fetchall()
+            except Exception as e:
+                print(f"  [SKIPPED] {str(e)}")
+                continue
+
+            for row in plan:
+                detail = row["detail"]
+                marker = ""
+                match = re.match(r"SCAN (\w+)", detail)
+                # An index scan under LIMIT stops early; anything else reads every row
+                if match and match.group(1) in HOT_TABLES and ("INDEX" not in detail or " LIMIT " not in f" {sql.upper()} "):
+                    marker = "  <-- FULL TABLE SCAN"
+                    full_scans.append(location)
+                elif "TEMP B-TREE" in detail:
+                    marker = "  <-- sort without index"
+                print(f"  {detail}{marker}")
+    finally:
+        conn.rollback()
+        conn.close()
+
+    if full_scans:
+        print(f"\n[WARNING] Full scans of {', '.join(HOT_TABLES)} in: {', '.join(sorted(set(full_scans)))}")
+        if strict:
+            return 1
+    else:
+        print(f"\n[OK] No full scans of {', '.join(HOT_TABLES)}")
+    return 0
+
+
+def status():
+    conn = get_db()
+    try:
+        version = current_version(conn)
+        applied = {
+            row["version"]: row["applied_at"]
+            for row in conn.execute("SELECT version, applied_at FROM schema_migrations")
+        }
+    finally:
+        conn.close()
+
+    print(f"Database: {DB_PATH}")
+    print(f"Schema version: {version}")
+    for number, description, _ in MIGRATIONS:
+        applied_at = applied.get(number)
+        state = f"applied {applied_at}" if applied_at else "pending"
+        print(f"  {number:>3}  {description}  [{state}]")
+    return 0
+
+
+def notify_server():
+    """
+    Make a running single-process server drop the responses it cached
+    before this command's writes (several workers notice any commit anyway)
+    """
+    conn = get_db()
+    try:
+        bump_shared_version(conn, "cli_writes")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def rebuild_latest():
+    migrate()
+    conn = get_db()
+    try:
+        count = rebuild_sensor_latest(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    notify_server()
+    print(f"[REBUILD] sensor_latest repopulated for {count} sensor(s)")
+    return 0
+
+
+def reconcile_stats():
+    migrate()
+    read_conn = get_read_db()
+    write_conn = get_db()
+    try:
+        corrections = reconcile(read_conn, write_conn)
+    finally:
+        read_conn.close()
+        write_conn.close()
+    notify_server()
+    print(f"[STATS] Counter corrections: {corrections['counters'] or 'none'}, buckets corrected: {corrections['buckets']}")
+    return 0
+
+
+def rebuild_rollup_tables():
+    migrate()
+    conn = get_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        since = None
+        if archived_months("readings"):
+            # Buckets before the oldest live reading were built from rows
+            # that are now archived - rebuilding them would lose them
+            oldest = conn.execute(
+                "SELECT CAST(strftime('%s', MIN(timestamp)) AS INTEGER) FROM readings"
+            ).fetchone()[0]
+            if oldest is None:
+                conn.rollback()
+                print("[REBUILD] Every reading is archived, rollups kept as they are")
+                return 0
+            since = oldest
+            print(f"[REBUILD] Readings are archived, keeping rollup buckets before {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(since))}")
+        written = rebuild_rollups(conn, since)
+        conn.commit()
+    finally:
+        conn.close()
+    notify_server()
+    print(f"[REBUILD] Rollup rows written: {written}")
+    return 0
+
+
+def retention():
+    migrate()
+    read_conn = get_read_db()
+    write_conn = get_db()
+    try:
+        moved = run_retention(read_conn, write_conn)
+    finally:
+        read_conn.close()
+        write_conn.close()
+    notify_server()
+    print(f"[RETENTION] Policies (days, 0 = forever): {RETENTION_POLICIES}")
+    print(f"[RETENTION] Rows archived to {ARCHIVE_DIR}: {moved}")
+    return 0
+
+
+def rebuild_spatial():
+    migrate()
+    conn = get_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        count = rebuild_spatial_index(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    notify_server()
+    print(f"[REBUILD] Spatial index repopulated for {count} sensor(s)")
+    return 0
+
+
+def sync_analytics(rebuild=False):
+    migrate()
+    try:
+        store = ColumnarStore()
+    except AnalyticsUnavailable as e:
+        print(f"[ANALYTICS ERROR] {str(e)}")
+        return 1
+    if rebuild:
+        store.clear()
+    copied = store.sync(open_storage(os.getenv('STORAGE_BACKEND', 'sqlite')))
+    stats = store.stats()
+    print(f"[ANALYTICS] {copied} reading(s) copied; {stats['readings']} in {stats['parts']} part(s) "
+          f"under {stats['directory']} ({stats['bytes'] / 1e6:.1f} MB)")
+    return 0
+
+
+def import_sensor_file(path, fmt=None):
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        print(f"[IMPORT ERROR] Cannot tell the format of {path}; pass --format {'/'.join(FORMATS)}")
+        return 1
+    migrate()
+    with open(path, encoding="utf-8-sig") as source:
+        rows = parse_sensors(source.read(), fmt)
+
+    conn = get_db()
+    try:
+        summary = import_sensors(conn, rows)
+    finally:
+        conn.close()
+    if summary["imported"]:
+        notify_server()
+
+    for error in summary["errors"]:
+        print(f"  row {error['index']} ({error['sensor_id'] or 'no id'}): {error['error']}")
+    print(f"[IMPORT] {summary['imported']} sensor(s) imported ({summary['inserted']} new, "
+          f"{summary['updated']} updated), {summary['rejected']} rejected, {summary['duplicates']} duplicate(s)")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Flowra backend maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("migrate", help="Apply pending schema migrations")
+    commands.add_parser("status", help="Show applied schema migrations")
+    explain_parser = commands.add_parser("explain", help="Print EXPLAIN QUERY PLAN for every app query")
+    explain_parser.add_argument("--strict", action="store_true",
+                                help="Exit non-zero if a hot table is fully scanned")
+    commands.add_parser("rebuild-latest", help="Repopulate sensor_latest from readings")
+    commands.add_parser("reconcile-stats", help="Recompute dashboard counters from the tables")
+    commands.add_parser("rebuild-rollups", help="Recompute minute/hour/day rollups from live readings")
+    commands.add_parser("retention", help="Archive readings and alerts past their retention period")
+    import_parser = commands.add_parser("import-sensors", help="Register or update sensor locations from CSV or GeoJSON")
+    import_parser.add_argument("path", help="CSV or GeoJSON file")
+    import_parser.add_argument("--format", choices=FORMATS, help="File format (default: from the file extension)")
+    commands.add_parser("rebuild-spatial", help="Repopulate the sensor spatial index")
+    commands.add_parser("sync-analytics", help="Copy new readings to the columnar analytics store")
+    commands.add_parser("rebuild-analytics", help="Recreate the columnar analytics store from readings")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        applied = migrate()
+        print(f"[MIGRATE] {len(applied)} migration(s) applied")
+        return 0
+    if args.command == "status":
+        return status()
+    if args.command == "explain":
+        migrate()
+        return explain(strict=args.strict)
+    if args.command == "rebuild-latest":
+        return rebuild_latest()
+    if args.command == "reconcile-stats":
+        return reconcile_stats()
+    if args.command == "rebuild-rollups":
+        return rebuild_rollup_tables()
+    if args.command == "retention":
+        return retention()
+    if args.command == "import-sensors":
+        return import_sensor_file(args.path, args.format)
+    if args.command == "rebuild-spatial":
+        return rebuild_spatial()
+    if args.command == "sync-analytics":
+        return sync_analytics()
+    if args.command == "rebuild-analytics":
+        return sync_analytics(rebuild=True)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""
+In-process metrics exposed at /metrics in the Prometheus text format.
+
+Counters and histograms keep one value slot list per thread: a thread only
+ever writes its own list, so recording a value is a few list operations
+with no lock, cheap enough to leave on in production. A scrape sums the
+lists; a thread's list is folded into a running total when the thread
+ends, so short-lived threads leave nothing behind. Label sets are created
+once and cached; call sites on hot paths keep the child returned by
+labels(). Values owned by other components (queue depths, subscriber
+counts) are read at scrape time through callback metrics.
+"""
+import bisect
+import functools
+import math
+import re
+import threading
+import time
+import weakref
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+JOB_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _SlotOwner:
+    """Held only by its thread's local storage, so it dies when the thread ends"""
+    __slots__ = ("__weakref__",)
+
+
+class _ThreadSlots:
+    """Per-thread value lists; each thread writes only its own"""
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._live = {}
+        self._retired = [0] * size
+
+    def values(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = [0] * self._size
+            self._local.owner = owner = _SlotOwner()
+            with self._lock:
+                self._live[id(values)] = values
+            # Fold the list into the retired totals as soon as the thread ends
+            weakref.finalize(owner, self._retire, values)
+            return values
+
+    def _retire(self, values):
+        with self._lock:
+            if self._live.pop(id(values), None) is None:
+                return
+            for index, value in enumerate(values):
+                self._retired[index] += value
+
+    def totals(self):
+        with self._lock:
+            totals = list(self._retired)
+            for values in self._live.values():
+                for index, value in enumerate(values):
+                    totals[index] += value
+        return totals
+
+
+class _CounterChild:
+    __slots__ = ("_slots",)
+
+    def __init__(self):
+        self._slots = _ThreadSlots(1)
+
+    def inc(self, amount=1):
+        self._slots.values()[0] += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self._slots.totals()[0])]
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_slots")
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        # One count per bucket, then sum and count
+        self._slots = _ThreadSlots(len(bounds) + 2)
+
+    def observe(self, value):
+        values = self._slots.values()
+        values[bisect.bisect_left(self._bounds, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def samples(self, name, labels):
+        totals = self._slots.totals()
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self._bounds, totals):
+            cumulative += count
+            samples.append((f"{name}_bucket", labels + (("le", _format_value(bound)),), cumulative))
+        samples.append((f"{name}_sum", labels, totals[-2]))
+        samples.append((f"{name}_count", labels, totals[-1]))
+        return samples
+
+
+class _Metric:
+    kind = None
+    # Metrics without labels export 0 before their first update
+    _precreate = True
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+        if not self.labelnames and self._precreate:
+            self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Child for one label set, created on first use"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def collect(self):
+        samples = []
+        for values, child in list(self._children.items()):
+            samples.extend(child.samples(self.name, tuple(zip(self.labelnames, values))))
+        return samples
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self._bounds = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self._bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class CallbackMetric(_Metric):
+    """
+    Value read at scrape time. callback() returns a number, or a dict of
+    {label values tuple: number}; errors skip the metric for that scrape.
+    """
+    _precreate = False
+
+    def __init__(self, name, documentation, callback, labelnames=(), kind="gauge", registry=None):
+        self.kind = kind
+        self._callback = callback
+        super().__init__(name, documentation, labelnames, registry)
+
+    def collect(self):
+        try:
+            value = self._callback()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            return [(self.name, (), value)]
+        return [
+            (self.name, tuple(zip(self.labelnames, values)), number)
+            for values, number in value.items()
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            samples = metric.collect()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                if labels:
+                    label_text = ",".join(f'{key}="{_escape_label(str(val))}"' for key, val in labels)
+                    lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_help(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer()):
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+
+def timed(histogram, *labels):
+    """Decorator recording a function's run time in a histogram"""
+    def decorator(func):
+        child = histogram.labels(*labels)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+_SQL_TABLE = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)", re.IGNORECASE
+)
+_query_labels = {}
+
+
+def query_labels(sql):
+    """(operation, table) label values for a statement, cached per SQL text"""
+    labels = _query_labels.get(sql)
+    if labels is None:
+        words = sql.split(None, 1)
+        operation = words[0].upper() if words else "UNKNOWN"
+        match = _SQL_TABLE.search(sql)
+        labels = (operation, match.group(1) if match else "")
+        if len(_query_labels) > 2048:
+            # Statements built with a variable number of placeholders
+            _query_labels.clear()
+        _query_labels[sql] = labels
+    return labels
+
+
+# Metrics recorded by the backend's modules
+HTTP_REQUEST_SECONDS = Histogram(
+    "flowra_http_request_duration_seconds",
+    "Time from request start until the response starts, per route",
+    ("route", "method")
+)
+HTTP_REQUESTS = Counter(
+    "flowra_http_requests_total",
+    "HTTP requests by route, method and status class",
+    ("route", "method", "status")
+)
+DB_QUERY_SECONDS = Histogram(
+    "flowra_db_query_duration_seconds",
+    "SQLite execute and commit time by operation and table",
+    ("operation", "table"),
+    buckets=DB_BUCKETS
+)
+READINGS_INGESTED = Counter(
+    "flowra_readings_ingested_total",
+    "Readings committed to the database"
+)
+ALERTS_OPENED = Counter(
+    "flowra_alerts_opened_total",
+    "Alert episodes opened"
+)
+BLYNK_REQUEST_SECONDS = Histogram(
+    "flowra_blynk_request_duration_seconds",
+    "Blynk API call time including retries"
+)
+BLYNK_ERRORS = Counter(
+    "flowra_blynk_errors_total",
+    "Failed Blynk API calls by kind (timeout, connection, request, http_4xx, http_5xx or http_other)",
+    ("kind",)
+)
+# A fixed label set, all exported from the start; status codes map onto it
+BLYNK_ERROR_KINDS = ("timeout", "connection", "request", "http_4xx", "http_5xx", "http_other")
+for _kind in BLYNK_ERROR_KINDS:
+    BLYNK_ERRORS.labels(_kind)
+JOB_SECONDS = Histogram(
+    "flowra_job_duration_seconds",
+    "Scheduled background job run time",
+    ("job",),
+    buckets=JOB_BUCKETS
+)
+JOB_FAILURES = Counter(
+    "flowra_job_failures_total",
+    "Scheduled background job runs that failed",
+    ("job",)
+)
+ANALYTICS_QUERY_SECONDS = Histogram(
+    "flowra_analytics_query_duration_seconds",
+    "Columnar analytics query time by query",
+    ("query",)
+)
+ANALYTICS_READINGS_COPIED = Counter(
+    "flowra_analytics_readings_copied_total",
+    "Readings copied into the columnar analytics store"
+)
@@ -0,0 +1,316 @@
+"""
+Versioned schema migrations.
+
+Each migration is (version, description, steps). A step is either a SQL
+statement or a callable taking the connection. Migrations are applied in
+version order, each inside its own transaction, and recorded in the
+schema_migrations table. Never edit a migration that has shipped - append
+a new one instead.
+"""
+import datetime
+from database import get_db
+from rollups import rebuild_rollups
+from spatial import rebuild_spatial_index
+
+MIGRATIONS = [
+    (1, "Create base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS sensors(
+            sensor_id TEXT PRIMARY KEY,
+            latitude REAL,
+            longitude REAL,
+            area TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS readings(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sensor_id TEXT,
+            water_level REAL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS alerts(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sensor_id TEXT,
+            water_level REAL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "Index readings and alerts by (sensor_id, timestamp)", [
+        "CREATE INDEX IF NOT EXISTS idx_readings_sensor_timestamp ON readings(sensor_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_alerts_sensor_timestamp ON alerts(sensor_id, timestamp)",
+    ]),
+    (3, "Index readings and alerts by timestamp", [
+        "CREATE INDEX IF NOT EXISTS idx_readings_timestamp ON readings(timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_alerts_timestamp ON alerts(timestamp)",
+    ]),
+    (4, "Add sensor_latest table with the newest reading per sensor", [
+        """
+        CREATE TABLE IF NOT EXISTS sensor_latest(
+            sensor_id TEXT PRIMARY KEY,
+            water_level REAL,
+            timestamp DATETIME
+        )
+        """,
+        """
+        INSERT OR REPLACE INTO sensor_latest(sensor_id, water_level, timestamp)
+        SELECT sensor_id, water_level, MAX(timestamp)
+        FROM readings
+        GROUP BY sensor_id
+        """,
+    ]),
+    (5, "Add incrementally maintained dashboard statistics", [
+        """
+        CREATE TABLE IF NOT EXISTS stats_counters(
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS stats_buckets(
+            bucket INTEGER PRIMARY KEY,
+            reading_count INTEGER NOT NULL DEFAULT 0,
+            level_count INTEGER NOT NULL DEFAULT 0,
+            level_sum REAL NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        INSERT OR REPLACE INTO stats_counters(name, value)
+        SELECT 'sensors', COUNT(*) FROM sensors
+        UNION ALL SELECT 'readings', COUNT(*) FROM readings
+        UNION ALL SELECT 'alerts', COUNT(*) FROM alerts
+        """,
+        """
+        INSERT OR REPLACE INTO stats_buckets(bucket, reading_count, level_count, level_sum)
+        SELECT CAST(strftime('%s', timestamp) AS INTEGER) / 300 * 300,
+               COUNT(*),
+               SUM(typeof(water_level) IN ('integer', 'real')),
+               TOTAL(CASE WHEN typeof(water_level) IN ('integer', 'real') THEN water_level END)
+        FROM readings
+        WHERE timestamp >= datetime('now', '-2 day')
+        GROUP BY 1
+        """,
+        # Sensors are registered from several endpoints - count them with triggers
+        """
+        CREATE TRIGGER IF NOT EXISTS stats_sensors_insert AFTER INSERT ON sensors
+        BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'sensors';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS stats_sensors_delete AFTER DELETE ON sensors
+        BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'sensors';
+        END
+        """,
+    ]),
+    (6, "Add minute, hour and day reading rollups per sensor", [
+        *[
+            f"""
+            CREATE TABLE IF NOT EXISTS readings_rollup_{level}(
+                sensor_id TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                level_sum REAL NOT NULL,
+                min_level REAL,
+                max_level REAL,
+                last_level REAL,
+                last_timestamp DATETIME,
+                PRIMARY KEY (sensor_id, bucket)
+            ) WITHOUT ROWID
+            """
+            for level in ("minute", "hour", "day")
+        ],
+        rebuild_rollups,
+    ]),
+    (7, "Add device registry for the fleet poller", [
+        """
+        CREATE TABLE IF NOT EXISTS devices(
+            device_id TEXT PRIMARY KEY,
+            token TEXT NOT NULL,
+            pins TEXT NOT NULL DEFAULT 'V0',
+            heartbeat_pin TEXT DEFAULT 'V9',
+            interval_seconds INTEGER NOT NULL DEFAULT 300,
+            value_divisor REAL NOT NULL DEFAULT 100,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (8, "Add per-sensor alert limits and alert episodes", [
+        "ALTER TABLE sensors ADD COLUMN alert_threshold REAL",
+        "ALTER TABLE sensors ADD COLUMN alert_clear_threshold REAL",
+        "ALTER TABLE sensors ADD COLUMN alert_debounce INTEGER",
+        "ALTER TABLE alerts ADD COLUMN started_at DATETIME",
+        "ALTER TABLE alerts ADD COLUMN ended_at DATETIME",
+        "ALTER TABLE alerts ADD COLUMN peak_level REAL",
+        "ALTER TABLE alerts ADD COLUMN peak_at DATETIME",
+        "ALTER TABLE alerts ADD COLUMN reading_count INTEGER",
+        "ALTER TABLE alerts ADD COLUMN threshold REAL",
+        "ALTER TABLE alerts ADD COLUMN status TEXT",
+        # Rows written before episodes were tracked are single-reading episodes
+        """
+        UPDATE alerts SET started_at = timestamp, ended_at = timestamp, peak_level = water_level,
+                          peak_at = timestamp, reading_count = 1, status = 'resolved'
+        WHERE status IS NULL
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_alerts_open ON alerts(sensor_id) WHERE ended_at IS NULL",
+    ]),
+    (9, "Add R*Tree spatial index over sensor coordinates", [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS sensors_rtree USING rtree(
+            id,
+            min_lat, max_lat,
+            min_lon, max_lon
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS sensors_rtree_insert AFTER INSERT ON sensors
+        WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+        BEGIN
+            INSERT OR REPLACE INTO sensors_rtree(id, min_lat, max_lat, min_lon, max_lon)
+            VALUES (NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS sensors_rtree_update AFTER UPDATE OF latitude, longitude ON sensors
+        BEGIN
+            DELETE FROM sensors_rtree WHERE id = OLD.rowid;
+            INSERT INTO sensors_rtree(id, min_lat, max_lat, min_lon, max_lon)
+            SELECT NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS sensors_rtree_delete AFTER DELETE ON sensors
+        BEGIN
+            DELETE FROM sensors_rtree WHERE id = OLD.rowid;
+        END
+        """,
+        rebuild_spatial_index,
+    ]),
+    (10, "Track the last binary ingest frame per device", [
+        """
+        CREATE TABLE IF NOT EXISTS ingest_sequences(
+            device_id TEXT PRIMARY KEY,
+            sequence INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL,
+            updated_at DATETIME
+        )
+        """,
+    ]),
+    (11, "Add shared_versions for state cached by several server processes", [
+        """
+        CREATE TABLE IF NOT EXISTS shared_versions(
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        """,
+    ]),
+    (12, "Index open alert episodes", [
+        # Loading the alert engine reads only open episodes. A partial index
+        # keyed on the filter columns makes that a search over the open rows
+        # alone, whatever the size of the alert history; rows within one key
+        # are in id order, so ORDER BY id needs no sort
+        """
+        CREATE INDEX IF NOT EXISTS idx_alerts_active ON alerts(status, ended_at)
+        WHERE ended_at IS NULL AND status = 'active'
+        """,
+    ]),
+    (13, "Persist alert engine state per sensor", [
+        # Streak counters and open episodes, written with each batch; version
+        # is the shared_versions.alert_state value of the write that moved it
+        """
+        CREATE TABLE IF NOT EXISTS sensor_alert_state(
+            sensor_id TEXT PRIMARY KEY,
+            active_id INTEGER,
+            streak INTEGER NOT NULL DEFAULT 0,
+            streak_timestamp DATETIME,
+            streak_level REAL,
+            peak REAL,
+            peak_at DATETIME,
+            count INTEGER NOT NULL DEFAULT 0,
+            last_timestamp DATETIME,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_sensor_alert_state_version ON sensor_alert_state(version)",
+        # Episodes open before this migration; their streaks were in memory only
+        """
+        INSERT OR IGNORE INTO sensor_alert_state(sensor_id, active_id, peak, peak_at, count, last_timestamp)
+        SELECT sensor_id, id, peak_level, peak_at, COALESCE(reading_count, 1), COALESCE(peak_at, timestamp)
+        FROM alerts
+        WHERE ended_at IS NULL AND status = 'active'
+        ORDER BY id DESC
+        """,
+    ]),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations(
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at DATETIME
+        )
+    """)
+    conn.commit()
+
+
+def current_version(conn):
+    """Highest applied migration version (0 for a fresh database)"""
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) AS version FROM schema_migrations").fetchone()
+    return row["version"] or 0
+
+
+def migrate(target=None):
+    """
+    Apply all pending migrations up to target (default: latest).
+    Safe to call from several processes at once - the version check is
+    repeated under the write lock, so each migration runs exactly once.
+    Returns the list of versions applied by this call.
+    """
+    conn = get_db()
+    applied = []
+    try:
+        _ensure_version_table(conn)
+        for version, description, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if target is not None and version > target:
+                break
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                already_applied = conn.execute(
+                    "SELECT 1 FROM schema_migrations WHERE version = ?",
+                    (version,)
+                ).fetchone()
+                if already_applied:
+                    conn.rollback()
+                    continue
+
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+
+                conn.execute(
+                    "INSERT INTO schema_migrations(version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            applied.append(version)
+            print(f"[MIGRATE] Applied migration {version}: {description}")
+    finally:
+        conn.close()
+
+    return applied
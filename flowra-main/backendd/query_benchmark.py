@@ -0,0 +1,200 @@
+"""
+Read endpoint benchmark across database sizes.
+
+For every --sizes entry a database is seeded with seed_data.py (or reused
+from --workdir), the backend is started on it and each read endpoint is
+timed. The sensor count stays the same, so only the history grows between
+sizes. Every request carries a unique throwaway parameter so the response
+cache never answers it and the query itself is measured.
+
+An endpoint fails when its median time grows faster than logarithmically
+with the number of readings: at size n it may take at most
+
+    t(smallest) * log(n) / log(smallest) * (1 + tolerance) + slack
+
+so an index seek passes and a scan that grows with the table does not.
+The process exits 1 on any failure.
+
+Usage:
+    python query_benchmark.py                               1M, 10M and 100M readings
+    python query_benchmark.py --sizes 100000,1000000 --repeat 30
+    python query_benchmark.py --workdir /data/bench --output results.json
+"""
+import argparse
+import calendar
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+from ingest import TIMESTAMP_FORMAT
+from loadtest import BackendProcess, BACKEND_DIR
+
+BENCHMARK_SENSORS = 1000
+# Name, path and query; {sensor}, {since} and {bbox} are filled in per database
+ENDPOINTS = [
+    ("readings", "/api/readings", {}),
+    ("readings_sensor", "/api/readings", {"sensor_id": "{sensor}"}),
+    ("readings_since", "/api/readings", {"order": "asc", "since": "{since}"}),
+    ("alerts", "/api/alerts", {}),
+    ("alerts_sensor", "/api/alerts", {"sensor_id": "{sensor}"}),
+    ("latest", "/api/latest", {}),
+    ("drainage_locations", "/api/drainage-locations", {}),
+    ("drainage_viewport", "/api/drainage-locations", {"bbox": "{bbox}", "zoom": "15"}),
+    ("dashboard_stats", "/api/dashboard/stats", {}),
+]
+
+
+def database_path(workdir, size):
+    return os.path.join(workdir, f"flowra-bench-{size}.db")
+
+
+def ensure_database(workdir, size, sensors):
+    """Seed the database for a size unless it already exists"""
+    path = database_path(workdir, size)
+    if os.path.exists(path):
+        print(f"[BENCH] Reusing {path}")
+        return path
+    print(f"[BENCH] Seeding {size:,} readings into {path}")
+    env = dict(os.environ, DATABASE_PATH=path)
+    subprocess.run(
+        [sys.executable, os.path.join(BACKEND_DIR, "seed_data.py"), "--readings", str(size), "--sensors", str(sensors)],
+        cwd=BACKEND_DIR, env=env, check=True
+    )
+    return path
+
+
+def endpoint_params(base_url):
+    """Values for the placeholders, read from the seeded data through the API"""
+    locations = requests.get(f"{base_url}/api/drainage-locations", timeout=60).json()["locations"]
+    middle = locations[len(locations) // 2]
+    newest = requests.get(f"{base_url}/api/latest", timeout=60).json()["data"]["timestamp"]
+    newest = calendar.timegm(time.strptime(newest, TIMESTAMP_FORMAT))
+    return {
+        "sensor": middle["sensor_id"],
+        # The last hour: a short range at the end of a long table
+        "since": time.strftime(TIMESTAMP_FORMAT, time.gmtime(newest - 3600)),
+        "bbox": f"{middle['longitude'] - 0.01},{middle['latitude'] - 0.01},"
+                f"{middle['longitude'] + 0.01},{middle['latitude'] + 0.01}"
+    }
+
+
+def time_endpoints(base_url, repeat, warmup):
+    """{endpoint: {"median_ms", "p95_ms", "min_ms"}}"""
+    values = endpoint_params(base_url)
+    session = requests.Session()
+    results = {}
+    counter = 0
+    for name, path, query in ENDPOINTS:
+        params = {key: value.format(**values) for key, value in query.items()}
+        timings = []
+        for attempt in range(warmup + repeat):
+            counter += 1
+            # Unique so the response cache never answers
+            params["_bench"] = str(counter)
+            started = time.perf_counter()
+            response = session.get(base_url + path, params=params, timeout=600)
+            elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise RuntimeError(f"{name}: HTTP {response.status_code} {response.text[:200]}")
+            if attempt >= warmup:
+                timings.append(elapsed * 1000)
+        timings.sort()
+        results[name] = {
+            "median_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(timings[min(len(timings) - 1, math.ceil(0.95 * len(timings)) - 1)], 3),
+            "min_ms": round(timings[0], 3)
+        }
+        print(f"  {name:<20} median {results[name]['median_ms']:>9.2f} ms   p95 {results[name]['p95_ms']:>9.2f} ms")
+    session.close()
+    return results
+
+
+def check_growth(timings, tolerance, slack_ms):
+    """
+    Failures for endpoints growing faster than log(size). timings is
+    {size: {endpoint: {"median_ms", ...}}}.
+    """
+    sizes = sorted(timings)
+    smallest = sizes[0]
+    failures = []
+    for name, _, _ in ENDPOINTS:
+        base = timings[smallest][name]["median_ms"]
+        for size in sizes[1:]:
+            allowed = base * math.log(size) / math.log(smallest) * (1 + tolerance) + slack_ms
+            measured = timings[size][name]["median_ms"]
+            if measured > allowed:
+                failures.append(
+                    f"{name}: {measured:.2f} ms at {size:,} rows, allowed {allowed:.2f} ms "
+                    f"({base:.2f} ms at {smallest:,} rows)"
+                )
+    return failures
+
+
+def growth_exponent(timings, name):
+    """Slope of log(time) over log(size) between the smallest and largest size (1 = linear)"""
+    sizes = sorted(timings)
+    first = timings[sizes[0]][name]["median_ms"]
+    last = timings[sizes[-1]][name]["median_ms"]
+    if len(sizes) < 2 or first <= 0 or last <= 0:
+        return None
+    return math.log(last / first) / math.log(sizes[-1] / sizes[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the read endpoints at growing database sizes")
+    parser.add_argument("--sizes", type=lambda value: sorted(int(size) for size in value.split(",")),
+                        default=[1000000, 10000000, 100000000], help="Readings per database (default: 1M,10M,100M)")
+    parser.add_argument("--sensors", type=int, default=BENCHMARK_SENSORS, help="Sensors in every database")
+    parser.add_argument("--workdir", default=os.path.join(BACKEND_DIR, "benchmark_data"),
+                        help="Where seeded databases are kept and reused")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed requests per endpoint")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative excess over log growth")
+    parser.add_argument("--slack-ms", type=float, default=5, help="Allowed absolute excess, for timer noise")
+    parser.add_argument("--output", help="Write the timings as JSON")
+    args = parser.parse_args(argv)
+
+    if len(args.sizes) < 2 or args.sizes[0] < 2:
+        parser.error("--sizes needs at least two sizes above 1")
+    os.makedirs(args.workdir, exist_ok=True)
+
+    timings = {}
+    for size in args.sizes:
+        path = ensure_database(args.workdir, size, args.sensors)
+        # Keep the seeded history: no retention runs while benchmarking
+        env = {"DATABASE_PATH": path, "RETENTION_READINGS_DAYS": "0", "RETENTION_ALERTS_DAYS": "0"}
+        backend = BackendProcess(env, "http://127.0.0.1:9/external/api/get", args.workdir).start(timeout=300)
+        try:
+            print(f"[BENCH] {size:,} readings")
+            timings[size] = time_endpoints(backend.url, args.repeat, args.warmup)
+        finally:
+            backend.stop()
+
+    print(f"\n[BENCH] Growth from {args.sizes[0]:,} to {args.sizes[-1]:,} readings (exponent: 0 = flat, 1 = linear)")
+    for name, _, _ in ENDPOINTS:
+        exponent = growth_exponent(timings, name)
+        print(f"  {name:<20} {exponent:+.3f}" if exponent is not None else f"  {name:<20} -")
+
+    failures = check_growth(timings, args.tolerance, args.slack_ms)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as target:
+            json.dump({"sizes": args.sizes, "timings": timings, "failures": failures}, target, indent=2)
+        print(f"[BENCH] Results written to {args.output}")
+
+    if failures:
+        print(f"[BENCH FAIL] {len(failures)} endpoint(s) grow faster than log(rows):")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("[BENCH] All endpoints within logarithmic growth")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Conditional GET support for the polled read endpoints.
+
+DataVersions keeps a counter per table that every write path bumps after it
+commits. A cached endpoint's ETag is built from the versions of the tables
+it reads, so a poll carrying a matching If-None-Match gets a 304 without a
+query, and a poll without one is answered from the serialized body cached
+for (endpoint, args, ETag) until one of those tables changes.
+
+Versions live in process memory. A process that shares the database with
+others (several server workers) calls watch() with a source that changes on
+every commit anywhere, e.g. database.data_version; any change it reports
+invalidates every cached response. Without a watch, writes made by another
+process (manage.py, another worker) are not seen until this process writes
+the same table.
+"""
+import collections
+import functools
+import os
+import threading
+import time
+
+from flask import current_app, request
+
+
+class DataVersions:
+    """Monotonic per-table change counters"""
+
+    def __init__(self):
+        self._versions = collections.Counter()
+        self._lock = threading.Lock()
+        # ETags from an earlier process must never match this one's
+        self.epoch = f"{int(time.time() * 1000):x}{os.getpid():x}"
+        self._source = None
+        self._source_value = None
+        self._external = 0
+
+    def watch(self, source):
+        """source() returns a value that changes whenever another process may have written"""
+        self._source = source
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] += 1
+
+    def etag(self, tables, extra=None):
+        value = self._source() if self._source is not None else None
+        with self._lock:
+            if value != self._source_value:
+                self._source_value = value
+                self._external += 1
+            versions = ".".join(str(self._versions[table]) for table in tables)
+            if self._source is not None:
+                versions = f"{self._external}.{versions}"
+        if extra is not None:
+            versions = f"{versions}-{extra}"
+        return f"{self.epoch}-{versions}"
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._versions)
+
+
+class ResponseCache:
+    """Small LRU of serialized response bodies keyed by (endpoint, args, etag)"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified
+            }
+
+
+def conditional_get(versions, cache, tables, extra=None):
+    """
+    Decorate a JSON GET view reading `tables`. extra() may return a value
+    folded into the ETag for responses that also depend on the clock.
+    Only 200 responses are cached.
+    """
+    tables = tuple(tables)
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # Read the versions before the query: a write landing mid-query
+            # at worst makes the next poll fetch again
+            etag = versions.etag(tables, extra() if extra else None)
+
+            if request.if_none_match.contains_weak(etag):
+                cache.record_not_modified()
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+
+            key = (request.endpoint, tuple(sorted(request.args.items(multi=True))), etag)
+            body = cache.get(key)
+            if body is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                cache.put(key, body)
+
+            response = current_app.response_class(body, mimetype="application/json")
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,241 @@
+"""
+Per-sensor time-bucketed rollups of water level readings.
+
+readings_rollup_minute/_hour/_day hold count, sum, min, max and last value
+per (sensor_id, bucket), where bucket is the epoch second the UTC window
+starts at. Ingest maintains all three in the same transaction as the
+reading inserts; aggregate queries read the coarsest table that can answer
+them, so a year-long chart touches a few hundred rows instead of millions.
+"""
+import calendar
+import datetime
+
+from stats import minute_epoch
+
+# (name, table, seconds) from finest to coarsest
+ROLLUP_LEVELS = [
+    ("minute", "readings_rollup_minute", 60),
+    ("hour", "readings_rollup_hour", 3600),
+    ("day", "readings_rollup_day", 86400),
+]
+
+BUCKET_ALIASES = {
+    "minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400,
+}
+BUCKET_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+# Bucket sizes picked automatically when the client does not ask for one
+AUTO_BUCKETS = [60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 7 * 86400, 30 * 86400]
+
+
+def _upsert_sql(table):
+    # In DO UPDATE SET, bare column names refer to the stored row
+    return f"""
+        INSERT INTO {table}(sensor_id, bucket, count, level_sum, min_level, max_level, last_level, last_timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(sensor_id, bucket) DO UPDATE SET
+            count = count + excluded.count,
+            level_sum = level_sum + excluded.level_sum,
+            min_level = MIN(min_level, excluded.min_level),
+            max_level = MAX(max_level, excluded.max_level),
+            last_level = CASE WHEN excluded.last_timestamp >= last_timestamp
+                              THEN excluded.last_level ELSE last_level END,
+            last_timestamp = MAX(last_timestamp, excluded.last_timestamp)
+    """
+
+
+_UPSERT_SQL = {table: _upsert_sql(table) for _, table, _ in ROLLUP_LEVELS}
+
+
+def record_readings(conn, readings):
+    """Fold a batch of (sensor_id, water_level, timestamp) readings into every rollup level"""
+    # Aggregate the batch per (sensor, minute) first, then roll minutes up
+    minutes = {}
+    for sensor_id, water_level, timestamp in readings:
+        if not isinstance(water_level, (int, float)) or isinstance(water_level, bool):
+            continue
+        try:
+            minute = minute_epoch(timestamp)
+        except (TypeError, ValueError):
+            continue
+        key = (sensor_id, minute)
+        row = minutes.get(key)
+        if row is None:
+            minutes[key] = [1, water_level, water_level, water_level, water_level, timestamp]
+        else:
+            row[0] += 1
+            row[1] += water_level
+            if water_level < row[2]:
+                row[2] = water_level
+            if water_level > row[3]:
+                row[3] = water_level
+            if timestamp >= row[5]:
+                row[4] = water_level
+                row[5] = timestamp
+
+    if not minutes:
+        return
+
+    level_rows = minutes
+    for _, table, seconds in ROLLUP_LEVELS:
+        if seconds != 60:
+            coarser = {}
+            for (sensor_id, minute), row in minutes.items():
+                key = (sensor_id, minute - minute % seconds)
+                agg = coarser.get(key)
+                if agg is None:
+                    coarser[key] = list(row)
+                else:
+                    agg[0] += row[0]
+                    agg[1] += row[1]
+                    agg[2] = min(agg[2], row[2])
+                    agg[3] = max(agg[3], row[3])
+                    if row[5] >= agg[5]:
+                        agg[4] = row[4]
+                        agg[5] = row[5]
+            level_rows = coarser
+
+        conn.executemany(
+            _UPSERT_SQL[table],
+            [(sensor_id, bucket, *row) for (sensor_id, bucket), row in level_rows.items()]
+        )
+
+
+def rebuild_rollups(conn, since=None):
+    """
+    Recompute the rollup levels from readings in the caller's transaction.
+    With since (Unix seconds), only buckets starting at or after it, rounded
+    up to each level's bucket size, are replaced; older buckets are kept as
+    they are, since their readings may have moved to the archive.
+    Returns {level_name: rows_written}.
+    """
+    written = {}
+    finer_table = None
+    for name, table, seconds in ROLLUP_LEVELS:
+        start = 0 if since is None else -(-int(since) // seconds) * seconds
+        conn.execute(f"DELETE FROM {table} WHERE bucket >= ?", (start,))
+        if finer_table is None:
+            start_text = datetime.datetime.utcfromtimestamp(start).strftime("%Y-%m-%d %H:%M:%S")
+            cursor = conn.execute(f"""
+                INSERT INTO {table}(sensor_id, bucket, count, level_sum, min_level, max_level, last_timestamp)
+                SELECT sensor_id,
+                       CAST(strftime('%s', timestamp) AS INTEGER) / {seconds} * {seconds},
+                       COUNT(*), TOTAL(water_level), MIN(water_level), MAX(water_level), MAX(timestamp)
+                FROM readings
+                WHERE typeof(water_level) IN ('integer', 'real') AND timestamp IS NOT NULL
+                  AND (? = 0 OR timestamp >= ?)
+                GROUP BY 1, 2
+            """, (start, start_text))
+            conn.execute(f"""
+                UPDATE {table} SET last_level = (
+                    SELECT r.water_level FROM readings r
+                    WHERE r.sensor_id = {table}.sensor_id AND r.timestamp = {table}.last_timestamp
+                    ORDER BY r.id DESC LIMIT 1
+                )
+                WHERE bucket >= ?
+            """, (start,))
+        else:
+            cursor = conn.execute(f"""
+                INSERT INTO {table}(sensor_id, bucket, count, level_sum, min_level, max_level, last_timestamp)
+                SELECT sensor_id, bucket / {seconds} * {seconds},
+                       SUM(count), SUM(level_sum), MIN(min_level), MAX(max_level), MAX(last_timestamp)
+                FROM {finer_table}
+                WHERE bucket >= ?
+                GROUP BY 1, 2
+            """, (start,))
+            conn.execute(f"""
+                UPDATE {table} SET last_level = (
+                    SELECT f.last_level FROM {finer_table} f
+                    WHERE f.sensor_id = {table}.sensor_id
+                      AND f.bucket >= {table}.bucket AND f.bucket < {table}.bucket + {seconds}
+                    ORDER BY f.last_timestamp DESC LIMIT 1
+                )
+                WHERE bucket >= ?
+            """, (start,))
+        written[name] = cursor.rowcount
+        finer_table = table
+    return written
+
+
+def parse_time(value):
+    """Unix seconds or ISO-8601 (UTC if no offset) to epoch seconds"""
+    try:
+        return int(float(value))
+    except ValueError:
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is not None:
+            return int(parsed.timestamp())
+        return calendar.timegm(parsed.timetuple())
+
+
+def parse_bucket(value):
+    """'hour', '15m', '6h', '1d' or plain seconds to a bucket size in seconds"""
+    value = value.strip().lower()
+    if value in BUCKET_ALIASES:
+        return BUCKET_ALIASES[value]
+    if value[-1:] in BUCKET_UNITS:
+        return int(value[:-1]) * BUCKET_UNITS[value[-1]]
+    return int(value)
+
+
+def auto_bucket(start, end, max_points):
+    """Smallest standard bucket that keeps the series under max_points"""
+    for seconds in AUTO_BUCKETS:
+        if (end - start) / seconds <= max_points:
+            return seconds
+    return AUTO_BUCKETS[-1]
+
+
+def pick_level(bucket_seconds):
+    """Coarsest rollup level whose bucket evenly divides the requested bucket"""
+    chosen = ROLLUP_LEVELS[0]
+    for level in ROLLUP_LEVELS:
+        if bucket_seconds % level[2] == 0:
+            chosen = level
+    return chosen
+
+
+def query_aggregate(conn, sensor_id, start, end, bucket_seconds):
+    """
+    Aggregate one sensor's readings into bucket_seconds windows for [start, end).
+    Returns (level_name, points) with points ordered by bucket.
+    """
+    name, table, level_seconds = pick_level(bucket_seconds)
+    rows = conn.execute(
+        f"""
+        SELECT bucket, count, level_sum, min_level, max_level, last_level, last_timestamp
+        FROM {table}
+        WHERE sensor_id = ? AND bucket >= ? AND bucket < ?
+        ORDER BY bucket
+        """,
+        (sensor_id, start - start % level_seconds, end)
+    )
+
+    points = []
+    current = None
+    for row in rows:
+        bucket = row["bucket"] - row["bucket"] % bucket_seconds
+        if current is None or current["bucket_epoch"] != bucket:
+            current = {
+                "bucket_epoch": bucket,
+                "count": 0,
+                "sum": 0.0,
+                "min": row["min_level"],
+                "max": row["max_level"],
+                "last": row["last_level"],
+                "last_timestamp": row["last_timestamp"]
+            }
+            points.append(current)
+        current["count"] += row["count"]
+        current["sum"] += row["level_sum"]
+        current["min"] = min(current["min"], row["min_level"])
+        current["max"] = max(current["max"], row["max_level"])
+        if row["last_timestamp"] >= current["last_timestamp"]:
+            current["last"] = row["last_level"]
+            current["last_timestamp"] = row["last_timestamp"]
+
+    for point in points:
+        point["bucket"] = datetime.datetime.utcfromtimestamp(point["bucket_epoch"]).strftime("%Y-%m-%d %H:%M:%S")
+        point["avg"] = round(point.pop("sum") / point["count"], 2) if point["count"] else None
+        del point["last_timestamp"]
+
+    return name, points
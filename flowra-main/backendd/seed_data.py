@@ -0,0 +1,263 @@
+"""
+Seed a database with synthetic sensor history for benchmarks.
+
+Sensors are spread over areas around Toronto, each reading at a fixed
+device cadence up to now. Levels sit at a per-sensor base with a daily
+swing and noise; storms hit one area at a time, raising every sensor in it
+by its own factor for a few hours, and the readings that cross the alert
+threshold produce alert episodes the way the alert engine records them.
+sensor_latest, the rollups and the dashboard counters are rebuilt at the
+end, so every read endpoint sees a consistent database.
+
+Readings are written in time order with the readings indexes dropped and
+recreated afterwards, which keeps 100M rows to minutes rather than hours.
+
+Usage:
+    DATABASE_PATH=/tmp/flowra-10m.db python seed_data.py --readings 10000000
+    python seed_data.py --readings 1000000 --sensors 200 --days 120 --storms-per-month 6
+
+The app archives readings older than RETENTION_READINGS_DAYS; set it to 0
+(or above --days) when serving a seeded database.
+"""
+import argparse
+import math
+import random
+import sys
+import time
+
+from database import get_db, get_read_db, DB_PATH
+from migrations import migrate
+from ingest import rebuild_sensor_latest, TIMESTAMP_FORMAT
+from rollups import rebuild_rollups
+from stats import reconcile
+
+SEED_CHUNK_ROWS = 200000  # Readings per insert transaction
+# Area name, center latitude, center longitude
+AREAS = [
+    ("Downtown Toronto", 43.6532, -79.3832),
+    ("North York", 43.7615, -79.4111),
+    ("Scarborough", 43.7764, -79.2318),
+    ("Etobicoke", 43.6205, -79.5132),
+    ("East York", 43.6910, -79.3280),
+    ("York", 43.6896, -79.4794),
+    ("Midtown", 43.7040, -79.3990),
+    ("Leslieville", 43.6626, -79.3320),
+    ("The Beaches", 43.6710, -79.2960),
+    ("Rexdale", 43.7213, -79.5700),
+    ("Agincourt", 43.7850, -79.2780),
+    ("Willowdale", 43.7700, -79.4140),
+]
+
+
+def make_sensors(count, area_count, rng):
+    """[(sensor_id, latitude, longitude, area)] spread around the area centers"""
+    areas = AREAS[:max(1, min(area_count, len(AREAS)))]
+    sensors = []
+    for index in range(count):
+        name, latitude, longitude = areas[index % len(areas)]
+        sensors.append((
+            f"drain-{index:05d}_V0",
+            round(latitude + rng.uniform(-0.03, 0.03), 6),
+            round(longitude + rng.uniform(-0.04, 0.04), 6),
+            name
+        ))
+    return sensors
+
+
+def make_storms(area_count, start, end, storms_per_month, rng):
+    """{area index: [(start, peak_at, end, height)]} with Poisson storm arrivals"""
+    storms = {}
+    rate = storms_per_month / (30 * 86400)
+    for area in range(area_count):
+        episodes = []
+        moment = start + rng.expovariate(rate) if rate > 0 else end
+        while moment < end:
+            duration = rng.uniform(2, 18) * 3600
+            episodes.append((moment, moment + duration * rng.uniform(0.2, 0.5), moment + duration, rng.uniform(20, 60)))
+            moment += duration + rng.expovariate(rate)
+        storms[area] = episodes
+    return storms
+
+
+def storm_height(episodes, position, moment):
+    """Storm contribution to an area's levels at moment; position is a cursor into episodes"""
+    while position < len(episodes) and episodes[position][2] <= moment:
+        position += 1
+    if position == len(episodes) or episodes[position][0] > moment:
+        return 0.0, position
+    begin, peak_at, finish, height = episodes[position]
+    if moment <= peak_at:
+        return height * (moment - begin) / (peak_at - begin), position
+    return height * (finish - moment) / (finish - peak_at), position
+
+
+def seed(conn, readings, sensor_count=1000, area_count=12, interval=300, days=None,
+         storms_per_month=4, threshold=70, hysteresis=5, chunk_rows=None, rng_seed=1, rollups=True):
+    """
+    Fill an empty database. Returns a summary dict. Either interval (seconds
+    between readings of one sensor) or days (span ending now) sets the cadence.
+    """
+    if conn.execute("SELECT 1 FROM readings LIMIT 1").fetchone():
+        raise ValueError("Database already has readings; seed an empty database")
+
+    rng = random.Random(rng_seed)
+    chunk_rows = chunk_rows or SEED_CHUNK_ROWS
+    area_count = max(1, min(area_count, len(AREAS)))
+    sensors = make_sensors(sensor_count, area_count, rng)
+    ticks = max(1, readings // len(sensors))
+    if days:
+        interval = days * 86400 / ticks
+    end = time.time() // 60 * 60
+    start = end - (ticks - 1) * interval
+    storms = make_storms(area_count, start, end, storms_per_month, rng)
+
+    area_of = [index % area_count for index in range(len(sensors))]
+    base = [rng.uniform(15, 40) for _ in sensors]
+    response = [rng.uniform(0.5, 1.3) for _ in sensors]
+    clear_threshold = threshold - hysteresis
+
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany(
+        "INSERT INTO sensors(sensor_id, latitude, longitude, area) VALUES (?, ?, ?, ?)",
+        sensors
+    )
+    conn.commit()
+
+    # Rebuilt once at the end instead of being updated for every row
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'readings' AND sql IS NOT NULL"
+    ).fetchall()
+    for index in indexes:
+        conn.execute(f"DROP INDEX {index['name']}")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    # Per sensor: [alert start, start level, peak, peak at, reading count] while an episode is open
+    episodes = [None] * len(sensors)
+    alerts = []
+    positions = [0] * area_count
+    written = 0
+    started = time.time()
+
+    def rows():
+        nonlocal written
+        for tick in range(ticks):
+            moment = start + tick * interval
+            timestamp = time.strftime(TIMESTAMP_FORMAT, time.gmtime(moment))
+            daily = 3 * math.sin(2 * math.pi * (moment % 86400) / 86400)
+            heights = []
+            for area in range(area_count):
+                height, positions[area] = storm_height(storms[area], positions[area], moment)
+                heights.append(height)
+            for index, (sensor_id, _, _, _) in enumerate(sensors):
+                level = base[index] + daily + response[index] * heights[area_of[index]] + (rng.random() - 0.5) * 3
+                level = round(min(100.0, max(0.0, level)), 2)
+                episode = episodes[index]
+                if episode is None:
+                    if level > threshold:
+                        episodes[index] = [timestamp, level, level, timestamp, 1]
+                else:
+                    episode[4] += 1
+                    if level > episode[2]:
+                        episode[2] = level
+                        episode[3] = timestamp
+                    if level <= clear_threshold:
+                        alerts.append((sensor_id, episode[1], episode[0], episode[0], timestamp,
+                                       episode[2], episode[3], episode[4], threshold, "resolved"))
+                        episodes[index] = None
+                yield sensor_id, level, timestamp
+            written += len(sensors)
+
+    generator = rows()
+    while True:
+        chunk = [row for _, row in zip(range(chunk_rows), generator)]
+        if not chunk:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("INSERT INTO readings(sensor_id, water_level, timestamp) VALUES (?, ?, ?)", chunk)
+        conn.commit()
+        elapsed = time.time() - started
+        print(f"[SEED] {written:,} / {ticks * len(sensors):,} readings ({written / max(elapsed, 0.001):,.0f}/s)")
+
+    for index, episode in enumerate(episodes):
+        if episode is not None:
+            alerts.append((sensors[index][0], episode[1], episode[0], episode[0], None,
+                           episode[2], episode[3], episode[4], threshold, "active"))
+    alerts.sort(key=lambda alert: alert[2])
+
+    print("[SEED] Building indexes, alerts, latest readings, rollups and counters")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for index in indexes:
+            conn.execute(index["sql"])
+        conn.executemany(
+            """
+            INSERT INTO alerts(sensor_id, water_level, timestamp, started_at, ended_at, peak_level, peak_at,
+                               reading_count, threshold, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            alerts
+        )
+        rebuild_sensor_latest(conn)
+        if rollups:
+            rebuild_rollups(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+    return {
+        "sensors": len(sensors),
+        "readings": ticks * len(sensors),
+        "alerts": len(alerts),
+        "interval_seconds": round(interval, 1),
+        "days": round((end - start) / 86400, 1),
+        "seconds": round(time.time() - started, 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a database with synthetic sensor history")
+    parser.add_argument("--readings", type=int, default=1000000, help="Approximate number of readings")
+    parser.add_argument("--sensors", type=int, default=1000, help="Sensors to create")
+    parser.add_argument("--areas", type=int, default=len(AREAS), help=f"Areas the sensors are spread over (max {len(AREAS)})")
+    parser.add_argument("--interval", type=float, default=300, help="Seconds between readings of one sensor")
+    parser.add_argument("--days", type=float, help="Span of the history instead of --interval")
+    parser.add_argument("--storms-per-month", type=float, default=4, help="Storms per area per month")
+    parser.add_argument("--threshold", type=float, default=70, help="Alert threshold (WATER_LEVEL_THRESHOLD)")
+    parser.add_argument("--hysteresis", type=float, default=5, help="Alert hysteresis (ALERT_HYSTERESIS)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--skip-rollups", action="store_true", help="Leave the rollup tables empty")
+    args = parser.parse_args(argv)
+
+    migrate()
+    conn = get_db()
+    try:
+        summary = seed(
+            conn, args.readings, args.sensors, args.areas, args.interval, args.days,
+            args.storms_per_month, args.threshold, args.hysteresis,
+            rng_seed=args.seed, rollups=not args.skip_rollups
+        )
+    except ValueError as e:
+        print(f"[SEED ERROR] {str(e)}")
+        return 1
+    finally:
+        conn.close()
+
+    read_conn = get_read_db()
+    write_conn = get_db()
+    try:
+        reconcile(read_conn, write_conn)
+    finally:
+        read_conn.close()
+        write_conn.close()
+
+    print(f"[SEED] {DB_PATH}: {summary['sensors']} sensors, {summary['readings']:,} readings, "
+          f"{summary['alerts']:,} alerts over {summary['days']} days "
+          f"(one reading per sensor every {summary['interval_seconds']}s) in {summary['seconds']}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Bulk import of sensor locations from CSV or GeoJSON.
+
+Rows are validated with the same rules as /api/sensors/add-location and
+written with INSERT ... ON CONFLICT in chunked transactions, so a district
+of thousands of drains is a handful of commits instead of one request and
+one SELECT plus UPDATE/INSERT per sensor. Invalid rows are reported and do
+not stop the rest of the file from being imported.
+
+CSV files need a header row with sensor_id, latitude and longitude (lat,
+lon and lng are accepted too); sensor_name and area are optional. GeoJSON
+is a FeatureCollection of Point features whose properties carry sensor_id
+(or the feature's id), sensor_name and area.
+"""
+import csv
+import io
+import json
+import math
+import os
+
+SENSOR_IMPORT_CHUNK_SIZE = int(os.getenv('SENSOR_IMPORT_CHUNK_SIZE', '500'))  # Sensors upserted per transaction
+FORMATS = ("csv", "geojson")
+
+_COLUMN_ALIASES = {
+    "id": "sensor_id",
+    "name": "sensor_name",
+    "lat": "latitude",
+    "lon": "longitude",
+    "lng": "longitude",
+    "long": "longitude"
+}
+
+
+def _text(value):
+    return str(value).strip() if value is not None else ""
+
+
+def validate_sensor(data, require_name=False):
+    """
+    Normalized {sensor_id, sensor_name, latitude, longitude, area} for one
+    sensor; raises ValueError with the add-location error message
+    """
+    sensor_id = _text(data.get("sensor_id"))
+    sensor_name = _text(data.get("sensor_name"))
+    area = _text(data.get("area")) or "Unknown Area"
+
+    if not sensor_id:
+        raise ValueError("Sensor ID is required")
+    if require_name and not sensor_name:
+        raise ValueError("Sensor Name is required")
+
+    try:
+        latitude = float(data.get("latitude"))
+        longitude = float(data.get("longitude"))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid latitude or longitude format")
+    if not math.isfinite(latitude) or not math.isfinite(longitude):
+        raise ValueError("Invalid latitude or longitude format")
+
+    if latitude < -90 or latitude > 90:
+        raise ValueError("Latitude must be between -90 and 90")
+    if longitude < -180 or longitude > 180:
+        raise ValueError("Longitude must be between -180 and 180")
+
+    return {
+        "sensor_id": sensor_id,
+        "sensor_name": sensor_name,
+        "latitude": latitude,
+        "longitude": longitude,
+        "area": area
+    }
+
+
+def detect_format(filename=None, content_type=None):
+    """'csv' or 'geojson' from a file name or content type, None if unknown"""
+    filename = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if filename.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    if filename.endswith((".geojson", ".json")) or "json" in content_type:
+        return "geojson"
+    return None
+
+
+def parse_csv(text):
+    """[(row, error)] for every data row of a CSV file with a header"""
+    reader = csv.DictReader(io.StringIO(text.lstrip("\ufeff")))
+    if not reader.fieldnames:
+        raise ValueError("CSV file has no header row")
+
+    columns = {}
+    for name in reader.fieldnames:
+        key = _text(name).lower()
+        columns[name] = _COLUMN_ALIASES.get(key, key)
+    if "sensor_id" not in columns.values():
+        raise ValueError("CSV header must include sensor_id")
+
+    return [
+        ({columns[name]: value for name, value in row.items() if name in columns}, None)
+        for row in reader
+    ]
+
+
+def parse_geojson(text):
+    """[(row, error)] for every feature of a GeoJSON FeatureCollection or Feature"""
+    try:
+        document = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"Invalid GeoJSON: {str(e)}")
+
+    if isinstance(document, dict) and document.get("type") == "FeatureCollection":
+        features = document.get("features")
+    elif isinstance(document, dict) and document.get("type") == "Feature":
+        features = [document]
+    else:
+        raise ValueError("GeoJSON must be a FeatureCollection or a Feature")
+    if not isinstance(features, list):
+        raise ValueError("GeoJSON features must be a list")
+
+    rows = []
+    for feature in features:
+        if not isinstance(feature, dict):
+            rows.append(({}, "Feature must be an object"))
+            continue
+        properties = feature.get("properties")
+        row = dict(properties) if isinstance(properties, dict) else {}
+        if row.get("sensor_id") is None:
+            row["sensor_id"] = feature.get("id")
+        if row.get("sensor_name") is None and row.get("name") is not None:
+            row["sensor_name"] = row["name"]
+
+        geometry = feature.get("geometry") or {}
+        coordinates = geometry.get("coordinates")
+        if geometry.get("type") != "Point" or not isinstance(coordinates, list) or len(coordinates) < 2:
+            rows.append((row, "Feature geometry must be a Point"))
+            continue
+        # GeoJSON positions are [longitude, latitude]
+        row["longitude"], row["latitude"] = coordinates[0], coordinates[1]
+        rows.append((row, None))
+    return rows
+
+
+def parse_sensors(text, fmt):
+    if fmt == "csv":
+        return parse_csv(text)
+    if fmt == "geojson":
+        return parse_geojson(text)
+    raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+
+def import_sensors(conn, rows, chunk_size=None):
+    """
+    Validate parsed (row, error) pairs and upsert the valid ones. A sensor
+    listed twice keeps its last row. Returns a summary with per-row errors;
+    callers invalidate caches once afterwards.
+    """
+    chunk_size = max(1, chunk_size or SENSOR_IMPORT_CHUNK_SIZE)
+    errors = []
+    sensors = {}
+    for index, (row, error) in enumerate(rows):
+        try:
+            if error:
+                raise ValueError(error)
+            sensor = validate_sensor(row)
+        except ValueError as e:
+            errors.append({"index": index, "sensor_id": _text(row.get("sensor_id")) or None, "error": str(e)})
+            continue
+        # Re-inserted so a repeated id moves to its last position
+        sensors.pop(sensor["sensor_id"], None)
+        sensors[sensor["sensor_id"]] = sensor
+
+    sensors = list(sensors.values())
+    inserted = 0
+    updated = 0
+    for start in range(0, len(sensors), chunk_size):
+        chunk = sensors[start:start + chunk_size]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            placeholders = ",".join("?" * len(chunk))
+            existing = conn.execute(
+                f"SELECT COUNT(*) FROM sensors WHERE sensor_id IN ({placeholders})",
+                [sensor["sensor_id"] for sensor in chunk]
+            ).fetchone()[0]
+            conn.executemany(
+                """
+                INSERT INTO sensors(sensor_id, latitude, longitude, area) VALUES (?, ?, ?, ?)
+                ON CONFLICT(sensor_id) DO UPDATE SET
+                    latitude = excluded.latitude,
+                    longitude = excluded.longitude,
+                    area = excluded.area
+                """,
+                [(sensor["sensor_id"], sensor["latitude"], sensor["longitude"], sensor["area"]) for sensor in chunk]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        inserted += len(chunk) - existing
+        updated += existing
+
+    return {
+        "received": len(rows),
+        "imported": len(sensors),
+        "inserted": inserted,
+        "updated": updated,
+        "duplicates": len(rows) - len(errors) - len(sensors),
+        "rejected": len(errors),
+        "errors": errors
+    }
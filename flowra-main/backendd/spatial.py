@@ -0,0 +1,144 @@
+"""
+Viewport queries for the drainage map.
+
+sensors_rtree is an SQLite R*Tree over sensor coordinates, keyed by the
+sensors rowid and kept in step by triggers, so a bounding-box query reads
+only the sensors in view. Below a zoom level sensors are grouped into
+clusters on a fixed grid (about MAP_CLUSTER_RADIUS_PX screen pixels per
+cell at that zoom) inside SQLite, so the response holds one entry per
+occupied cell rather than one per sensor. The grid is anchored at
+(-180, -90), so clusters do not move while the map is panned.
+"""
+import math
+import os
+
+MAP_CLUSTER_MAX_ZOOM = int(os.getenv('MAP_CLUSTER_MAX_ZOOM', '14'))  # Highest zoom that is clustered
+MAP_CLUSTER_RADIUS_PX = int(os.getenv('MAP_CLUSTER_RADIUS_PX', '60'))  # Cluster cell size in screen pixels
+TILE_SIZE = 256
+
+_LOCATION_COLUMNS = """
+    s.sensor_id, s.latitude, s.longitude, s.area, l.water_level, l.timestamp
+"""
+
+
+def rebuild_spatial_index(conn):
+    """Repopulate sensors_rtree from sensors. Returns the number of sensors indexed."""
+    conn.execute("DELETE FROM sensors_rtree")
+    return conn.execute("""
+        INSERT INTO sensors_rtree(id, min_lat, max_lat, min_lon, max_lon)
+        SELECT rowid, latitude, latitude, longitude, longitude FROM sensors
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    """).rowcount
+
+
+def parse_bbox(value):
+    """'min_lon,min_lat,max_lon,max_lat' -> tuple of floats; raises ValueError"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    if not all(math.isfinite(part) for part in (min_lon, min_lat, max_lon, max_lat)):
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox minimum must not be above its maximum")
+    # Clamp to the world; a map zoomed far out reports wider bounds
+    return (max(min_lon, -180), max(min_lat, -90), min(max_lon, 180), min(max_lat, 90))
+
+
+def _bbox_filter(bbox):
+    if bbox is None:
+        return "", ()
+    min_lon, min_lat, max_lon, max_lat = bbox
+    # Overlap test: the R*Tree stores 32-bit boxes rounded outwards, so a
+    # containment test could drop points right on the edge of the viewport
+    return (
+        "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?",
+        (min_lat, max_lat, min_lon, max_lon)
+    )
+
+
+def location_to_dict(row):
+    return {
+        "sensor_id": row["sensor_id"],
+        "latitude": row["latitude"],
+        "longitude": row["longitude"],
+        "area": row["area"],
+        "water_level": row["water_level"] if row["timestamp"] is not None else 0,
+        "timestamp": row["timestamp"],
+        "name": f"{row['area']} Drain" if row["area"] else f"Sensor {row['sensor_id']}"
+    }
+
+
+def query_locations(conn, bbox=None):
+    """Sensors with their latest reading, all of them or those inside bbox"""
+    if bbox is None:
+        rows = conn.execute(f"""
+            SELECT {_LOCATION_COLUMNS}
+            FROM sensors s
+            LEFT JOIN sensor_latest l ON l.sensor_id = s.sensor_id
+            ORDER BY s.sensor_id
+        """).fetchall()
+    else:
+        where, params = _bbox_filter(bbox)
+        rows = conn.execute(f"""
+            SELECT {_LOCATION_COLUMNS}
+            FROM sensors_rtree r
+            JOIN sensors s ON s.rowid = r.id
+            LEFT JOIN sensor_latest l ON l.sensor_id = s.sensor_id
+            {where}
+            ORDER BY s.sensor_id
+        """, params).fetchall()
+    return [location_to_dict(row) for row in rows]
+
+
+def cluster_cell_degrees(zoom, bbox=None, radius_px=None):
+    """(longitude, latitude) size of a cluster cell at a zoom level"""
+    radius_px = radius_px or MAP_CLUSTER_RADIUS_PX
+    lon_cell = radius_px * 360.0 / (TILE_SIZE * 2 ** zoom)
+    # Away from the equator a degree of latitude is taller on screen. The
+    # viewport's latitude is rounded so panning does not reshuffle clusters
+    center_lat = round((bbox[1] + bbox[3]) / 2) if bbox is not None else 0
+    lat_cell = lon_cell * max(math.cos(math.radians(center_lat)), 0.01)
+    return lon_cell, lat_cell
+
+
+def query_clusters(conn, zoom, bbox=None, radius_px=None):
+    """
+    Sensors grouped into grid cells. Returns (locations, clusters): cells
+    holding a single sensor come back as ordinary locations, the rest as
+    {latitude, longitude, count, max_water_level, last_reading} clusters
+    centered on their sensors' mean position.
+    """
+    lon_cell, lat_cell = cluster_cell_degrees(zoom, bbox, radius_px)
+    where, params = _bbox_filter(bbox)
+    rows = conn.execute(f"""
+        SELECT COUNT(*) AS count,
+               AVG(s.latitude) AS latitude,
+               AVG(s.longitude) AS longitude,
+               MAX(l.water_level) AS water_level,
+               MAX(l.timestamp) AS timestamp,
+               MIN(s.sensor_id) AS sensor_id,
+               MIN(s.area) AS area
+        FROM sensors_rtree r
+        JOIN sensors s ON s.rowid = r.id
+        LEFT JOIN sensor_latest l ON l.sensor_id = s.sensor_id
+        {where}
+        GROUP BY CAST((r.min_lon + 180) / ? AS INTEGER), CAST((r.min_lat + 90) / ? AS INTEGER)
+    """, (*params, lon_cell, lat_cell)).fetchall()
+
+    locations = []
+    clusters = []
+    for row in rows:
+        if row["count"] == 1:
+            locations.append(location_to_dict(row))
+            continue
+        clusters.append({
+            "latitude": row["latitude"],
+            "longitude": row["longitude"],
+            "count": row["count"],
+            "max_water_level": row["water_level"] if row["water_level"] is not None else 0,
+            "last_reading": row["timestamp"]
+        })
+    locations.sort(key=lambda location: location["sensor_id"])
+    clusters.sort(key=lambda cluster: -cluster["count"])
+    return locations, clusters
@@ -0,0 +1,198 @@
+"""
+Incrementally maintained dashboard statistics.
+
+stats_counters holds running row counts for sensors, readings and alerts.
+stats_buckets holds reading count and water level sum per STATS_BUCKET_SECONDS
+window. Ingest updates both in the same transaction as the reading inserts,
+so the dashboard reads a handful of rows instead of scanning whole tables.
+reconcile() recomputes them from the source tables to correct any drift.
+"""
+import calendar
+import time
+
+STATS_BUCKET_SECONDS = 300  # 24h average is accurate to one bucket
+STATS_WINDOW_SECONDS = 24 * 60 * 60
+STATS_BUCKET_RETENTION_SECONDS = 2 * STATS_WINDOW_SECONDS
+
+_minute_cache = {}
+
+
+def minute_epoch(timestamp):
+    """
+    Epoch seconds of the minute holding a 'YYYY-MM-DD HH:MM:SS' UTC timestamp.
+    Cached per minute prefix - batches share a handful of minutes.
+    """
+    prefix = timestamp[:16]
+    epoch = _minute_cache.get(prefix)
+    if epoch is None:
+        epoch = calendar.timegm((
+            int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]),
+            int(prefix[11:13]), int(prefix[14:16]), 0
+        ))
+        if len(_minute_cache) > 10000:
+            _minute_cache.clear()
+        _minute_cache[prefix] = epoch
+    return epoch
+
+
+def bucket_for(timestamp):
+    """Epoch start of the stats bucket holding a UTC timestamp string"""
+    epoch = minute_epoch(timestamp)
+    return epoch - epoch % STATS_BUCKET_SECONDS
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def record_readings(conn, readings, alert_count):
+    """Add a batch of (sensor_id, water_level, timestamp) readings to the running stats"""
+    buckets = {}
+    for _, water_level, timestamp in readings:
+        try:
+            bucket = bucket_for(timestamp)
+        except (TypeError, ValueError):
+            continue
+        totals = buckets.get(bucket)
+        if totals is None:
+            totals = buckets[bucket] = [0, 0, 0.0]
+        totals[0] += 1
+        if _is_number(water_level):
+            totals[1] += 1
+            totals[2] += water_level
+
+    conn.executemany(
+        "UPDATE stats_counters SET value = value + ? WHERE name = ?",
+        [(len(readings), "readings"), (alert_count, "alerts")]
+    )
+    conn.executemany(
+        """
+        INSERT INTO stats_buckets(bucket, reading_count, level_count, level_sum) VALUES (?, ?, ?, ?)
+        ON CONFLICT(bucket) DO UPDATE SET
+            reading_count = reading_count + excluded.reading_count,
+            level_count = level_count + excluded.level_count,
+            level_sum = level_sum + excluded.level_sum
+        """,
+        [(bucket, *totals) for bucket, totals in buckets.items()]
+    )
+
+
+def read_stats(conn, now=None):
+    """
+    Running totals plus the rolling 24 hour reading count and average.
+    Reads three counter rows and at most one day of buckets.
+    """
+    now = time.time() if now is None else now
+    counters = {
+        row["name"]: row["value"]
+        for row in conn.execute("SELECT name, value FROM stats_counters")
+    }
+    window = conn.execute(
+        """
+        SELECT COALESCE(SUM(reading_count), 0) AS reading_count,
+               COALESCE(SUM(level_count), 0) AS level_count,
+               COALESCE(SUM(level_sum), 0) AS level_sum
+        FROM stats_buckets
+        WHERE bucket > ?
+        """,
+        (now - STATS_WINDOW_SECONDS - STATS_BUCKET_SECONDS,)
+    ).fetchone()
+
+    return {
+        "total_sensors": counters.get("sensors", 0),
+        "total_readings": counters.get("readings", 0),
+        "total_alerts": counters.get("alerts", 0),
+        "recent_readings_count": window["reading_count"],
+        "avg_water_level": window["level_sum"] / window["level_count"] if window["level_count"] else 0
+    }
+
+
+def _actual_counts(conn, since):
+    counters = {
+        "sensors": conn.execute("SELECT COUNT(*) AS count FROM sensors").fetchone()["count"],
+        "readings": conn.execute("SELECT COUNT(*) AS count FROM readings").fetchone()["count"],
+        "alerts": conn.execute("SELECT COUNT(*) AS count FROM alerts").fetchone()["count"],
+    }
+    buckets = {}
+    rows = conn.execute(
+        "SELECT water_level, timestamp FROM readings WHERE timestamp >= ?",
+        (time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(since)),)
+    )
+    for row in rows:
+        try:
+            bucket = bucket_for(str(row["timestamp"]))
+        except (TypeError, ValueError):
+            continue
+        totals = buckets.setdefault(bucket, [0, 0, 0.0])
+        totals[0] += 1
+        if _is_number(row["water_level"]):
+            totals[1] += 1
+            totals[2] += row["water_level"]
+    return counters, buckets
+
+
+def reconcile(read_conn, write_conn, now=None):
+    """
+    Recompute the counters and the last day of buckets from the tables.
+    The expensive counting runs in a read snapshot; only the differences
+    are applied in a short write transaction, so ingest keeps flowing and
+    readings committed in between are not lost or counted twice.
+    Returns {"counters": {...}, "buckets": n} describing corrections made.
+    """
+    now = time.time() if now is None else now
+    since = now - now % STATS_BUCKET_SECONDS - STATS_WINDOW_SECONDS - STATS_BUCKET_SECONDS
+
+    read_conn.execute("BEGIN")
+    try:
+        actual_counters, actual_buckets = _actual_counts(read_conn, since)
+        stored_counters = {
+            row["name"]: row["value"]
+            for row in read_conn.execute("SELECT name, value FROM stats_counters")
+        }
+        stored_buckets = {
+            row["bucket"]: [row["reading_count"], row["level_count"], row["level_sum"]]
+            for row in read_conn.execute(
+                "SELECT bucket, reading_count, level_count, level_sum FROM stats_buckets WHERE bucket >= ?",
+                (since,)
+            )
+        }
+    finally:
+        read_conn.rollback()
+
+    counter_drift = {
+        name: actual - stored_counters.get(name, 0)
+        for name, actual in actual_counters.items()
+        if actual != stored_counters.get(name, 0)
+    }
+    bucket_drift = []
+    for bucket in set(actual_buckets) | set(stored_buckets):
+        actual = actual_buckets.get(bucket, [0, 0, 0.0])
+        stored = stored_buckets.get(bucket, [0, 0, 0.0])
+        if actual[0] != stored[0] or actual[1] != stored[1] or abs(actual[2] - stored[2]) > 1e-6:
+            bucket_drift.append((bucket, actual[0] - stored[0], actual[1] - stored[1], actual[2] - stored[2]))
+
+    write_conn.executemany(
+        """
+        INSERT INTO stats_counters(name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        """,
+        list(counter_drift.items())
+    )
+    write_conn.executemany(
+        """
+        INSERT INTO stats_buckets(bucket, reading_count, level_count, level_sum) VALUES (?, ?, ?, ?)
+        ON CONFLICT(bucket) DO UPDATE SET
+            reading_count = reading_count + excluded.reading_count,
+            level_count = level_count + excluded.level_count,
+            level_sum = level_sum + excluded.level_sum
+        """,
+        bucket_drift
+    )
+    # Buckets that fell out of the window are never read again
+    write_conn.execute(
+        "DELETE FROM stats_buckets WHERE bucket < ?",
+        (now - STATS_BUCKET_RETENTION_SECONDS,)
+    )
+    write_conn.commit()
+
+    return {"counters": counter_drift, "buckets": len(bucket_drift)}
@@ -0,0 +1,80 @@
+"""
+Storage backends for readings.
+
+Endpoints reach the readings through a storage object instead of SQL of
+their own: ingest, the newest reading, keyset-paged ranges, bucketed
+aggregates, and the incremental feeds that keep the analytics store
+(analytics.py) and other workers' event streams up to date. Methods take
+a connection from connect(), so callers keep control of transactions as
+they do with insert_readings.
+
+SQLite (database.py) is the default and only primary backend.
+STORAGE_BACKEND picks one from STORAGE_BACKENDS by name, so another store
+can be added there without touching the endpoints.
+"""
+from database import get_db, get_read_db
+from ingest import insert_readings
+from pagination import fetch_page
+from rollups import query_aggregate
+
+
+class SQLiteStorage:
+    name = "sqlite"
+
+    def connect(self, write=False):
+        """Pooled connection; close() hands it back"""
+        return get_db() if write else get_read_db()
+
+    def insert(self, conn, readings, alert_engine):
+        """Store validated readings; the caller commits. Returns an InsertResult."""
+        return insert_readings(conn, readings, alert_engine)
+
+    def latest(self, conn):
+        """Newest reading, or None"""
+        return conn.execute(
+            "SELECT id, sensor_id, water_level, timestamp FROM readings ORDER BY timestamp DESC LIMIT 1"
+        ).fetchone()
+
+    def readings_page(self, conn, limit, **filters):
+        """(rows, next_cursor); filters as for pagination.fetch_page"""
+        return fetch_page(conn, "readings", limit, **filters)
+
+    def aggregate(self, conn, sensor_id, start, end, bucket_seconds):
+        """(level_name, points) from the rollup tables"""
+        return query_aggregate(conn, sensor_id, start, end, bucket_seconds)
+
+    def readings_after(self, conn, after_id, limit):
+        """Up to limit readings with id above after_id, in id (commit) order"""
+        return conn.execute(
+            "SELECT id, sensor_id, water_level, timestamp FROM readings WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit)
+        ).fetchall()
+
+    def last_reading_id(self, conn):
+        return conn.execute("SELECT MAX(id) FROM readings").fetchone()[0] or 0
+
+    def alerts_after(self, conn, after_id, limit):
+        """Up to limit alert episodes with id above after_id, in id (commit) order"""
+        return conn.execute(
+            "SELECT id, sensor_id, water_level, timestamp FROM alerts WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit)
+        ).fetchall()
+
+    def last_alert_id(self, conn):
+        return conn.execute("SELECT MAX(id) FROM alerts").fetchone()[0] or 0
+
+    def sensor_areas(self, conn):
+        """(sensor_id, area, latitude, longitude) for every registered sensor"""
+        return conn.execute("SELECT sensor_id, area, latitude, longitude FROM sensors").fetchall()
+
+
+STORAGE_BACKENDS = {
+    "sqlite": SQLiteStorage,
+}
+
+
+def open_storage(name):
+    try:
+        return STORAGE_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown storage backend '{name}' (known: {', '.join(STORAGE_BACKENDS)})") from None
@@ -2,10 +2,13 @@ import React, { useEffect, useRef } from 'react';
 import maplibregl from 'maplibre-gl';
 import 'maplibre-gl/dist/maplibre-gl.css';
 
-const DrainageMap = ({ drainageLocations = [] }) => {
+const DrainageMap = ({ drainageLocations = [], clusters = [], onViewportChange }) => {
   const mapContainer = useRef(null);
   const map = useRef(null);
   const markers = useRef([]);
+  const hasFitted = useRef(false);
+  const viewportCallback = useRef(onViewportChange);
+  viewportCallback.current = onViewportChange;
 
   // Function to get marker color based on water level
   const getMarkerColor = (waterLevel) => {
@@ -29,18 +32,23 @@ const DrainageMap = ({ drainageLocations = [] }) => {
     // Only initialize map once
     if (map.current) return;
 
-    // Calculate center point from drainage locations
+    // Calculate center point from drainage locations and clusters
     let centerLat = 0;
     let centerLng = 0;
 
-    if (drainageLocations.length > 0) {
-      const sum = drainageLocations.reduce((acc, loc) => ({
-        lat: acc.lat + loc.latitude,
-        lng: acc.lng + loc.longitude
-      }), { lat: 0, lng: 0 });
+    const points = [
+      ...drainageLocations.map((loc) => ({ ...loc, count: 1 })),
+      ...clusters
+    ];
+    if (points.length > 0) {
+      const sum = points.reduce((acc, point) => ({
+        lat: acc.lat + point.latitude * point.count,
+        lng: acc.lng + point.longitude * point.count,
+        count: acc.count + point.count
+      }), { lat: 0, lng: 0, count: 0 });
 
-      centerLat = sum.lat / drainageLocations.length;
-      centerLng = sum.lng / drainageLocations.length;
+      centerLat = sum.lat / sum.count;
+      centerLng = sum.lng / sum.count;
     } else {
       // Default to a reasonable location if no data
       centerLat = 43.6532; // Toronto
@@ -52,7 +60,7 @@ const DrainageMap = ({ drainageLocations = [] }) => {
       container: mapContainer.current,
       style: 'https://basemaps.cartocdn.com/gl/voyager-gl-style/style.json', // Free tile service
       center: [centerLng, centerLat],
-      zoom: drainageLocations.length > 0 ? 12 : 10,
+      zoom: points.length > 0 ? 12 : 10,
       // Enable touch gestures
       touchZoomRotate: true,
       touchPitch: true,
@@ -77,6 +85,17 @@ const DrainageMap = ({ drainageLocations = [] }) => {
       unit: 'metric'
     }), 'bottom-left');
 
+    // Report the visible area after every pan or zoom so the page can load
+    // only the sensors (or clusters) in view
+    map.current.on('moveend', () => {
+      if (!viewportCallback.current) return;
+      const bounds = map.current.getBounds();
+      viewportCallback.current({
+        bbox: [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()],
+        zoom: map.current.getZoom()
+      });
+    });
+
     // Clean up on unmount
     return () => {
       if (map.current) {
@@ -86,7 +105,7 @@ const DrainageMap = ({ drainageLocations = [] }) => {
     };
   }, []); // eslint-disable-line react-hooks/exhaustive-deps
 
-  // Update markers when drainage locations change
+  // Update markers when drainage locations or clusters change
   useEffect(() => {
     if (!map.current) return;
 
@@ -164,21 +183,67 @@ const DrainageMap = ({ drainageLocations = [] }) => {
       markers.current.push(marker);
     });
 
-    // Fit map to show all markers if there are multiple locations
-    if (drainageLocations.length > 1) {
+    // One marker per cluster, sized by sensor count and colored by its highest level
+    clusters.forEach((cluster) => {
+      const color = getMarkerColor(cluster.max_water_level);
+      const size = Math.min(30 + Math.log10(cluster.count) * 12, 64);
+
+      const el = document.createElement('div');
+      el.className = 'custom-marker';
+      el.style.backgroundColor = color;
+      el.style.width = `${size}px`;
+      el.style.height = `${size}px`;
+      el.style.borderRadius = '50%';
+      el.style.border = '3px solid white';
+      el.style.boxShadow = '0 2px 8px rgba(0,0,0,0.3)';
+      el.style.cursor = 'pointer';
+      el.style.display = 'flex';
+      el.style.alignItems = 'center';
+      el.style.justifyContent = 'center';
+      el.style.color = 'white';
+      el.style.fontWeight = 'bold';
+      el.style.fontSize = '13px';
+      el.textContent = cluster.count;
+
+      if (cluster.max_water_level >= 70) {
+        el.style.animation = 'pulse 2s infinite';
+      }
+
+      // Zoom in on click; the next viewport load splits the cluster
+      el.addEventListener('click', () => {
+        map.current.flyTo({
+          center: [cluster.longitude, cluster.latitude],
+          zoom: map.current.getZoom() + 2,
+          essential: true
+        });
+      });
+
+      const marker = new maplibregl.Marker({ element: el })
+        .setLngLat([cluster.longitude, cluster.latitude])
+        .addTo(map.current);
+
+      markers.current.push(marker);
+    });
+
+    // Fit map to the data once; after that the viewport drives what is loaded
+    if (hasFitted.current) return;
+    const points = [...drainageLocations, ...clusters];
+    if (points.length > 1) {
       const bounds = new maplibregl.LngLatBounds();
-      drainageLocations.forEach(loc => {
-        bounds.extend([loc.longitude, loc.latitude]);
+      points.forEach(point => {
+        bounds.extend([point.longitude, point.latitude]);
       });
       map.current.fitBounds(bounds, { padding: 50, maxZoom: 14 });
+      hasFitted.current = true;
     } else if (drainageLocations.length === 1) {
       map.current.flyTo({
         center: [drainageLocations[0].longitude, drainageLocations[0].latitude],
         zoom: 15,
         essential: true
       });
+      hasFitted.current = true;
     }
-  }, [drainageLocations]);
+  }, [drainageLocations, clusters]);
 
   return (
     <div className="relative w-full h-full">
@@ -0,0 +1,61 @@
+// Subscribe to the backend's Server-Sent Events stream (/api/stream).
+// handlers maps event names ('readings', 'alerts', 'sensor', 'resync') to
+// callbacks receiving the parsed event data. While the stream is down (or
+// EventSource is unsupported) fallbackPoll runs every pollInterval ms, and
+// once more when the stream reconnects so nothing published in between is
+// missed. Returns a function that closes the stream and stops polling.
+const subscribeToLiveUpdates = (handlers, fallbackPoll, pollInterval = 30000) => {
+  let pollTimer = null;
+
+  const startPolling = () => {
+    if (!pollTimer && fallbackPoll) {
+      pollTimer = setInterval(fallbackPoll, pollInterval);
+    }
+  };
+
+  const stopPolling = () => {
+    if (pollTimer) {
+      clearInterval(pollTimer);
+      pollTimer = null;
+    }
+  };
+
+  if (typeof window === 'undefined' || !window.EventSource) {
+    startPolling();
+    return stopPolling;
+  }
+
+  const source = new EventSource('/api/stream');
+  let wasDown = false;
+
+  source.onopen = () => {
+    if (wasDown && fallbackPoll) {
+      fallbackPoll();
+    }
+    wasDown = false;
+    stopPolling();
+  };
+
+  source.onerror = () => {
+    // EventSource retries on its own; poll until it is back
+    wasDown = true;
+    startPolling();
+  };
+
+  Object.entries(handlers).forEach(([eventName, handler]) => {
+    source.addEventListener(eventName, (event) => {
+      try {
+        handler(JSON.parse(event.data));
+      } catch (error) {
+        console.error(`Failed to handle ${eventName} event:`, error);
+      }
+    });
+  });
+
+  return () => {
+    source.close();
+    stopPolling();
+  };
+};
+
+export default subscribeToLiveUpdates;
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { gsap } from 'gsap';
+import subscribeToLiveUpdates from '../liveUpdates';
 
 const Dashboard = ({ onNavigate }) => {
   const [dashboardData, setDashboardData] = useState({
@@ -61,27 +62,66 @@ const Dashboard = ({ onNavigate }) => {
     };
   }, [autoRefresh]); // eslint-disable-line react-hooks/exhaustive-deps
 
+  useEffect(() => {
+    // Merge pushed readings, alerts and sensor changes into the loaded data;
+    // falls back to reloading everything every 30 seconds without a stream
+    return subscribeToLiveUpdates({
+      readings: (event) => {
+        const newest = [...event.readings].reverse();
+        setDashboardData((current) => ({
+          ...current,
+          stats: {
+            ...current.stats,
+            total_readings: current.stats.total_readings + event.count,
+            latest_reading: newest[0] || current.stats.latest_reading
+          },
+          readings: [...newest, ...current.readings].slice(0, 20)
+        }));
+      },
+      alerts: (event) => {
+        setDashboardData((current) => ({
+          ...current,
+          stats: {
+            ...current.stats,
+            total_alerts: current.stats.total_alerts + event.count
+          },
+          alerts: [...[...event.alerts].reverse(), ...current.alerts].slice(0, 10)
+        }));
+      },
+      sensor: (sensor) => {
+        setDashboardData((current) => {
+          const exists = current.sensors.some((s) => s.sensor_id === sensor.sensor_id);
+          return {
+            ...current,
+            stats: {
+              ...current.stats,
+              total_sensors: current.stats.total_sensors + (exists ? 0 : 1)
+            },
+            sensors: exists
+              ? current.sensors.map((s) => (s.sensor_id === sensor.sensor_id ? { ...s, ...sensor } : s))
+              : [...current.sensors, sensor]
+          };
+        });
+      },
+      resync: () => loadDashboardData()
+    }, loadDashboardData, 30000);
+  }, []); // eslint-disable-line react-hooks/exhaustive-deps
+
   const loadDashboardData = async () => {
     setIsLoading(true);
     try {
-      const [statsRes, sensorsRes, readingsRes, alertsRes] = await Promise.all([
-        fetch('/api/dashboard/stats'),
-        fetch('/api/sensors'),
-        fetch('/api/readings?limit=20'),
-        fetch('/api/alerts?limit=10')
-      ]);
-
-      const statsData = await statsRes.json();
-      const sensorsData = await sensorsRes.json();
-      const readingsData = await readingsRes.json();
-      const alertsData = await alertsRes.json();
-
-      setDashboardData({
-        stats: statsData.stats || dashboardData.stats,
-        sensors: sensorsData.sensors || [],
-        readings: readingsData.readings || [],
-        alerts: alertsData.alerts || []
-      });
+      // Stats, sensors, readings and alerts in one request
+      const response = await fetch('/api/dashboard/snapshot?readings_limit=20&alerts_limit=10');
+      const data = await response.json();
+
+      if (data.success) {
+        setDashboardData({
+          stats: data.stats || dashboardData.stats,
+          sensors: data.sensors || [],
+          readings: data.readings || [],
+          alerts: data.alerts || []
+        });
+      }
     } catch (error) {
       console.error('Failed to load dashboard data:', error);
     } finally {
@@ -108,8 +148,7 @@ const Dashboard = ({ onNavigate }) => {
       if (data.success) {
         // Set last stored timestamp
         setLastStored(new Date().toLocaleTimeString());
-        // Reload dashboard data to reflect new reading
-        await loadDashboardData();
+        // The new reading arrives over the live stream
         return { success: true, message: `Data stored: ${data.data.sensor_value}` };
       } else {
         return { success: false, message: data.error };
@@ -1,8 +1,12 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import DrainageMap from '../components/DrainageMap';
+import subscribeToLiveUpdates from '../liveUpdates';
 
 const Map = () => {
   const [drainageLocations, setDrainageLocations] = useState([]);
+  const [clusters, setClusters] = useState([]);
+  const [sensorCount, setSensorCount] = useState(0);
+  const viewport = useRef(null);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState(null);
   const [customLatitude, setCustomLatitude] = useState('');
@@ -13,21 +17,41 @@ const Map = () => {
     // Fetch drainage locations
     fetchDrainageLocations();
 
-    // Auto-refresh every 30 seconds
-    const interval = setInterval(() => {
-      fetchDrainageLocations();
-    }, 30000);
-
-    return () => clearInterval(interval);
-  }, []);
-
+    // Update markers from the live stream; refresh every 30 seconds only
+    // while the stream is unavailable
+    return subscribeToLiveUpdates({
+      readings: (event) => {
+        const latestBySensor = {};
+        event.readings.forEach((reading) => {
+          latestBySensor[reading.sensor_id] = reading;
+        });
+        setDrainageLocations((current) => current.map((location) => {
+          const reading = latestBySensor[location.sensor_id];
+          return reading && (!location.timestamp || reading.timestamp >= location.timestamp)
+            ? { ...location, water_level: reading.water_level, timestamp: reading.timestamp }
+            : location;
+        }));
+      },
+      // A new or moved sensor may join a cluster; reload the current view
+      sensor: () => fetchDrainageLocations(),
+      resync: () => fetchDrainageLocations()
+    }, fetchDrainageLocations, 30000);
+  }, []); // eslint-disable-line react-hooks/exhaustive-deps
+
+  // Sensors in the visible area only; before the map reports its viewport,
+  // a zoomed-out overview of clusters
   const fetchDrainageLocations = async () => {
+    const params = viewport.current
+      ? `bbox=${viewport.current.bbox.map((value) => value.toFixed(5)).join(',')}&zoom=${Math.floor(viewport.current.zoom)}`
+      : 'zoom=3';
     try {
-      const response = await fetch('/api/drainage-locations');
+      const response = await fetch(`/api/drainage-locations?${params}`);
       const data = await response.json();
 
       if (data.success) {
         setDrainageLocations(data.locations || []);
+        setClusters(data.clusters || []);
+        setSensorCount(data.count || 0);
         setError(null);
       } else {
         setError(data.error || 'Failed to load drainage locations');
@@ -72,6 +96,11 @@ const Map = () => {
     setCustomLocation(newLocation);
   };
 
+  const handleViewportChange = (nextViewport) => {
+    viewport.current = nextViewport;
+    fetchDrainageLocations();
+  };
+
   // Combine drainage locations with custom location if it exists
   const allLocations = customLocation
     ? [...drainageLocations, customLocation]
@@ -119,7 +148,7 @@ const Map = () => {
             )}
             <div className="flex items-center gap-3 ml-4">
               <div className="text-xs text-flowra-300">
-                Locations: <span className="text-white font-bold">{allLocations.length}</span>
+                Locations: <span className="text-white font-bold">{sensorCount + (customLocation ? 1 : 0)}</span>
               </div>
               <button
                 onClick={fetchDrainageLocations}
@@ -143,7 +172,7 @@ const Map = () => {
           </div>
         )}
 
-        {isLoading && allLocations.length === 0 ? (
+        {isLoading && allLocations.length === 0 && clusters.length === 0 ? (
           <div className="flex items-center justify-center h-full bg-flowra-900">
             <div className="text-center">
               <i className="fas fa-spinner fa-spin text-6xl text-flowra-400 mb-4"></i>
@@ -151,7 +180,11 @@ const Map = () => {
             </div>
           </div>
         ) : (
-          <DrainageMap drainageLocations={allLocations} />
+          <DrainageMap
+            drainageLocations={allLocations}
+            clusters={clusters}
+            onViewportChange={handleViewportChange}
+          />
         )}
       </div>
     </div>
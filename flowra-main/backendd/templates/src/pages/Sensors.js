@@ -10,6 +10,9 @@ const Sensors = () => {
   const [message, setMessage] = useState({ type: '', text: '' });
   const [sensors, setSensors] = useState([]);
   const [isLoadingSensors, setIsLoadingSensors] = useState(true);
+  const [importFile, setImportFile] = useState(null);
+  const [isImporting, setIsImporting] = useState(false);
+  const [importResult, setImportResult] = useState(null);
 
   useEffect(() => {
     fetchSensors();
@@ -98,6 +101,36 @@ const Sensors = () => {
     }
   };
 
+  const handleImport = async (e) => {
+    e.preventDefault();
+    if (!importFile) {
+      return;
+    }
+    setIsImporting(true);
+    setImportResult(null);
+
+    // One request for the whole file; the server validates and upserts in chunks
+    const formData = new FormData();
+    formData.append('file', importFile);
+
+    try {
+      const response = await fetch('/api/sensors/import', {
+        method: 'POST',
+        body: formData
+      });
+      const data = await response.json();
+      setImportResult(data);
+      if (data.success) {
+        fetchSensors();
+      }
+    } catch (error) {
+      console.error('Error importing sensors:', error);
+      setImportResult({ success: false, error: 'Failed to connect to server' });
+    } finally {
+      setIsImporting(false);
+    }
+  };
+
   return (
     <div className="content-section" style={{ paddingTop: '100px' }}>
       <div className="max-w-6xl mx-auto px-4">
@@ -238,6 +271,70 @@ const Sensors = () => {
           </form>
         </div>
 
+        {/* Bulk Import */}
+        <div className="glass-card p-6 mb-8">
+          <h2 className="text-2xl font-bold text-flowra-100 mb-2 flex items-center gap-2">
+            <i className="fas fa-file-import text-flowra-400"></i>
+            Import Sensor Locations
+          </h2>
+          <p className="text-sm text-flowra-300 mb-4">
+            CSV with columns sensor_id, latitude, longitude, area (optional), or a GeoJSON file of Point features
+          </p>
+
+          <form onSubmit={handleImport} className="flex flex-col md:flex-row items-start md:items-center gap-4">
+            <input
+              type="file"
+              accept=".csv,.geojson,.json"
+              onChange={(e) => setImportFile(e.target.files[0] || null)}
+              className="text-flowra-200"
+            />
+            <button
+              type="submit"
+              disabled={!importFile || isImporting}
+              className="px-6 py-2 bg-flowra-600 text-white font-bold rounded-lg hover:bg-flowra-500 disabled:opacity-50 disabled:cursor-not-allowed border-2 border-flowra-400 transition-all"
+            >
+              {isImporting ? (
+                <>
+                  <i className="fas fa-spinner fa-spin mr-2"></i>
+                  Importing...
+                </>
+              ) : (
+                <>
+                  <i className="fas fa-upload mr-2"></i>
+                  Import
+                </>
+              )}
+            </button>
+          </form>
+
+          {importResult && (
+            <div className={`mt-4 p-4 rounded-lg border ${
+              importResult.success
+                ? 'bg-green-500 bg-opacity-20 border-green-500 text-green-300'
+                : 'bg-red-500 bg-opacity-20 border-red-500 text-red-300'
+            }`}>
+              {importResult.success ? (
+                <>
+                  <p>
+                    {importResult.imported} sensor(s) imported ({importResult.inserted} new, {importResult.updated} updated), {importResult.rejected} rejected
+                  </p>
+                  {importResult.errors.length > 0 && (
+                    <ul className="mt-2 text-sm text-red-300 max-h-40 overflow-y-auto">
+                      {importResult.errors.map((rowError) => (
+                        <li key={rowError.index}>
+                          Row {rowError.index + 1}{rowError.sensor_id ? ` (${rowError.sensor_id})` : ''}: {rowError.error}
+                        </li>
+                      ))}
+                    </ul>
+                  )}
+                </>
+              ) : (
+                <p>{importResult.error || 'Failed to import sensors'}</p>
+              )}
+            </div>
+          )}
+        </div>
+
         {/* Registered Sensors List */}
         <div className="glass-card p-6">
           <h2 className="text-2xl font-bold text-flowra-100 mb-6 flex items-center gap-2">
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { gsap } from 'gsap';
+import subscribeToLiveUpdates from '../liveUpdates';
 
 const ViewDashboard = () => {
   const [dashboardData, setDashboardData] = useState({
@@ -39,35 +40,55 @@ const ViewDashboard = () => {
     loadDashboardData();
     fetchLatestReading();
 
-    // Auto-refresh latest reading every 5 seconds
-    const interval = setInterval(() => {
-      fetchLatestReading();
-    }, 5000);
-
-    return () => clearInterval(interval);
+    // Latest reading is pushed over the live stream; poll every 5 seconds
+    // only while the stream is unavailable
+    return subscribeToLiveUpdates({
+      readings: (event) => {
+        const latest = event.readings[event.readings.length - 1];
+        if (latest) {
+          setLatestReading(latest);
+        }
+        setDashboardData((current) => ({
+          ...current,
+          stats: {
+            ...current.stats,
+            total_readings: current.stats.total_readings + event.count
+          },
+          readings: [...[...event.readings].reverse(), ...current.readings].slice(0, 5)
+        }));
+      },
+      alerts: (event) => {
+        setDashboardData((current) => ({
+          ...current,
+          stats: {
+            ...current.stats,
+            total_alerts: current.stats.total_alerts + event.count
+          },
+          alerts: [...[...event.alerts].reverse(), ...current.alerts].slice(0, 5)
+        }));
+      },
+      resync: () => {
+        loadDashboardData();
+        fetchLatestReading();
+      }
+    }, fetchLatestReading, 5000);
   }, []); // eslint-disable-line react-hooks/exhaustive-deps
 
   const loadDashboardData = async () => {
     setIsLoading(true);
     try {
-      const [statsRes, sensorsRes, readingsRes, alertsRes] = await Promise.all([
-        fetch('/api/dashboard/stats'),
-        fetch('/api/sensors'),
-        fetch('/api/readings?limit=5'),
-        fetch('/api/alerts?limit=5')
-      ]);
-
-      const statsData = await statsRes.json();
-      const sensorsData = await sensorsRes.json();
-      const readingsData = await readingsRes.json();
-      const alertsData = await alertsRes.json();
-
-      setDashboardData({
-        stats: statsData.stats || dashboardData.stats,
-        sensors: sensorsData.sensors || [],
-        readings: readingsData.readings || [],
-        alerts: alertsData.alerts || []
-      });
+      // Stats, sensors, readings and alerts in one request
+      const response = await fetch('/api/dashboard/snapshot?readings_limit=5&alerts_limit=5');
+      const data = await response.json();
+
+      if (data.success) {
+        setDashboardData({
+          stats: data.stats || dashboardData.stats,
+          sensors: data.sensors || [],
+          readings: data.readings || [],
+          alerts: data.alerts || []
+        });
+      }
     } catch (error) {
       console.error('Failed to load dashboard data:', error);
     } finally {
@@ -89,9 +110,8 @@ const ViewDashboard = () => {
       });
 
       const data = await response.json();
-      if (data.success) {
-        await loadDashboardData(); // Refresh data
-        await fetchLatestReading(); // Refresh latest reading
+      if (!data.success) {
+        console.error('Failed to store reading:', data.error);
       }
     } catch (error) {
       console.error('Failed to store reading:', error);
@@ -0,0 +1,46 @@
+"""
+Shared setup for the backend tests.
+
+The backend modules read their configuration from the environment at
+import time, so every path they write to is pointed at a scratch
+directory before any test imports them.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+WORKDIR = tempfile.mkdtemp(prefix="flowra-tests-")
+os.environ["DATABASE_PATH"] = os.path.join(WORKDIR, "flowra-test.db")
+os.environ["ARCHIVE_DIR"] = os.path.join(WORKDIR, "archive")
+os.environ["ANALYTICS_DIR"] = os.path.join(WORKDIR, "analytics")
+os.environ["LEADER_LOCK_PATH"] = os.path.join(WORKDIR, "flowra-test.leader")
+os.environ["FLASK_DEBUG"] = "false"
+os.environ["FLEET_POLLING"] = "false"
+os.environ["INGEST_WRITE_BEHIND"] = "false"
+
+from fake_blynk import FakeBlynk  # noqa: E402
+
+
+@pytest.fixture
+def fake_blynk():
+    fake = FakeBlynk(seed=1).start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture(scope="session")
+def backend():
+    """The app module, migrated and ready to serve"""
+    import app
+    app.create_app()
+    return app
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
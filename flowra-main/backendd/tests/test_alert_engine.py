@@ -0,0 +1,101 @@
+import itertools
+import time
+
+import pytest
+
+from alert_engine import AlertEngine
+from database import get_db
+from ingest import insert_readings
+
+_timestamps = itertools.count()
+
+
+def next_timestamp():
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1706745600 + next(_timestamps)))
+
+
+def write(engine, sensor_id, level, sync=True):
+    """One reading through engine, as a worker of a multi-process server stores it"""
+    conn = get_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if sync:
+            engine.sync(conn)
+        result = insert_readings(conn, [(sensor_id, level, next_timestamp())], engine)
+        conn.commit()
+    finally:
+        conn.close()
+    return result.alert_flags[0]
+
+
+def episodes(sensor_id):
+    conn = get_db()
+    try:
+        return [
+            (row["status"], row["reading_count"])
+            for row in conn.execute("SELECT status, reading_count FROM alerts WHERE sensor_id = ? ORDER BY id", (sensor_id,))
+        ]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def engines(backend):
+    """Two workers' engines sharing the test database"""
+    pair = [AlertEngine(threshold=70, hysteresis=5, debounce=3) for _ in range(2)]
+    conn = get_db()
+    try:
+        for engine in pair:
+            engine.load(conn)
+    finally:
+        conn.close()
+    return pair
+
+
+def test_streaks_carry_over_between_workers(engines):
+    first, second = engines
+
+    # Requests alternate between the workers
+    flags = [write(engines[index % 2], "two-workers", 90) for index in range(8)]
+
+    assert flags == [False, False, True, False, False, False, False, False]
+    assert episodes("two-workers") == [("active", 8)]
+    assert first.active() == second.active()
+
+    # Three readings below the clear threshold close it, again across both workers
+    for index in range(3):
+        write(engines[index % 2], "two-workers", 10)
+    assert episodes("two-workers") == [("resolved", 11)]
+    assert "two-workers" not in first.active()
+    # The other worker catches up at its next write
+    assert write(second, "two-workers", 10) is False
+    assert "two-workers" not in second.active()
+    assert episodes("two-workers") == [("resolved", 11)]
+
+
+def test_sync_reads_only_sensors_another_worker_moved(engines):
+    first, second = engines
+    write(first, "quiet", 90)
+    write(second, "busy", 90)
+    write(first, "busy", 90)
+
+    # "quiet" is not reloaded: its streak stays as this engine left it
+    assert first._states["quiet"].streak == 1
+    assert first._states["busy"].streak == 2
+    assert write(second, "busy", 90) is True
+
+
+def test_restarted_engine_resumes_streaks(backend, engines):
+    first, _ = engines
+    write(first, "restart", 90, sync=False)
+    write(first, "restart", 90, sync=False)
+
+    restarted = AlertEngine(threshold=70, hysteresis=5, debounce=3)
+    conn = get_db()
+    try:
+        restarted.load(conn)
+    finally:
+        conn.close()
+
+    assert write(restarted, "restart", 90, sync=False) is True
+    assert episodes("restart") == [("active", 3)]
@@ -0,0 +1,122 @@
+import calendar
+import sqlite3
+import time
+
+import pytest
+
+import archive
+import manage
+from alert_engine import AlertEngine
+from database import get_db, get_read_db
+from ingest import insert_readings
+
+
+def epoch(timestamp):
+    return calendar.timegm(time.strptime(timestamp, "%Y-%m-%d %H:%M:%S"))
+
+
+def store(readings):
+    conn = get_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        insert_readings(conn, readings, AlertEngine(threshold=1000))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def archive_before(timestamp, table="readings"):
+    """Archive the table's rows older than timestamp"""
+    read_conn = get_read_db()
+    write_conn = get_db()
+    try:
+        return archive.archive_table(read_conn, write_conn, table, 1, now=epoch(timestamp) + 86400)
+    finally:
+        read_conn.close()
+        write_conn.close()
+
+
+def day_rollups(sensor_id):
+    conn = get_read_db()
+    try:
+        return [
+            (row["bucket"], row["count"], row["last_level"])
+            for row in conn.execute(
+                "SELECT bucket, count, last_level FROM readings_rollup_day WHERE sensor_id = ? ORDER BY bucket",
+                (sensor_id,)
+            )
+        ]
+    finally:
+        conn.close()
+
+
+def test_rebuild_keeps_rollups_of_archived_readings(backend):
+    store([("rollup-kept", 10.0, "2019-12-10 00:00:30"), ("rollup-kept", 20.0, "2020-03-10 00:00:30")])
+    assert archive_before("2020-01-01 00:00:00") >= 1
+    expected = [(epoch("2019-12-10 00:00:00"), 1, 10.0), (epoch("2020-03-10 00:00:00"), 1, 20.0)]
+    assert day_rollups("rollup-kept") == expected
+
+    assert manage.rebuild_rollup_tables() == 0
+
+    assert day_rollups("rollup-kept") == expected
+
+
+@pytest.fixture
+def small_passes(monkeypatch):
+    """Retention passes of 3 rows, archive chunks of up to 50"""
+    monkeypatch.setattr(archive, "RETENTION_CHUNK_SIZE", 3)
+    monkeypatch.setattr(archive, "RETENTION_PAUSE_MS", 0)
+    monkeypatch.setattr(archive, "ARCHIVE_CHUNK_ROWS", 50)
+
+
+def chunk_sizes(month):
+    conn = sqlite3.connect(archive.archive_path("readings", month))
+    try:
+        return conn.execute("SELECT sensor_id, row_count FROM chunks ORDER BY sensor_id, id").fetchall()
+    finally:
+        conn.close()
+
+
+def history(start, end, limit=None):
+    conn = get_read_db()
+    try:
+        return archive.query_history(conn, "readings", start, end, limit=limit)
+    finally:
+        conn.close()
+
+
+def test_passes_top_up_each_sensors_chunk(backend, small_passes):
+    # Interleaved in time, so every pass touches several sensors
+    readings = [
+        (f"chunked-{sensor}", float(minute), f"2018-05-01 00:{minute:02d}:{sensor:02d}")
+        for minute in range(20) for sensor in range(4)
+    ]
+    readings += [("chunked-busy", float(minute % 60), f"2018-05-02 {minute // 60:02d}:{minute % 60:02d}:00") for minute in range(120)]
+    store(readings)
+
+    archive_before("2018-06-01 00:00:00")
+
+    assert chunk_sizes("2018-05") == [
+        ("chunked-0", 20), ("chunked-1", 20), ("chunked-2", 20), ("chunked-3", 20),
+        ("chunked-busy", 50), ("chunked-busy", 50), ("chunked-busy", 20)
+    ]
+    rows = history("2018-05-01 00:00:00", "2018-06-01 00:00:00")
+    assert len(rows) == 200
+    assert [(row["timestamp"], row["id"]) for row in rows] == sorted((row["timestamp"], row["id"]) for row in rows)
+
+
+def test_limited_history_inflates_only_the_chunks_it_needs(backend, small_passes, monkeypatch):
+    # One sensor per day, so their chunks do not overlap in time
+    store([
+        (f"streamed-{day}", float(hour), f"2018-03-{day:02d} {hour:02d}:00:00")
+        for day in range(1, 29) for hour in range(5)
+    ])
+    archive_before("2018-04-01 00:00:00")
+    decoded = []
+    decode = archive._decode
+    monkeypatch.setattr(archive, "_decode", lambda payload: decoded.append(1) or decode(payload))
+
+    rows = history("2018-03-01 00:00:00", "2018-04-01 00:00:00", limit=7)
+
+    assert [row["sensor_id"] for row in rows] == ["streamed-1"] * 5 + ["streamed-2"] * 2
+    assert len(decoded) == 2
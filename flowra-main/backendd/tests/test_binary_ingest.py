@@ -0,0 +1,240 @@
+import struct
+import threading
+import time
+import zlib
+
+import pytest
+
+from binary_ingest import (
+    CONTENT_TYPE, MISSING, decode_frames, encode_frame, frame_readings
+)
+from database import get_read_db
+
+START = 1700000000  # 2023-11-14 22:13:20 UTC
+
+
+def stored_levels(sensor_id):
+    conn = get_read_db()
+    try:
+        rows = conn.execute(
+            "SELECT water_level, timestamp FROM readings WHERE sensor_id = ? ORDER BY timestamp", (sensor_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [(row["water_level"], row["timestamp"]) for row in rows]
+
+
+def post(client, body):
+    return client.post("/api/ingest/binary", data=body, content_type=CONTENT_TYPE)
+
+
+def test_round_trip_single_channel():
+    frame_bytes = encode_frame("tank-1", 7, START, [1.25, 2.5, -0.75], interval=10)
+
+    frames, errors = decode_frames(frame_bytes)
+
+    assert errors == []
+    [frame] = frames
+    assert (frame.device_id, frame.sequence, frame.timestamp, frame.interval, frame.channels) == ("tank-1", 7, START, 10, 1)
+    assert frame_readings(frame) == [
+        ("tank-1_V0", 1.25, "2023-11-14 22:13:20"),
+        ("tank-1_V0", 2.5, "2023-11-14 22:13:30"),
+        ("tank-1_V0", -0.75, "2023-11-14 22:13:40"),
+    ]
+
+
+def test_round_trip_multi_channel_with_missing_values():
+    samples = [[1.0, None, 3.0], [None, 2.25, 3.5]]
+    frames, errors = decode_frames(encode_frame("tank-2", 1, START, samples, interval=60))
+
+    assert errors == []
+    [frame] = frames
+    assert frame.channels == 3
+    assert list(frame.levels) == [100, MISSING, 300, MISSING, 225, 350]
+    assert frame_readings(frame) == [
+        ("tank-2_V0", 1.0, "2023-11-14 22:13:20"),
+        ("tank-2_V2", 3.0, "2023-11-14 22:13:20"),
+        ("tank-2_V1", 2.25, "2023-11-14 22:14:20"),
+        ("tank-2_V2", 3.5, "2023-11-14 22:14:20"),
+    ]
+
+
+def test_untimed_frame_ends_on_arrival():
+    [frame], _ = decode_frames(encode_frame("tank-3", 1, 0, [1.0, 2.0], interval=5))
+
+    readings = frame_readings(frame, received_at=START + 5)
+
+    assert [reading[2] for reading in readings] == ["2023-11-14 22:13:20", "2023-11-14 22:13:25"]
+
+
+def test_several_frames_in_one_body():
+    body = encode_frame("a", 1, START, [1.0]) + encode_frame("b", 1, START, [[2.0, 3.0]])
+
+    frames, errors = decode_frames(body)
+
+    assert errors == []
+    assert [(frame.device_id, frame.channels) for frame in frames] == [("a", 1), ("b", 2)]
+
+
+def test_encoder_rejects_levels_out_of_range():
+    with pytest.raises(ValueError):
+        encode_frame("tank", 1, START, [400.0], scale=100)
+
+
+def test_bad_crc_skips_only_that_frame():
+    bad = bytearray(encode_frame("a", 1, START, [1.0, 2.0]))
+    bad[-6] ^= 0xFF  # a level byte, so the checksum no longer matches
+    body = bytes(bad) + encode_frame("b", 1, START, [3.0])
+
+    frames, errors = decode_frames(body)
+
+    assert [frame.device_id for frame in frames] == ["b"]
+    assert errors == [{"index": 0, "device_id": "a", "sequence": 1, "error": "checksum mismatch"}]
+
+
+@pytest.mark.parametrize("keep", [4, 12, 25])
+def test_truncated_frame_stops_decoding(keep):
+    good = encode_frame("a", 1, START, [1.0])
+    body = good + encode_frame("b", 2, START, [1.0, 2.0])[:keep]
+
+    frames, errors = decode_frames(body)
+
+    assert [frame.device_id for frame in frames] == ["a"]
+    assert len(errors) == 1 and errors[0]["index"] == 1
+    assert errors[0]["error"].startswith("truncated frame")
+
+
+def test_unknown_version_is_rejected():
+    frame_bytes = bytearray(encode_frame("a", 1, START, [1.0]))
+    frame_bytes[2] = 2
+    body = bytes(frame_bytes[:-4]) + struct.pack("<I", zlib.crc32(bytes(frame_bytes[:-4])))
+
+    frames, errors = decode_frames(body)
+
+    assert frames == []
+    assert errors == [{"index": 0, "error": "unsupported frame version 2"}]
+
+
+def test_too_many_levels_per_request():
+    frames, errors = decode_frames(encode_frame("a", 1, START, [[1.0, 2.0]] * 3), max_levels=5)
+
+    assert frames == []
+    assert "too many samples" in errors[0]["error"]
+
+
+def test_endpoint_stores_frames(client):
+    body = encode_frame("bin-1", 1, START, [[1.5, None], [2.5, 0.5]], interval=30)
+
+    response = post(client, body)
+
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "success": True, "frames": 1, "duplicates": 0, "stored": 3, "alerts_created": 0, "errors": []
+    }
+    assert stored_levels("bin-1_V0") == [(1.5, "2023-11-14 22:13:20"), (2.5, "2023-11-14 22:13:50")]
+    assert stored_levels("bin-1_V1") == [(0.5, "2023-11-14 22:13:50")]
+
+
+def test_endpoint_skips_retransmitted_frames(client):
+    first = encode_frame("bin-2", 5, START, [1.0])
+    assert post(client, first).get_json()["stored"] == 1
+
+    # The same frame again, next to one that is new
+    response = post(client, first + encode_frame("bin-2", 6, START + 60, [2.0]))
+
+    assert response.get_json()["frames"] == 2
+    assert response.get_json()["duplicates"] == 1
+    assert response.get_json()["stored"] == 1
+    assert [level for level, _ in stored_levels("bin-2_V0")] == [1.0, 2.0]
+
+
+def test_endpoint_accepts_sequence_restart_with_newer_clock(client):
+    post(client, encode_frame("bin-3", 900, START, [1.0]))
+
+    response = post(client, encode_frame("bin-3", 1, START + 3600, [2.0]))
+
+    assert response.get_json()["duplicates"] == 0
+    assert len(stored_levels("bin-3_V0")) == 2
+
+
+def test_endpoint_accepts_untimed_device_that_lost_its_counter(client):
+    post(client, encode_frame("bin-8", 500, 0, [1.0]))
+
+    # A recent sequence number is still a retransmission
+    assert post(client, encode_frame("bin-8", 499, 0, [1.0])).get_json()["duplicates"] == 1
+    # Far behind the last frame: the device restarted from 0
+    response = post(client, encode_frame("bin-8", 0, 0, [2.0]))
+    assert response.get_json()["duplicates"] == 0
+    assert post(client, encode_frame("bin-8", 1, 0, [3.0])).get_json()["duplicates"] == 0
+    assert post(client, encode_frame("bin-8", 1, 0, [3.0])).get_json()["duplicates"] == 1
+    assert [level for level, _ in stored_levels("bin-8_V0")] == [1.0, 2.0, 3.0]
+
+
+def test_concurrent_retransmissions_store_once(backend, monkeypatch):
+    body = encode_frame("bin-4", 1, START, [1.0, 2.0, 3.0])
+    insert = backend.storage.insert
+
+    def slow_insert(conn, readings, alert_engine):
+        # Widen the window between the duplicate check and the commit
+        time.sleep(0.05)
+        return insert(conn, readings, alert_engine)
+
+    monkeypatch.setattr(backend.storage, "insert", slow_insert)
+    barrier = threading.Barrier(4)
+    results = []
+
+    def send():
+        with backend.app.test_client() as client:
+            barrier.wait()
+            results.append(post(client, body).get_json())
+
+    threads = [threading.Thread(target=send) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(result["duplicates"] for result in results) == [0, 1, 1, 1]
+    assert len(stored_levels("bin-4_V0")) == 3
+
+
+def test_endpoint_rejects_body_without_frames(client):
+    bad = bytearray(encode_frame("bin-5", 1, START, [1.0]))
+    bad[-1] ^= 0xFF
+
+    response = post(client, bytes(bad))
+
+    assert response.status_code == 400
+    assert response.get_json()["errors"][0]["error"] == "checksum mismatch"
+    assert post(client, b"").status_code == 400
+    assert stored_levels("bin-5_V0") == []
+
+
+def test_failed_write_records_no_sequence(backend, client, monkeypatch):
+    body = encode_frame("bin-6", 1, START, [1.0])
+
+    def fail(conn, readings, alert_engine):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(backend.storage, "insert", fail)
+    response = post(client, body)
+    monkeypatch.undo()
+
+    assert response.status_code == 500
+    # The retry is stored rather than taken for a retransmission
+    assert post(client, body).get_json()["stored"] == 1
+    assert len(stored_levels("bin-6_V0")) == 1
+
+
+def test_frames_bypass_write_behind_queue(backend, client, monkeypatch):
+    class StalledQueue:
+        def submit(self, readings):
+            raise AssertionError("binary frames must not wait in the write-behind queue")
+
+    monkeypatch.setattr(backend, "ingest_queue", StalledQueue())
+
+    response = post(client, encode_frame("bin-7", 1, START, [1.0, 2.0]))
+
+    # Stored and durable by the time the device hears back
+    assert response.get_json()["stored"] == 2
+    assert len(stored_levels("bin-7_V0")) == 2
@@ -0,0 +1,145 @@
+import time
+
+import pytest
+import requests
+
+from blynk_client import BlynkClient, BlynkError, parse_value, status_kind
+from metrics import BLYNK_ERRORS, BLYNK_ERROR_KINDS
+
+
+def make_client(fake, **options):
+    options.setdefault("timeout", 2)
+    options.setdefault("retries", 2)
+    options.setdefault("backoff", 0)
+    return BlynkClient(fake.url, **options)
+
+
+def test_parse_value():
+    assert parse_value("12.5") == 12.5
+    assert parse_value(["7"]) == 7.0
+    assert parse_value(3) == 3.0
+    assert parse_value(" on ") == "on"
+    assert parse_value(True) is True
+
+
+def test_requests_reuse_one_keep_alive_connection(fake_blynk):
+    client = make_client(fake_blynk)
+    try:
+        for _ in range(20):
+            client.get_pin("token", "V0")
+    finally:
+        client.close()
+    stats = fake_blynk.stats()
+    assert stats["requests_total"] == 20
+    assert stats["connections_total"] == 1
+
+
+def test_single_pin_is_parsed_as_a_number(fake_blynk):
+    client = make_client(fake_blynk)
+    try:
+        value = client.get_pin("token", "V0")
+    finally:
+        client.close()
+    assert isinstance(value, float)
+    assert 0 <= value <= 10000
+
+
+def test_multi_pin_batch_is_one_request(fake_blynk):
+    client = make_client(fake_blynk)
+    try:
+        values = client.get_pins("token", ["V9", " V0", "V1"])
+    finally:
+        client.close()
+    assert set(values) == {"V9", "V0", "V1"}
+    assert all(isinstance(value, float) for value in values.values())
+    assert abs(values["V9"] - time.time()) < 5
+    assert fake_blynk.stats()["requests_total"] == 1
+
+
+def test_503_is_retried_with_backoff(fake_blynk):
+    fake_blynk.fail_next(2)
+    client = make_client(fake_blynk, retries=3, backoff=0.1)
+    started = time.monotonic()
+    try:
+        value = client.get_pin("token", "V0")
+    finally:
+        client.close()
+    elapsed = time.monotonic() - started
+    assert isinstance(value, float)
+    assert fake_blynk.stats()["requests_total"] == 3
+    # urllib3 retries the first failure at once and waits backoff * 2 before the second
+    assert elapsed >= 0.2
+
+
+def test_503_after_retries_raises(fake_blynk):
+    fake_blynk.fail_next(10)
+    client = make_client(fake_blynk, retries=2)
+    try:
+        with pytest.raises(BlynkError) as raised:
+            client.get_pin("token", "V0")
+    finally:
+        client.close()
+    assert raised.value.status_code == 503
+    assert fake_blynk.stats()["requests_total"] == 3
+
+
+def test_timeout_is_retried_then_raised(fake_blynk):
+    fake_blynk.latency_ms = 500
+    client = make_client(fake_blynk, timeout=0.1, retries=1)
+    try:
+        with pytest.raises(requests.exceptions.Timeout):
+            client.get_pin("token", "V0")
+    finally:
+        client.close()
+    # Let the server finish the slow answers before counting them
+    time.sleep(0.6)
+    assert fake_blynk.stats()["requests_total"] == 2
+
+
+def test_invalid_token_is_not_retried(fake_blynk):
+    fake_blynk.tokens = {"good"}
+    client = make_client(fake_blynk, retries=3)
+    try:
+        with pytest.raises(BlynkError) as raised:
+            client.get_pins("bad", ["V0", "V1"])
+    finally:
+        client.close()
+    assert raised.value.status_code == 400
+    assert "Invalid token" in raised.value.details
+    assert fake_blynk.stats()["requests_total"] == 1
+
+
+def error_counts():
+    return {dict(labels)["kind"]: value for _, labels, value in BLYNK_ERRORS.collect()}
+
+
+def test_error_kinds_are_a_fixed_set(fake_blynk):
+    before = error_counts()
+    fake_blynk.tokens = {"good"}
+    client = make_client(fake_blynk, retries=0)
+    try:
+        with pytest.raises(BlynkError):
+            client.get_pins("bad", ["V0"])
+        fake_blynk.fail_next(1, status=503)
+        with pytest.raises(BlynkError):
+            client.get_pins("good", ["V0"])
+    finally:
+        client.close()
+
+    after = error_counts()
+    assert sorted(after) == sorted(BLYNK_ERROR_KINDS)
+    assert after["http_4xx"] - before["http_4xx"] == 1
+    assert after["http_5xx"] - before["http_5xx"] == 1
+    assert [status_kind(code) for code in (401, 429, 502, 302)] == ["http_4xx", "http_4xx", "http_5xx", "http_other"]
+
+
+def test_offline_device_reports_a_stale_heartbeat(fake_blynk):
+    fake_blynk.offline_tokens.add("sleepy")
+    client = make_client(fake_blynk)
+    try:
+        online = client.get_pin("token", "V9")
+        offline = client.get_pin("sleepy", "V9")
+    finally:
+        client.close()
+    assert time.time() - online < 5
+    assert time.time() - offline > 3000
@@ -0,0 +1,64 @@
+import itertools
+import json
+
+import pytest
+
+from database import get_db, get_read_db
+from export import export_cursor
+
+FILTERS = ("sensor_id", "area", "since", "until")
+VALUES = {"sensor_id": "exp-a1", "area": "export-area", "since": "2024-03-01 00:00:00", "until": "2024-03-02 00:00:00"}
+
+
+class ExplainConnection:
+    """Runs the export query under EXPLAIN QUERY PLAN"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params):
+        return self.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+
+
+@pytest.fixture(scope="module")
+def export_data(backend):
+    conn = get_db()
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO sensors(sensor_id, latitude, longitude, area) VALUES (?, 0, 0, ?)",
+            [("exp-a1", "export-area"), ("exp-a2", "export-area"), ("exp-b1", "elsewhere")]
+        )
+        conn.executemany(
+            "INSERT INTO readings(sensor_id, water_level, timestamp) VALUES (?, ?, ?)",
+            [
+                (sensor_id, float(minute), f"2024-03-01 10:{minute:02d}:00")
+                # Interleaved in time, stored sensor by sensor
+                for sensor_id in ("exp-a2", "exp-b1", "exp-a1")
+                for minute in range(0, 60, 7)
+            ]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("used", [
+    combination for size in range(len(FILTERS) + 1) for combination in itertools.combinations(FILTERS, size)
+])
+def test_export_never_sorts_in_a_temp_btree(backend, used):
+    conn = get_read_db()
+    try:
+        plan = [row[3] for row in export_cursor(ExplainConnection(conn), **{name: VALUES[name] for name in used})]
+    finally:
+        conn.close()
+
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+def test_area_export_is_oldest_first(client, export_data):
+    response = client.get("/api/readings/export?area=export-area")
+
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert {row["sensor_id"] for row in rows} == {"exp-a1", "exp-a2"}
+    assert len(rows) == 18
+    assert [row["timestamp"] for row in rows] == sorted(row["timestamp"] for row in rows)
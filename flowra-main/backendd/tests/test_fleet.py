@@ -0,0 +1,163 @@
+import random
+import threading
+import time
+
+import pytest
+
+from blynk_client import BlynkClient
+from fleet import FleetPoller
+
+
+def device(device_id, token=None, interval=1, pins=("V0", "V1"), heartbeat_pin="V9"):
+    return {
+        "device_id": device_id,
+        "token": token or device_id,
+        "pins": list(pins),
+        "heartbeat_pin": heartbeat_pin,
+        "interval_seconds": interval,
+        "value_divisor": 100
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.readings = []
+        self._lock = threading.Lock()
+
+    def __call__(self, readings):
+        with self._lock:
+            self.readings.extend(readings)
+
+
+@pytest.fixture
+def make_poller(fake_blynk):
+    pollers = []
+
+    def make(devices, max_workers=4, **options):
+        options.setdefault("jitter", 0)
+        client = BlynkClient(fake_blynk.url, timeout=2, retries=0, pool_size=max_workers)
+        poller = FleetPoller(client, lambda: devices, Recorder(), max_workers=max_workers, **options)
+        pollers.append((poller, client))
+        return poller
+
+    yield make
+    for poller, client in pollers:
+        poller.stop()
+        client.close()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def device_stats(poller, device_id):
+    """The device's stats entry, or None before the poller has loaded it"""
+    return next((entry for entry in poller.stats()["device_stats"] if entry["device_id"] == device_id), None)
+
+
+def device_stat(poller, device_id, key):
+    entry = device_stats(poller, device_id)
+    return entry[key] if entry is not None else None
+
+
+def test_concurrency_never_exceeds_the_pool(fake_blynk, make_poller):
+    fake_blynk.latency_ms = 100
+    devices = {f"d{index}": device(f"d{index}") for index in range(20)}
+    poller = make_poller(devices, max_workers=3)
+    poller.start()
+    observed = []
+    assert wait_for(lambda: observed.append(poller.stats()["in_flight"]) or poller.polls_total >= 30)
+    assert max(observed) <= 3
+    assert fake_blynk.stats()["max_in_flight"] <= 3
+    # The pool was actually used, not just one device at a time
+    assert fake_blynk.stats()["max_in_flight"] >= 2
+
+
+def test_first_polls_are_spread_over_the_interval(make_poller):
+    random.seed(7)
+    devices = {f"d{index}": device(f"d{index}", interval=100) for index in range(200)}
+    poller = make_poller(devices)
+    now = time.monotonic()
+    poller._apply_registry(devices)
+    delays = sorted(due - now for due, _, _ in poller._heap)
+    assert len(delays) == 200
+    assert delays[0] >= 0 and delays[-1] <= 100
+    # Roughly uniform: each quarter of the interval gets a share of the fleet
+    for quarter in range(4):
+        share = sum(1 for delay in delays if quarter * 25 <= delay < (quarter + 1) * 25)
+        assert 25 <= share <= 75
+
+
+def test_reschedule_jitter_stays_within_bounds(make_poller):
+    poller = make_poller({}, jitter=0.1)
+    delays = [poller._jittered(60) for _ in range(1000)]
+    assert all(54 <= delay <= 66 for delay in delays)
+    assert max(delays) - min(delays) > 6
+
+
+def test_offline_device_backs_off_and_recovers(fake_blynk, make_poller):
+    fake_blynk.offline_tokens.add("sleepy")
+    devices = {"sleepy": device("sleepy"), "healthy": device("healthy")}
+    poller = make_poller(devices, max_backoff=60)
+    poller.start()
+
+    assert wait_for(lambda: (device_stat(poller, "sleepy", "polls") or 0) >= 2)
+    sleepy = device_stats(poller, "sleepy")
+    assert sleepy["status"] == "offline"
+    assert sleepy["consecutive_failures"] == 2
+    assert sleepy["successes"] == 0
+    # Two failures at a 1 s interval: the next poll is 4 s away
+    assert 3 <= sleepy["next_poll_in_seconds"] <= 4
+    # The healthy device keeps its own 1 s schedule meanwhile
+    assert device_stats(poller, "healthy")["successes"] >= 2
+
+    fake_blynk.offline_tokens.clear()
+    assert wait_for(lambda: device_stat(poller, "sleepy", "status") == "online", timeout=8)
+    sleepy = device_stats(poller, "sleepy")
+    assert sleepy["consecutive_failures"] == 0
+    assert sleepy["last_success"] is not None
+    assert sleepy["next_poll_in_seconds"] <= 1
+
+
+def test_backoff_is_capped(fake_blynk, make_poller):
+    fake_blynk.tokens = {"healthy"}
+    poller = make_poller({"broken": device("broken", interval=1)}, max_backoff=2)
+    poller.start()
+    assert wait_for(lambda: (device_stat(poller, "broken", "polls") or 0) >= 3)
+    broken = device_stats(poller, "broken")
+    assert broken["status"] == "error"
+    assert "400" in broken["last_error"]
+    assert broken["next_poll_in_seconds"] <= 2
+    assert poller.errors_total >= 3
+
+
+def test_online_polls_store_readings(fake_blynk, make_poller):
+    poller = make_poller({"drain": device("drain")})
+    poller.start()
+    assert wait_for(lambda: len(poller._store_readings.readings) >= 2)
+    sensor_ids = {sensor_id for sensor_id, _, _ in poller._store_readings.readings}
+    assert sensor_ids == {"drain_V0", "drain_V1"}
+    assert all(0 <= level <= 100 for _, level, _ in poller._store_readings.readings)
+
+
+def test_fleet_status_endpoint_counters(fake_blynk, make_poller, backend, client, monkeypatch):
+    fake_blynk.tokens = {"healthy"}
+    poller = make_poller({"healthy": device("healthy"), "broken": device("broken")})
+    monkeypatch.setattr(backend, "fleet_poller", poller)
+    poller.start()
+    assert wait_for(lambda: [entry["polls"] >= 2 for entry in poller.stats()["device_stats"]] == [True, True])
+
+    fleet = client.get("/api/fleet/status").get_json()["fleet"]
+    assert fleet["running"] is True
+    assert fleet["devices"] == 2
+    assert fleet["by_status"] == {"online": 1, "error": 1}
+    assert fleet["polls_total"] >= 4
+    assert fleet["errors_total"] >= 2
+    assert fleet["polls_total"] == sum(entry["polls"] for entry in fleet["device_stats"])
+    broken = next(entry for entry in fleet["device_stats"] if entry["device_id"] == "broken")
+    assert broken["consecutive_failures"] == broken["polls"]
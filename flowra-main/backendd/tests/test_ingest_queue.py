@@ -0,0 +1,49 @@
+from ingest_queue import WriteBehindQueue
+
+
+class Store:
+    """write_batch that rejects any batch holding a negative level"""
+
+    def __init__(self):
+        self.readings = []
+        self.writes = 0
+
+    def __call__(self, readings):
+        self.writes += 1
+        if any(level < 0 for _, level, _ in readings):
+            raise ValueError("constraint failed")
+        self.readings.extend(readings)
+
+
+def readings(count, bad=()):
+    return [(f"q-{index}", -1.0 if index in bad else float(index), "2024-06-01 00:00:00") for index in range(count)]
+
+
+def test_failed_group_drops_only_the_bad_reading(capsys):
+    store = Store()
+    queue = WriteBehindQueue(store, group_size=64, flush_interval_ms=1000, max_retries=2)
+    try:
+        queue.submit(readings(64, bad={37}))
+        assert queue.flush(timeout=10)
+    finally:
+        queue.stop()
+
+    assert sorted(store.readings) == sorted(readings(64)[:37] + readings(64)[38:])
+    stats = queue.stats()
+    assert (stats["committed_total"], stats["failed_total"]) == (63, 1)
+    # Two tries of the group, then one per half on the way down to the reading
+    assert store.writes == 2 + 2 * 6
+    assert "Dropped reading ('q-37', -1.0, '2024-06-01 00:00:00')" in capsys.readouterr().out
+
+
+def test_group_that_commits_is_written_once():
+    store = Store()
+    queue = WriteBehindQueue(store, group_size=10, flush_interval_ms=1000)
+    try:
+        queue.submit(readings(10))
+        assert queue.flush(timeout=10)
+    finally:
+        queue.stop()
+
+    assert store.writes == 1
+    assert queue.stats()["batches_committed"] == 1
@@ -0,0 +1,62 @@
+import threading
+
+from metrics import Counter, Histogram, Registry
+
+
+def run_threads(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_counter_sums_every_thread():
+    counter = Counter("test_counter_total", "test", registry=Registry())
+
+    def work():
+        for _ in range(100):
+            counter.inc()
+
+    run_threads(work, 8)
+    counter.inc(5)
+
+    assert counter.collect() == [("test_counter_total", (), 805)]
+
+
+def test_ended_threads_do_not_accumulate_slots():
+    histogram = Histogram("test_seconds", "test", buckets=(1,), registry=Registry())
+    slots = histogram.labels()._slots
+
+    for _ in range(50):
+        run_threads(lambda: histogram.observe(0.5), 10)
+
+    # Folded when each thread ended, without waiting for a scrape
+    assert slots._live == {}
+    samples = {(name, labels): value for name, labels, value in histogram.collect()}
+    assert samples[("test_seconds_count", ())] == 500
+    assert samples[("test_seconds_bucket", (("le", "1"),))] == 500
+    assert samples[("test_seconds_sum", ())] == 250
+
+
+def test_live_thread_keeps_its_slot_until_it_ends():
+    counter = Counter("test_live_total", "test", registry=Registry())
+    slots = counter.labels()._slots
+    counted = threading.Event()
+    finish = threading.Event()
+
+    def work():
+        counter.inc(3)
+        counted.set()
+        finish.wait()
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    counted.wait()
+    assert len(slots._live) == 1
+    assert counter.collect()[0][2] == 3
+
+    finish.set()
+    thread.join()
+    assert slots._live == {}
+    assert counter.collect()[0][2] == 3
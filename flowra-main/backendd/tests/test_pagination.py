@@ -0,0 +1,66 @@
+import pytest
+
+from database import get_db, get_read_db
+from pagination import fetch_page
+
+
+class ExplainConnection:
+    """Runs the page query under EXPLAIN QUERY PLAN"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params):
+        return self.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+
+
+def store(*readings):
+    conn = get_db()
+    try:
+        conn.executemany("INSERT INTO readings(sensor_id, water_level, timestamp) VALUES (?, ?, ?)", readings)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def poll(client, **args):
+    return client.get("/api/readings", query_string={"sensor_id": "paged", "limit": 10, **args}).get_json()
+
+
+def test_polling_after_id_returns_backfilled_rows(backend, client):
+    store(("paged", 1.0, "2024-05-01 12:00:00"), ("paged", 2.0, "2024-05-01 12:01:00"))
+    first = poll(client, after_id=0)
+    assert [reading["water_level"] for reading in first["readings"]] == [1.0, 2.0]
+    cursor = poll(client, order="asc")["next_cursor"]
+
+    # A device uploads a reading it buffered while offline
+    store(("paged", 3.0, "2024-05-01 11:00:00"))
+
+    polled = poll(client, after_id=first["next_after_id"])
+    assert [reading["water_level"] for reading in polled["readings"]] == [3.0]
+    assert poll(client, after_id=polled["next_after_id"]) == {
+        "readings": [], "next_cursor": None, "next_after_id": polled["next_after_id"]
+    }
+    # A timestamp cursor has already moved past it
+    assert poll(client, order="asc", cursor=cursor)["readings"] == []
+
+
+def test_after_id_rejects_a_cursor(client):
+    cursor = poll(client, order="asc")["next_cursor"]
+
+    assert client.get(f"/api/readings?after_id=1&cursor={cursor}").status_code == 400
+
+
+@pytest.mark.parametrize("filters", [
+    {}, {"sensor_id": "paged"}, {"since": "2024-05-01 00:00:00", "until": "2024-05-02 00:00:00"}
+])
+def test_after_id_walks_the_id_range(backend, filters):
+    conn = get_read_db()
+    try:
+        plan, _ = fetch_page(ExplainConnection(conn), "readings", 10, after_id=100, **filters)
+    finally:
+        conn.close()
+
+    details = [row[3] for row in plan]
+    assert not any("TEMP B-TREE" in detail for detail in details), details
+    assert any("rowid>?" in detail.replace(" ", "") for detail in details), details
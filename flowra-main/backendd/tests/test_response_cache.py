@@ -0,0 +1,17 @@
+import manage
+
+
+def sensor_ids(client):
+    return {sensor["sensor_id"] for sensor in client.get("/api/sensors").get_json()["sensors"]}
+
+
+def test_cli_sensor_import_reaches_a_single_worker_server(client, tmp_path):
+    before = sensor_ids(client)
+    assert "cli-imported" not in before
+    assert sensor_ids(client) == before  # served from the cache
+
+    path = tmp_path / "drains.csv"
+    path.write_text("sensor_id,latitude,longitude,area\ncli-imported,-33.9,151.2,cli-area\n")
+    assert manage.import_sensor_file(str(path)) == 0
+
+    assert "cli-imported" in sensor_ids(client)
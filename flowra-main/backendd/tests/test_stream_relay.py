@@ -0,0 +1,166 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from database import data_version
+from events import CommitRelay, EventHub
+
+
+class Feed:
+    def __init__(self):
+        self.rows = []
+        self.fetches = 0
+
+    def add(self, *ids):
+        self.rows.extend({"id": row_id} for row_id in ids)
+
+    def last_id(self):
+        return self.rows[-1]["id"] if self.rows else 0
+
+    def fetch(self, after_id, limit):
+        self.fetches += 1
+        return [row for row in self.rows if row["id"] > after_id][:limit]
+
+
+def published(subscriber):
+    events = []
+    while True:
+        event = subscriber.get(timeout=0)
+        if event is None:
+            return events
+        events.append((event[1], json.loads(event[2])))
+
+
+def test_relay_publishes_only_rows_other_processes_committed():
+    hub = EventHub()
+    feed = Feed()
+    feed.add(1, 2)
+    version = [0]
+    relay = CommitRelay(hub, lambda: version[0], {"readings": (feed.last_id, feed.fetch)}, interval=3600)
+    relay.start()
+    subscriber, _ = hub.subscribe()
+    try:
+        # Rows from before the start are not replayed
+        relay.poll()
+        assert published(subscriber) == []
+
+        # Another process commits 3-5; this one commits 6 and publishes it itself
+        feed.add(3, 4, 5)
+        relay.commit(lambda: feed.add(6), readings=[6])
+        feed.add(7)
+        version[0] += 1
+        relay.poll()
+
+        assert published(subscriber) == [
+            ("readings", {"count": 4, "readings": [{"id": 3}, {"id": 4}, {"id": 5}, {"id": 7}]})
+        ]
+        assert relay.stats()["cursors"] == {"readings": 7}
+
+        # Nothing is read again until the version moves
+        feed.add(8)
+        relay.poll()
+        assert published(subscriber) == []
+    finally:
+        relay.stop()
+
+
+def test_relay_far_behind_skips_to_the_newest_rows():
+    hub = EventHub()
+    feed = Feed()
+    version = [0]
+    relay = CommitRelay(hub, lambda: version[0], {"alerts": (feed.last_id, feed.fetch)},
+                        interval=3600, max_rows_per_event=2)
+    relay.start()
+    subscriber, _ = hub.subscribe()
+    try:
+        feed.add(*range(1, 10001))
+        relay.commit(lambda: None, alerts=[5000])
+        version[0] += 1
+        relay.poll()
+
+        # One read of the newest rows, not a walk over all 10000
+        assert feed.fetches == 1
+        assert published(subscriber) == [("alerts", {"count": 9999, "alerts": [{"id": 9999}, {"id": 10000}]})]
+        assert relay.stats()["skipped_total"] == 9997
+    finally:
+        relay.stop()
+
+
+def test_commits_do_not_wait_for_a_relay_read():
+    hub = EventHub()
+    feed = Feed()
+    version = [0]
+    reading = threading.Event()
+    release = threading.Event()
+
+    def slow_fetch(after_id, limit):
+        reading.set()
+        release.wait(5)
+        return feed.fetch(after_id, limit)
+
+    relay = CommitRelay(hub, lambda: version[0], {"readings": (feed.last_id, slow_fetch)}, interval=3600)
+    relay.start()
+    try:
+        feed.add(1)
+        version[0] += 1
+        poller = threading.Thread(target=relay.poll)
+        poller.start()
+        assert reading.wait(5)
+
+        started = time.monotonic()
+        relay.commit(lambda: feed.add(2), readings=[2])
+        assert time.monotonic() - started < 1
+
+        release.set()
+        poller.join()
+    finally:
+        release.set()
+        relay.stop()
+
+
+@pytest.fixture
+def relay(backend, monkeypatch):
+    """The app's relay, started but polled by hand"""
+    relay = CommitRelay(
+        backend.event_hub,
+        data_version,
+        {
+            "readings": backend.relay_feed(backend.storage.last_reading_id, backend.storage.readings_after, alert=None),
+            "alerts": backend.relay_feed(backend.storage.last_alert_id, backend.storage.alerts_after)
+        },
+        interval=3600
+    )
+    monkeypatch.setattr(backend, "stream_relay", relay)
+    relay.start()
+    yield relay
+    relay.stop()
+
+
+def test_readings_from_another_worker_reach_this_workers_stream(backend, client, relay):
+    subscriber, _ = backend.event_hub.subscribe()
+    try:
+        # Stored by this worker: published once, with its alert flag
+        client.post("/api/sensor_data", json={"sensor_id": "relay-local", "water_level": 12.5})
+        # Stored by another process
+        other = sqlite3.connect(os.environ["DATABASE_PATH"])
+        with other:
+            other.execute(
+                "INSERT INTO readings(sensor_id, water_level, timestamp) VALUES ('relay-remote', 33.0, '2024-01-01 00:00:00')"
+            )
+        other.close()
+
+        relay.poll()
+        events = published(subscriber)
+    finally:
+        backend.event_hub.unsubscribe(subscriber)
+
+    readings = [
+        (reading["sensor_id"], reading["alert"])
+        for event_type, data in events if event_type == "readings"
+        for reading in data["readings"]
+    ]
+    assert readings == [("relay-local", False), ("relay-remote", None)]